@@ -0,0 +1,61 @@
+"""
+マイクロバッチのスループット計測。
+同じモデル・サイズのジョブをバッチサイズ 1, 2, 4, 8 でまとめて生成し、images/s を比較する。
+
+    python -m benchmarks.bench_batching [--images 16] [--size 64] [--json out.json]
+"""
+if __name__ == "__main__":
+    import sys,os
+    sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from pixelart_mcp.image_generator import generate_images
+from pixelart_mcp.pipeline_cache import PipelineCache
+from benchmarks.tiny_pipeline import register_tiny_model
+
+BATCH_SIZES = (1, 2, 4, 8)
+
+
+def run(images: int, size: int, steps: int) -> list[dict[str, float]]:
+    results: list[dict[str, float]] = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        register_tiny_model("bench", os.path.join(work_dir, "model"), num_inference_steps=steps)
+        cache = PipelineCache()
+        # ロード時間を計測から除外する
+        generate_images(["warmup"], [os.path.join(work_dir, "warmup.png")], model_id_key="bench", size=(size, size), pipeline_cache=cache)
+        for batch_size in BATCH_SIZES:
+            prompts = [f"sprite number {i}" for i in range(images)]
+            outputs = [os.path.join(work_dir, f"b{batch_size}_{i}.png") for i in range(images)]
+            t0 = time.perf_counter()
+            for i in range(0, images, batch_size):
+                errors = generate_images(prompts[i:i + batch_size], outputs[i:i + batch_size], model_id_key="bench", size=(size, size), pipeline_cache=cache)
+                assert not any(errors), errors
+            elapsed = time.perf_counter() - t0
+            results.append({"batch_size": batch_size, "images": images, "seconds": elapsed, "images_per_sec": images / elapsed})
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="マイクロバッチのスループット計測")
+    parser.add_argument("--images", type=int, default=16, help="バッチサイズごとに生成する枚数")
+    parser.add_argument("--size", type=int, default=64, help="生成サイズ（正方形）")
+    parser.add_argument("--steps", type=int, default=4, help="推論ステップ数")
+    parser.add_argument("--json", type=str, default=None, help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    results = run(args.images, args.size, args.steps)
+    print(f"{'batch':>5} {'seconds':>8} {'images/s':>9}")
+    for r in results:
+        print(f"{r['batch_size']:>5} {r['seconds']:>8.3f} {r['images_per_sec']:>9.2f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+複数クライアント同時接続時のMCPサーバーの応答性の計測。
+streamable-httpで起動したサーバーに、クライアントごとにデバッグ用ジョブを投入して wait_for_job_tool で待たせたまま、
+各クライアントから list_jobs_tool を繰り返し呼び、その応答時間を測る。
+待ちやファイルI/Oでイベントループが止まると、list_jobs_tool のレイテンシがクライアント数とともに伸びる。
+
+    python -m benchmarks.bench_concurrent_clients [--clients 1 4 16] [--duration 5] [--json out.json]
+"""
+if __name__ == "__main__":
+    import sys,os
+    sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any
+
+from mcp import ClientSession
+from mcp.client.streamable_http import streamablehttp_client
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(home: str, port: int, timeout: float = 60.0) -> subprocess.Popen[bytes]:
+    """
+    streamable-httpでMCPサーバーを起動し、ポートが開くまで待つ
+    """
+    env = dict(os.environ, HOME=home, PYTHONPATH=ROOT)
+    log_file = os.path.join(home, "server.log")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "pixelart_mcp.image_mcp", "--transport", "streamable-http", "--port", str(port), "--log-file", log_file],
+        env=env, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"サーバーが起動できませんでした: {log_file}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("サーバーの起動待ちがタイムアウトしました")
+
+
+async def _client(url: str, client_id: int, duration: float) -> tuple[list[float], float | None]:
+    """
+    1クライアント分の負荷。ジョブの完了を待ちながらlist_jobs_toolを呼び続ける
+    :return: (list_jobs_toolの応答時間のリスト, wait_for_job_toolの応答時間)
+    """
+    async with streamablehttp_client(url) as (read, write, _):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            # seedを変えて、同じ条件の要求としてまとめられないようにする
+            submitted = await session.call_tool("generate_pixelart_tool", {"prompt": "debug", "pixel_art_mode": 32, "seed": client_id})
+            job_id = submitted.structuredContent["job_id"]["job_id"]
+
+            async def wait() -> float:
+                t0 = time.perf_counter()
+                await session.call_tool("wait_for_job_tool", {"job_id": job_id, "timeout": duration})
+                return time.perf_counter() - t0
+
+            waiter = asyncio.create_task(wait())
+            latencies: list[float] = []
+            deadline = time.perf_counter() + duration
+            while time.perf_counter() < deadline:
+                t0 = time.perf_counter()
+                await session.call_tool("list_jobs_tool", {"limit": 20})
+                latencies.append(time.perf_counter() - t0)
+            wait_seconds = await waiter
+            await session.call_tool("cancel_job_tool", {"job_id": job_id})
+            return latencies, wait_seconds
+
+
+async def run_clients(url: str, clients: int, duration: float) -> dict[str, Any]:
+    results = await asyncio.gather(*(_client(url, i, duration) for i in range(clients)))
+    latencies = sorted(latency for client_latencies, _ in results for latency in client_latencies)
+    waits = [wait for _, wait in results if wait is not None]
+    return {
+        "clients": clients,
+        "requests": len(latencies),
+        "rps": len(latencies) / duration,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000 if len(latencies) >= 20 else max(latencies) * 1000,
+        "max_ms": latencies[-1] * 1000,
+        "max_wait_s": max(waits) if waits else None,
+    }
+
+
+def run(clients_list: list[int], duration: float) -> list[dict[str, Any]]:
+    results: list[dict[str, Any]] = []
+    # 既存のジョブディレクトリを使わないよう、HOMEを一時ディレクトリにする
+    with tempfile.TemporaryDirectory() as home:
+        port = _free_port()
+        process = start_server(home, port)
+        try:
+            url = f"http://127.0.0.1:{port}/mcp"
+            for clients in clients_list:
+                results.append(asyncio.run(run_clients(url, clients, duration)))
+        finally:
+            process.terminate()
+            process.wait(10)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="複数クライアント同時接続時のMCPサーバーの応答性の計測")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16], help="同時接続するクライアント数")
+    parser.add_argument("--duration", type=float, default=5.0, help="1条件あたりの計測秒数")
+    parser.add_argument("--json", type=str, default=None, help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    results = run(args.clients, args.duration)
+    print(f"{'clients':>7} {'requests':>8} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'wait s':>7}")
+    for r in results:
+        wait = f"{r['max_wait_s']:>7.2f}" if r["max_wait_s"] is not None else f"{'-':>7}"
+        print(f"{r['clients']:>7} {r['requests']:>8} {r['rps']:>8.1f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['max_ms']:>8.2f} {wait}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+CPU向けの速度向上設定（ModelInfo.performance）の効果の計測。
+モデルキーごとに、以下の設定でパイプラインを読み込み直して1ステップあたりの時間とデコード時間を測り、基準（float32・設定なし）との速度比を出す。
+  legacy         : ModelInfo.dtypeをそのままCPUで使う（以前の動作。dtypeがfloat32のモデルでは省略）
+  baseline       : float32・設定なし
+  channels_last  : UNet/VAEをchannels_lastにする
+  bfloat16       : CPUでbfloat16を使う（CPUが対応している場合）
+  slicing        : アテンションを分割して計算する
+  compile        : UNetをtorch.compileする（初回のコンパイル時間は別に記録する）
+既定では極小パイプライン（ネットワーク不要）を測る。--models に s1 s2 p1 などを指定すると実モデルを測る（ダウンロード済みであること）。
+
+    python -m benchmarks.bench_cpu_performance [--models tiny-sd tiny-lcm] [--variants ...] [--size 128] [--repeat 3] [--json out.json]
+"""
+if __name__ == "__main__":
+    import sys,os
+    sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import dataclasses
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Any
+
+import torch
+
+from benchmarks.tiny_pipeline import register_tiny_model
+from pixelart_mcp.image_generator import generate_images
+from pixelart_mcp.models import MODEL_IDS, ModelInfo, PerformanceOptions
+from pixelart_mcp.pipeline_cache import PipelineCache
+
+VARIANTS: dict[str, PerformanceOptions] = {
+    "baseline": PerformanceOptions(),
+    "channels_last": PerformanceOptions(channels_last=True),
+    "bfloat16": PerformanceOptions(cpu_dtype="bfloat16"),
+    "slicing": PerformanceOptions(attention_slicing="auto"),
+    "compile": PerformanceOptions(compile_unet=True),
+}
+
+
+def variant_model(model_key: str, variant: str) -> ModelInfo | None:
+    """
+    モデルキーの設定を変えたModelInfoを作る。測る意味のない組み合わせはNone
+    """
+    info = MODEL_IDS[model_key]
+    if variant == "legacy":
+        if info.dtype == "float32":
+            return None
+        return dataclasses.replace(info, performance=PerformanceOptions(cpu_dtype=info.dtype))
+    if variant == "bfloat16" and not torch.ops.mkldnn._is_mkldnn_bf16_supported():
+        return None
+    return dataclasses.replace(info, performance=VARIANTS[variant])
+
+
+def bench_variant(model_key: str, variant: str, info: ModelInfo, size: int, repeat: int, work_dir: str) -> dict[str, Any]:
+    key = f"{model_key}:{variant}"
+    MODEL_IDS[key] = info
+    try:
+        cache = PipelineCache()
+        output_file = os.path.join(work_dir, f"{model_key}_{variant}.png")
+        samples: list[dict[str, Any]] = []
+        # 1回目はロード（とtorch.compileのコンパイル）を含むので別に記録する
+        for i in range(repeat + 1):
+            timings: dict[str, Any] = {}
+            t0 = time.perf_counter()
+            errors = generate_images(["a knight"], [output_file], model_id_key=key, size=(size, size),
+                                     pipeline_cache=cache, seeds=[i], timings=timings)
+            if errors[0] is not None:
+                raise RuntimeError(errors[0])
+            timings["total"] = time.perf_counter() - t0
+            samples.append(timings)
+    finally:
+        MODEL_IDS.pop(key, None)
+    warm = samples[1:]
+    return {
+        "model": model_key,
+        "variant": variant,
+        "size": size,
+        "first_run_s": samples[0]["total"],
+        "step_ms": statistics.median(t for s in warm for t in s["step_seconds"]) * 1000,
+        "decode_ms": statistics.median(s["decode"] for s in warm) * 1000,
+        "total_ms": statistics.median(s["total"] for s in warm) * 1000,
+    }
+
+
+def run(models: list[str], variants: list[str], size: int, repeat: int, width: int) -> list[dict[str, Any]]:
+    results: list[dict[str, Any]] = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for model_key in models:
+            if model_key.startswith("tiny-") and model_key not in MODEL_IDS:
+                info = register_tiny_model(model_key, os.path.join(work_dir, model_key), kind=model_key.removeprefix("tiny-"), width=width)  # type: ignore[arg-type]
+                # s2と同じくfloat16を指定したモデルとして、以前の動作（CPUでもfloat16）と比べる
+                MODEL_IDS[model_key] = dataclasses.replace(info, dtype="float16")
+            model_results: list[dict[str, Any]] = []
+            for variant in variants:
+                info = variant_model(model_key, variant)
+                if info is None:
+                    continue
+                model_results.append(bench_variant(model_key, variant, info, size, repeat, work_dir))
+            base = next((r for r in model_results if r["variant"] == "baseline"), None)
+            for r in model_results:
+                r["speedup"] = base["total_ms"] / r["total_ms"] if base else None
+            results += model_results
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="CPU向けの速度向上設定の効果の計測")
+    parser.add_argument("--models", nargs="+", default=["tiny-sd", "tiny-lcm"], help="計測するモデルキー（tiny-sd / tiny-lcm は極小パイプライン）")
+    parser.add_argument("--variants", nargs="+", choices=["legacy", *VARIANTS], default=["legacy", *VARIANTS], help="計測する設定")
+    parser.add_argument("--size", type=int, default=128, help="生成サイズ（正方形）")
+    parser.add_argument("--width", type=int, default=32, help="極小パイプラインの基本チャネル数")
+    parser.add_argument("--repeat", type=int, default=3, help="試行回数")
+    parser.add_argument("--json", type=str, default=None, help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    results = run(args.models, args.variants, args.size, args.repeat, args.width)
+    print(f"{'model':<10} {'variant':<14} {'first s':>8} {'step ms':>8} {'decode ms':>9} {'total ms':>9} {'speedup':>7}")
+    for r in results:
+        speedup = f"{r['speedup']:>7.2f}" if r["speedup"] is not None else f"{'-':>7}"
+        print(f"{r['model']:<10} {r['variant']:<14} {r['first_run_s']:>8.2f} {r['step_ms']:>8.2f} {r['decode_ms']:>9.2f} {r['total_ms']:>9.2f} {speedup}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
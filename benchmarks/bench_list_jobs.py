@@ -0,0 +1,99 @@
+"""
+ジョブ一覧APIの応答サイズとレイテンシの計測。
+10k / 100k 件のジョブを登録したインデックスに対して、全件返却(list_jobs)と
+要約1ページ(query_jobs / list_jobs_tool)を比較する。
+
+    python -m benchmarks.bench_list_jobs [--counts 10000 100000] [--json out.json]
+"""
+if __name__ == "__main__":
+    import sys,os
+    sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Any, Callable
+
+from pydantic import TypeAdapter
+
+from pixelart_mcp.image_jobs import ImageJobInfo, ImageJobSummary, JobListPage, JobStatus
+from pixelart_mcp.job_index import JobIndex
+
+STATUSES = [JobStatus.finished, JobStatus.finished, JobStatus.failed, JobStatus.canceled, JobStatus.running]
+
+
+def populate(index: JobIndex, count: int) -> None:
+    items: list[dict[str, Any]] = []
+    for i in range(count):
+        job = ImageJobInfo.new_image(f"pixel sprite of a ninja cat number {i}, game asset, white background", 512, 512)
+        job.job_id = f"{i:08d}_{job.job_id}"
+        job.start_time = f"2025-{1 + i % 12:02d}-{1 + i % 28:02d}T{i % 24:02d}:{i % 60:02d}:{(i // 60) % 60:02d}+09:00"
+        job.status = STATUSES[i % len(STATUSES)]
+        items.append(job.model_dump(mode="json"))
+        if len(items) >= 10000:
+            index.upsert_many(items)
+            items = []
+    if items:
+        index.upsert_many(items)
+
+
+def measure(fn: Callable[[], bytes], repeat: int) -> tuple[float, int]:
+    best = float("inf")
+    size = 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        payload = fn()
+        best = min(best, time.perf_counter() - t0)
+        size = len(payload)
+    return best, size
+
+
+def run(counts: list[int], repeat: int) -> list[dict[str, Any]]:
+    full_adapter = TypeAdapter(list[ImageJobInfo])
+    results: list[dict[str, Any]] = []
+    for count in counts:
+        with tempfile.TemporaryDirectory() as work_dir:
+            index = JobIndex(os.path.join(work_dir, JobIndex.FILE_NAME))
+            populate(index, count)
+
+            def page(**kwargs: Any) -> Callable[[], bytes]:
+                def fn() -> bytes:
+                    rows, next_cursor = index.query(limit=20, **kwargs)
+                    return JobListPage(jobs=[ImageJobSummary.from_row(row) for row in rows], next_cursor=next_cursor).model_dump_json().encode()
+                return fn
+
+            cases: dict[str, Callable[[], bytes]] = {
+                "full_list": lambda: full_adapter.dump_json([ImageJobInfo.model_validate_json(d) for d in index.list_json()]),
+                "summary_page": page(),
+                "summary_page_status": page(statuses=["failed"]),
+                "summary_page_prompt": page(prompt_contains="number 4242"),
+            }
+            _, cursor = index.query(limit=count // 2)
+            cases["summary_page_deep_cursor"] = page(cursor=cursor)
+            for name, fn in cases.items():
+                seconds, size = measure(fn, repeat)
+                results.append({"jobs": count, "case": name, "seconds": seconds, "bytes": size})
+            index.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ジョブ一覧APIの応答サイズとレイテンシの計測")
+    parser.add_argument("--counts", type=int, nargs="+", default=[10000, 100000], help="登録するジョブ数")
+    parser.add_argument("--repeat", type=int, default=3, help="各ケースの試行回数（最良値を採用）")
+    parser.add_argument("--json", type=str, default=None, help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    results = run(args.counts, args.repeat)
+    print(f"{'jobs':>7} {'case':<26} {'ms':>9} {'bytes':>11}")
+    for r in results:
+        print(f"{r['jobs']:>7} {r['case']:<26} {r['seconds'] * 1000:>9.2f} {r['bytes']:>11}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
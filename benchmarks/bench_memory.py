@@ -0,0 +1,141 @@
+"""
+大きな画像の生成での省メモリ設定（ModelInfo.performanceのVAEの分割・タイル化とUNetの領域分け）の効果の計測。
+生成サイズごとに、以下の設定で生成して、生成中の最大常駐メモリの増分（モデルのロード後からの増分）と所要時間を出す。
+解放したメモリの再利用で後の計測ほど小さく出ないよう、1件ずつ別のプロセスで測る。
+  plain   : 省メモリ設定なし（VAEの分割・タイル化もUNetの領域分けもしない）
+  memory  : 既定の省メモリ設定（生成サイズに応じてVAEのタイル化・UNetの領域分けをする）
+実モデルでは memory_budget.plan_memory の見積もり（モデルの重みと実行環境を含む）も出す。
+最大常駐メモリは /proc/self/clear_refs で計測ごとに戻すのでLinuxのみ。
+既定では極小パイプライン（ネットワーク不要。VAEの縮小率はSD1.5と同じ1/8）を測る。--models に s1 などを指定すると実モデルを測る（ダウンロード済みであること）。
+
+    python -m benchmarks.bench_memory [--models tiny-sd] [--sizes 512 1024 1536] [--batch 1] [--json out.json]
+"""
+if __name__ == "__main__":
+    import sys,os
+    sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import dataclasses
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any
+
+from benchmarks.tiny_pipeline import register_tiny_model
+from pixelart_mcp.image_generator import generate_images
+from pixelart_mcp.memory_budget import plan_memory
+from pixelart_mcp.models import MODEL_IDS, ModelInfo
+from pixelart_mcp.pipeline_cache import PipelineCache
+
+MODES = ("plain", "memory")
+
+
+def _high_water_mark() -> int:
+    with open("/proc/self/status", encoding="utf-8") as f:
+        return int(re.search(r"VmHWM:\s+(\d+)", f.read()).group(1)) * 1024  # type: ignore[union-attr]
+
+
+def _reset_high_water_mark() -> None:
+    with open("/proc/self/clear_refs", "w", encoding="utf-8") as f:
+        f.write("5")
+
+
+def mode_model(info: ModelInfo, mode: str) -> ModelInfo:
+    if mode == "plain":
+        return dataclasses.replace(info, performance=dataclasses.replace(
+            info.performance, vae_slicing=False, vae_tiling_pixels=None, unet_tiling_threshold=None))
+    return info
+
+
+def bench_size(model_key: str, info: ModelInfo, mode: str, size: int, batch: int, work_dir: str) -> dict[str, Any]:
+    cache = PipelineCache()
+    MODEL_IDS[model_key] = mode_model(info, mode)
+    try:
+        output_files = [os.path.join(work_dir, f"{model_key}_{mode}_{size}_{i}.png") for i in range(batch)]
+        # ロードは計測に含めない
+        generate_images(["warm up"], output_files[:1], model_id_key=model_key, size=(64, 64), pipeline_cache=cache, seeds=[0])
+        _reset_high_water_mark()
+        base = _high_water_mark()
+        t0 = time.perf_counter()
+        errors = generate_images([f"a castle {i}" for i in range(batch)], output_files, model_id_key=model_key, size=(size, size),
+                                 pipeline_cache=cache, seeds=list(range(batch)))
+        seconds = time.perf_counter() - t0
+        if any(errors):
+            raise RuntimeError(errors)
+        peak = _high_water_mark() - base
+    finally:
+        MODEL_IDS[model_key] = info
+    plan = plan_memory(mode_model(info, mode), size, size, batch)
+    return {
+        "model": model_key,
+        "mode": mode,
+        "size": size,
+        "batch": batch,
+        "vae_tiling": plan.vae_tiling,
+        "unet_tile": plan.unet_tile,
+        "peak_delta_mb": peak / (1 << 20),
+        # 見積もりの係数はSD1.5のものなので、極小パイプラインには出さない
+        "estimate_mb": None if model_key.startswith("tiny-") else plan.peak_bytes / (1 << 20),
+        "seconds": seconds,
+    }
+
+
+def _register(model_key: str, work_dir: str, steps: int, width: int) -> ModelInfo:
+    if model_key.startswith("tiny-") and model_key not in MODEL_IDS:
+        # 保存済みなら読み込むだけ
+        register_tiny_model(model_key, os.path.join(work_dir, model_key), kind="sd", num_inference_steps=steps, width=width, vae_blocks=4)
+    return MODEL_IDS[model_key]
+
+
+def run(models: list[str], sizes: list[int], modes: list[str], batch: int, steps: int, width: int) -> list[dict[str, Any]]:
+    results: list[dict[str, Any]] = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for model_key in models:
+            _register(model_key, work_dir, steps, width)
+            for size in sizes:
+                for mode in modes:
+                    case = {"model": model_key, "mode": mode, "size": size, "batch": batch, "steps": steps, "width": width, "work_dir": work_dir}
+                    completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--case", json.dumps(case)],
+                                               capture_output=True, text=True, check=True)
+                    results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    return results
+
+
+def run_case(case: dict[str, Any]) -> dict[str, Any]:
+    info = _register(case["model"], case["work_dir"], case["steps"], case["width"])
+    return bench_size(case["model"], info, case["mode"], case["size"], case["batch"], case["work_dir"])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="大きな画像の生成での省メモリ設定の効果の計測")
+    parser.add_argument("--models", nargs="+", default=["tiny-sd"], help="計測するモデルキー（tiny-sd は極小パイプライン）")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[512, 1024, 1536], help="生成サイズ（正方形）")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES), help="計測する設定")
+    parser.add_argument("--batch", type=int, default=1, help="1回に生成する枚数")
+    parser.add_argument("--steps", type=int, default=2, help="極小パイプラインの推論ステップ数")
+    parser.add_argument("--width", type=int, default=8, help="極小パイプラインの基本チャネル数")
+    parser.add_argument("--json", type=str, default=None, help="結果をJSONで保存するパス")
+    parser.add_argument("--case", type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.case:
+        # 1件分の計測（runが別のプロセスとして呼び出す）
+        print(json.dumps(run_case(json.loads(args.case))))
+        return
+
+    results = run(args.models, args.sizes, args.modes, args.batch, args.steps, args.width)
+    print(f"{'model':<10} {'mode':<7} {'size':>5} {'tiling':<12} {'peak MB':>8} {'est MB':>8} {'seconds':>8}")
+    for r in results:
+        tiling = ("vae" if r["vae_tiling"] else "") + (f"+unet{r['unet_tile']}" if r["unet_tile"] else "")
+        estimate = f"{r['estimate_mb']:>8.0f}" if r["estimate_mb"] is not None else f"{'-':>8}"
+        print(f"{r['model']:<10} {r['mode']:<7} {r['size']:>5} {tiling or '-':<12} {r['peak_delta_mb']:>8.0f} {estimate} {r['seconds']:>8.2f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+ピクセルアート後処理の計測。
+512x512のバッチを 32/48/64/128 に縮小し、PILのNEAREST縮小（従来の処理）、PILの減色+NEAREST、
+NumPyエンジン（block / majority、減色あり）の処理時間を比較する。
+
+    python -m benchmarks.bench_pixel_engine [--batch 8] [--json out.json]
+"""
+if __name__ == "__main__":
+    import sys,os
+    sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import time
+from typing import Any, Callable
+
+import numpy as np
+from PIL import Image
+
+from pixelart_mcp.pixel_engine import PixelArtOptions, pixelate_batch
+
+SIZES = (32, 48, 64, 128)
+
+
+def make_images(batch: int, size: int = 512) -> np.ndarray:
+    # 滑らかなグラデーションにノイズを重ねた、生成画像に近い統計の画像
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    images = np.empty((batch, size, size, 3), dtype=np.uint8)
+    for i in range(batch):
+        base = np.stack([np.sin(x * (3 + i)) , np.cos(y * (2 + i)), x * y], axis=-1) * 127 + 128
+        images[i] = np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+    return images
+
+
+def timeit(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def run(batch: int, colors: int, repeat: int) -> list[dict[str, Any]]:
+    arrays = make_images(batch)
+    pil_images = [Image.fromarray(a) for a in arrays]
+    results: list[dict[str, Any]] = []
+    for size in SIZES:
+        cases: dict[str, Callable[[], Any]] = {
+            "pil_nearest": lambda: [im.resize((size, size), resample=Image.NEAREST) for im in pil_images],
+            "pil_quantize_nearest": lambda: [im.quantize(colors).convert("RGB").resize((size, size), resample=Image.NEAREST) for im in pil_images],
+            "engine_block": lambda: pixelate_batch(arrays, size, PixelArtOptions(mode="block", colors=colors)),
+            "engine_block_dither": lambda: pixelate_batch(arrays, size, PixelArtOptions(mode="block", colors=colors, dither=True)),
+            "engine_majority": lambda: pixelate_batch(arrays, size, PixelArtOptions(mode="majority", colors=colors)),
+        }
+        for name, fn in cases.items():
+            seconds = timeit(fn, repeat)
+            results.append({"size": size, "case": name, "batch": batch, "seconds": seconds, "ms_per_image": seconds * 1000 / batch})
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ピクセルアート後処理の計測")
+    parser.add_argument("--batch", type=int, default=8, help="バッチの枚数")
+    parser.add_argument("--colors", type=int, default=32, help="パレットの色数")
+    parser.add_argument("--repeat", type=int, default=3, help="各ケースの試行回数（最良値を採用）")
+    parser.add_argument("--json", type=str, default=None, help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    results = run(args.batch, args.colors, args.repeat)
+    print(f"{'size':>5} {'case':<22} {'ms/image':>9}")
+    for r in results:
+        print(f"{r['size']:>5} {r['case']:<22} {r['ms_per_image']:>9.2f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
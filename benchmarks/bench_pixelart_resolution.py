@@ -0,0 +1,107 @@
+"""
+ピクセルアートの生成サイズの決め方（ModelInfo.pixel_art）による計算量の削減の計測。
+ピクセルアートのサイズごとに、以下の設定で生成して1ステップあたりの時間・デコード時間・合計時間の中央値と、nativeとの速度比を出す。
+  native   : 以前の動作。常にモデルの解像度（512x512）で生成してVAEでデコードする
+  auto     : 出力サイズに合わせた生成サイズ（32/64px -> 256, 48px -> 384）で生成してVAEでデコードする
+  reduced  : autoの生成サイズで、潜在表現を出力の4倍まで縮めてからVAEでデコードする
+  latent   : autoの生成サイズで、VAEでデコードせず潜在表現を線形にRGBへ写す
+既定では極小パイプライン（ネットワーク不要。VAEの縮小率はSD1.5と同じ1/8）を測る。--models に p1 par などを指定すると実モデルを測る（ダウンロード済みであること）。
+
+    python -m benchmarks.bench_pixelart_resolution [--models tiny-sd] [--sizes 32 48 64 128] [--repeat 3] [--json out.json]
+"""
+if __name__ == "__main__":
+    import sys,os
+    sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import dataclasses
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Any
+
+from benchmarks.tiny_pipeline import register_tiny_model
+from pixelart_mcp.image_generator import generate_images
+from pixelart_mcp.models import MODEL_IDS, ModelInfo, PixelArtResolution
+from pixelart_mcp.pipeline_cache import PipelineCache
+
+VARIANTS: dict[str, PixelArtResolution] = {
+    "native": PixelArtResolution(min_size=512),
+    "auto": PixelArtResolution(),
+    "reduced": PixelArtResolution(decode="reduced"),
+    "latent": PixelArtResolution(decode="latent"),
+}
+
+
+def bench_variant(model_key: str, info: ModelInfo, variant: str, pixel_art_size: int, repeat: int, cache: PipelineCache, work_dir: str) -> dict[str, Any]:
+    # 生成サイズの決め方だけを変えて同じキーに登録し直す（パイプラインはキャッシュしたものを使い回す）
+    MODEL_IDS[model_key] = dataclasses.replace(info, pixel_art=VARIANTS[variant])
+    output_file = os.path.join(work_dir, f"{model_key}_{variant}_{pixel_art_size}.png")
+    samples: list[dict[str, Any]] = []
+    try:
+        # 1回目はロードを含むので除く
+        for i in range(repeat + 1):
+            timings: dict[str, Any] = {}
+            t0 = time.perf_counter()
+            errors = generate_images(["a knight with a sword"], [output_file], model_id_key=model_key, pixel_art_mode=pixel_art_size,  # type: ignore[arg-type]
+                                     pipeline_cache=cache, seeds=[i], timings=timings)
+            if errors[0] is not None:
+                raise RuntimeError(errors[0])
+            timings["total"] = time.perf_counter() - t0
+            samples.append(timings)
+    finally:
+        MODEL_IDS[model_key] = info
+    warm = samples[1:]
+    return {
+        "model": model_key,
+        "pixel_art_size": pixel_art_size,
+        "variant": variant,
+        "generation_size": VARIANTS[variant].generation_size(pixel_art_size),
+        "step_ms": statistics.median(t for s in warm for t in s["step_seconds"]) * 1000,
+        "decode_ms": statistics.median(s["decode"] for s in warm) * 1000,
+        "total_ms": statistics.median(s["total"] for s in warm) * 1000,
+    }
+
+
+def run(models: list[str], sizes: list[int], variants: list[str], repeat: int, steps: int, width: int) -> list[dict[str, Any]]:
+    results: list[dict[str, Any]] = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for model_key in models:
+            if model_key.startswith("tiny-") and model_key not in MODEL_IDS:
+                register_tiny_model(model_key, os.path.join(work_dir, model_key), kind="sd", num_inference_steps=steps, width=width, vae_blocks=4)
+            info = MODEL_IDS[model_key]
+            cache = PipelineCache()
+            for pixel_art_size in sizes:
+                size_results = [bench_variant(model_key, info, variant, pixel_art_size, repeat, cache, work_dir) for variant in variants]
+                base = next((r for r in size_results if r["variant"] == "native"), None)
+                for r in size_results:
+                    r["speedup"] = base["total_ms"] / r["total_ms"] if base else None
+                results += size_results
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ピクセルアートの生成サイズの決め方による計算量の削減の計測")
+    parser.add_argument("--models", nargs="+", default=["tiny-sd"], help="計測するモデルキー（tiny-sd は極小パイプライン）")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[32, 48, 64, 128], help="ピクセルアートのサイズ")
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS), default=list(VARIANTS), help="計測する設定")
+    parser.add_argument("--steps", type=int, default=4, help="極小パイプラインの推論ステップ数")
+    parser.add_argument("--width", type=int, default=8, help="極小パイプラインの基本チャネル数")
+    parser.add_argument("--repeat", type=int, default=3, help="試行回数")
+    parser.add_argument("--json", type=str, default=None, help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    results = run(args.models, args.sizes, args.variants, args.repeat, args.steps, args.width)
+    print(f"{'model':<10} {'pixel':>5} {'variant':<8} {'gen':>4} {'step ms':>8} {'decode ms':>9} {'total ms':>9} {'speedup':>7}")
+    for r in results:
+        speedup = f"{r['speedup']:>7.2f}" if r["speedup"] is not None else f"{'-':>7}"
+        print(f"{r['model']:<10} {r['pixel_art_size']:>5} {r['variant']:<8} {r['generation_size']:>4} {r['step_ms']:>8.2f} {r['decode_ms']:>9.2f} {r['total_ms']:>9.2f} {speedup}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
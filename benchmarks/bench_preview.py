@@ -0,0 +1,110 @@
+"""
+デノイズ途中のプレビュー画像のコストの計測。
+1) SD1.5の潜在表現の形 (B, 4, H/8, W/8) で、線形射影によるRGB化とPNGの書き出しにかかる時間を測る
+2) 極小パイプラインで、プレビューなし / preview_intervalごと / 毎ステップのプレビューありの1ステップあたりの時間を比べる
+1)の時間は生成サイズとバッチ数だけで決まるので、実モデルの1ステップの時間と比べれば増加の割合が分かる。
+
+    python -m benchmarks.bench_preview [--size 256] [--steps 20] [--interval 5] [--repeat 3] [--json out.json]
+"""
+if __name__ == "__main__":
+    import sys,os
+    sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Any
+
+import torch
+
+from benchmarks.tiny_pipeline import build_tiny_pipeline
+from pixelart_mcp import image_generator
+from pixelart_mcp.latent_preview import latents_to_images
+
+
+def bench_projection(work_dir: str, repeat: int) -> list[dict[str, Any]]:
+    """
+    実モデルの潜在表現の形で、プレビュー1回（RGB化とPNGの書き出し）の時間を測る
+    """
+    results: list[dict[str, Any]] = []
+    for batch, size in [(1, 512), (4, 512), (1, 768)]:
+        latents = torch.randn(batch, 4, size // 8, size // 8)
+        times: list[float] = []
+        for _ in range(repeat * 10):
+            t0 = time.perf_counter()
+            for i, image in enumerate(latents_to_images(latents)):
+                path = os.path.join(work_dir, f"preview{i}.png")
+                image.save(path + ".tmp", format="PNG")
+                os.replace(path + ".tmp", path)
+            times.append(time.perf_counter() - t0)
+        results.append({"case": "projection", "batch": batch, "size": size, "ms": statistics.median(times) * 1000})
+    return results
+
+
+def bench_pipeline(work_dir: str, size: int, steps: int, interval: int, repeat: int) -> list[dict[str, Any]]:
+    """
+    極小パイプラインでプレビューの有無による1ステップあたりの時間を比べる
+    """
+    tiny = build_tiny_pipeline("sd", width=size // 8)
+    original = image_generator.load_pipeline
+    image_generator.load_pipeline = lambda model_info, device: tiny  # type: ignore
+    output_file = os.path.join(work_dir, "output.png")
+
+    def write_preview(i: int, step: int, image: Any) -> None:
+        path = os.path.join(work_dir, "preview.png")
+        image.save(path + ".tmp", format="PNG")
+        os.replace(path + ".tmp", path)
+
+    def run_once(preview_interval: int) -> float:
+        t0 = time.perf_counter()
+        errors = image_generator.generate_images(
+            ["a knight"], [output_file], model_id_key="s1", size=(size, size), steps=steps, seeds=[0],
+            preview=write_preview if preview_interval else None, preview_interval=preview_interval,
+        )
+        if errors[0] is not None:
+            raise RuntimeError(errors[0])
+        return (time.perf_counter() - t0) / steps
+
+    results: list[dict[str, Any]] = []
+    try:
+        run_once(0)  # 初回のコストを除く
+        for preview_interval in [0, interval, 1]:
+            per_step = statistics.median(run_once(preview_interval) for _ in range(repeat))
+            results.append({"case": "pipeline", "size": size, "steps": steps, "interval": preview_interval, "step_ms": per_step * 1000})
+    finally:
+        image_generator.load_pipeline = original  # type: ignore
+    base = results[0]["step_ms"]
+    for r in results:
+        r["overhead_pct"] = (r["step_ms"] - base) / base * 100
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="プレビュー画像のコストの計測")
+    parser.add_argument("--size", type=int, default=256, help="極小パイプラインの生成サイズ")
+    parser.add_argument("--steps", type=int, default=20, help="推論ステップ数")
+    parser.add_argument("--interval", type=int, default=5, help="プレビューを作るステップ間隔")
+    parser.add_argument("--repeat", type=int, default=3, help="試行回数")
+    parser.add_argument("--json", type=str, default=None, help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        projection = bench_projection(work_dir, args.repeat)
+        pipeline = bench_pipeline(work_dir, args.size, args.steps, args.interval, args.repeat)
+
+    print(f"{'batch':>5} {'size':>5} {'preview ms':>10}")
+    for r in projection:
+        print(f"{r['batch']:>5} {r['size']:>5} {r['ms']:>10.3f}")
+    print(f"\n{'interval':>8} {'step ms':>8} {'overhead %':>10}")
+    for r in pipeline:
+        print(f"{r['interval'] or '-':>8} {r['step_ms']:>8.2f} {r['overhead_pct']:>10.2f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(projection + pipeline, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
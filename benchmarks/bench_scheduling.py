@@ -0,0 +1,122 @@
+"""
+実行待ちのジョブの順序（SchedulingPolicy.order: fifo / sjf）ごとの待ち時間のシミュレーション。
+小さいピクセルアートと大きい画像が混ざった要求を、到着間隔をランダムにして投入し、
+ワーカー数を固定して job_scheduler.JobScheduler の順に割り当てたときの、ジョブの種類ごとの待ち時間の中央値・95パーセンタイルと最大を出す。
+所要時間は見積もり（job_cost × 1単位あたりの秒数）どおりとする。モデルは使わない。
+
+    python -m benchmarks.bench_scheduling [--jobs 400] [--workers 1] [--load 0.9] [--seed 0] [--json out.json]
+"""
+if __name__ == "__main__":
+    import sys,os
+    sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import random
+import statistics
+from dataclasses import dataclass
+from typing import Any
+
+from pixelart_mcp.job_scheduler import JobScheduler, SchedulingPolicy, job_cost
+
+# (種類, 割合, ステップ数, 生成サイズ)
+JOB_MIX = [
+    ("pixel32", 0.5, 20, 256),
+    ("pixel64", 0.3, 20, 256),
+    ("image512", 0.15, 40, 512),
+    ("image1024", 0.05, 40, 1024),
+]
+
+
+@dataclass
+class SimJob:
+    kind: str
+    cost: float
+    enqueued_at: float
+    priority: int = 0
+
+
+def make_jobs(count: int, workers: int, load: float, seconds_per_unit: float, seed: int) -> list[SimJob]:
+    rng = random.Random(seed)
+    mean_cost = sum(share * job_cost(steps, size, size) for _, share, steps, size in JOB_MIX)
+    # 到着率をワーカーの処理能力のload倍にする
+    interval = mean_cost * seconds_per_unit / workers / load
+    jobs: list[SimJob] = []
+    now = 0.0
+    for _ in range(count):
+        now += rng.expovariate(1 / interval)
+        kind, _, steps, size = rng.choices(JOB_MIX, weights=[share for _, share, _, _ in JOB_MIX])[0]
+        jobs.append(SimJob(kind, job_cost(steps, size, size), now))
+    return jobs
+
+
+def simulate(jobs: list[SimJob], workers: int, policy: SchedulingPolicy, seconds_per_unit: float) -> dict[str, list[float]]:
+    scheduler = JobScheduler(policy)
+    scheduler.seconds_per_unit = seconds_per_unit
+    free_at = [0.0] * workers
+    arrivals = sorted(jobs, key=lambda job: job.enqueued_at)
+    pending: list[SimJob] = []
+    waits: dict[str, list[float]] = {}
+    i = 0
+    while i < len(arrivals) or pending:
+        worker = min(range(workers), key=free_at.__getitem__)
+        now = free_at[worker]
+        if not pending:
+            now = max(now, arrivals[i].enqueued_at)
+        while i < len(arrivals) and arrivals[i].enqueued_at <= now:
+            pending.append(arrivals[i])
+            i += 1
+        job = scheduler.order(pending, now)[0]
+        pending.remove(job)
+        waits.setdefault(job.kind, []).append(now - job.enqueued_at)
+        free_at[worker] = now + scheduler.estimated_seconds(job.cost)
+    return waits
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run(count: int, workers: int, load: float, seconds_per_unit: float, aging_rate: float, seed: int) -> list[dict[str, Any]]:
+    jobs = make_jobs(count, workers, load, seconds_per_unit, seed)
+    results: list[dict[str, Any]] = []
+    for order in ("fifo", "sjf"):
+        waits = simulate(jobs, workers, SchedulingPolicy(order=order, aging_rate=aging_rate), seconds_per_unit)  # type: ignore[arg-type]
+        for kind, *_ in JOB_MIX:
+            values = waits.get(kind, [])
+            if not values:
+                continue
+            results.append({
+                "order": order,
+                "kind": kind,
+                "jobs": len(values),
+                "wait_p50_s": statistics.median(values),
+                "wait_p95_s": _percentile(values, 0.95),
+                "wait_max_s": max(values),
+            })
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="実行待ちのジョブの順序ごとの待ち時間のシミュレーション")
+    parser.add_argument("--jobs", type=int, default=400, help="投入するジョブ数")
+    parser.add_argument("--workers", type=int, default=1, help="ワーカー数")
+    parser.add_argument("--load", type=float, default=0.9, help="ワーカーの処理能力に対する到着の割合")
+    parser.add_argument("--seconds-per-unit", type=float, default=1.0, help="1単位（512x512を1ステップ）あたりの秒数")
+    parser.add_argument("--aging-rate", type=float, default=SchedulingPolicy().aging_rate, help="sjfのエイジングの強さ")
+    parser.add_argument("--seed", type=int, default=0, help="乱数シード")
+    parser.add_argument("--json", type=str, default=None, help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    results = run(args.jobs, args.workers, args.load, args.seconds_per_unit, args.aging_rate, args.seed)
+    print(f"{'order':<5} {'kind':<10} {'jobs':>5} {'p50 s':>8} {'p95 s':>8} {'max s':>8}")
+    for r in results:
+        print(f"{r['order']:<5} {r['kind']:<10} {r['jobs']:>5} {r['wait_p50_s']:>8.1f} {r['wait_p95_s']:>8.1f} {r['wait_max_s']:>8.1f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+速度の段階（speed: quality / fast / turbo）ごとの生成レイテンシの計測。
+モデルキーごとに各段階で同じプロンプトを生成し、ステップ数・1ステップあたりの時間・合計時間の中央値と、qualityとの速度比を出す。
+既定では極小パイプライン（ネットワーク不要）を、ランダム重みのLoRAをLCM-LoRAの代わりにして測る。
+--models に s1 p1 par などを指定すると実モデルを測る（モデルとLCM-LoRAがダウンロード済みであること）。
+
+    python -m benchmarks.bench_speed_tiers [--models tiny-sd] [--steps 40] [--size 128] [--repeat 3] [--json out.json]
+"""
+if __name__ == "__main__":
+    import sys,os
+    sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Any, get_args
+
+from benchmarks.tiny_pipeline import register_tiny_model
+from pixelart_mcp.image_generator import generate_images
+from pixelart_mcp.models import MODEL_IDS
+from pixelart_mcp.pipeline_cache import PipelineCache
+from pixelart_mcp.samplers import SpeedTier, plan_sampling
+
+TIERS: tuple[str, ...] = get_args(SpeedTier)
+
+
+def bench_tier(model_key: str, speed: str, size: int, repeat: int, cache: PipelineCache, work_dir: str) -> dict[str, Any]:
+    output_file = os.path.join(work_dir, f"{model_key}_{speed}.png")
+    samples: list[dict[str, Any]] = []
+    # 1回目はロードを含むので除く
+    for i in range(repeat + 1):
+        timings: dict[str, Any] = {}
+        t0 = time.perf_counter()
+        errors = generate_images(["a knight with a sword"], [output_file], model_id_key=model_key, size=(size, size),
+                                 pipeline_cache=cache, seeds=[i], timings=timings, speed=speed)  # type: ignore[arg-type]
+        if errors[0] is not None:
+            raise RuntimeError(errors[0])
+        timings["total"] = time.perf_counter() - t0
+        samples.append(timings)
+    plan = plan_sampling(MODEL_IDS[model_key], speed)  # type: ignore[arg-type]
+    warm = samples[1:]
+    return {
+        "model": model_key,
+        "speed": speed,
+        "sampler": plan.sampler,
+        "lcm_lora": plan.lcm_lora,
+        "steps": len(warm[0]["step_seconds"]),
+        "load_s": samples[0]["load"],
+        "step_ms": statistics.median(t for s in warm for t in s["step_seconds"]) * 1000,
+        "total_ms": statistics.median(s["total"] for s in warm) * 1000,
+    }
+
+
+def run(models: list[str], steps: int, size: int, repeat: int, width: int) -> list[dict[str, Any]]:
+    results: list[dict[str, Any]] = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for model_key in models:
+            if model_key.startswith("tiny-") and model_key not in MODEL_IDS:
+                register_tiny_model(model_key, os.path.join(work_dir, model_key), kind="sd", num_inference_steps=steps, width=width, lcm_lora=True)
+            cache = PipelineCache()
+            model_results = [bench_tier(model_key, speed, size, repeat, cache, work_dir) for speed in TIERS]
+            base = model_results[0]["total_ms"]
+            for r in model_results:
+                r["speedup"] = base / r["total_ms"]
+            results += model_results
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="速度の段階ごとの生成レイテンシの計測")
+    parser.add_argument("--models", nargs="+", default=["tiny-sd"], help="計測するモデルキー（tiny-sd は極小パイプライン）")
+    parser.add_argument("--steps", type=int, default=40, help="極小パイプラインのqualityのステップ数（s1と同じ40）")
+    parser.add_argument("--size", type=int, default=128, help="生成サイズ（正方形）")
+    parser.add_argument("--width", type=int, default=32, help="極小パイプラインの基本チャネル数")
+    parser.add_argument("--repeat", type=int, default=3, help="試行回数")
+    parser.add_argument("--json", type=str, default=None, help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    results = run(args.models, args.steps, args.size, args.repeat, args.width)
+    print(f"{'model':<10} {'speed':<8} {'sampler':<8} {'steps':>5} {'step ms':>8} {'total ms':>9} {'speedup':>7}")
+    for r in results:
+        sampler = (r["sampler"] or "default") + ("+LoRA" if r["lcm_lora"] else "")
+        print(f"{r['model']:<10} {r['speed']:<8} {sampler:<8} {r['steps']:>5} {r['step_ms']:>8.2f} {r['total_ms']:>9.2f} {r['speedup']:>7.2f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+MCPサーバーの起動レイテンシの計測。
+新しいPythonプロセスで image_mcp のimport、create_mcp()（ワーカー起動を含む）、
+最初の list_jobs_tool 応答までの時間を測り、サーバープロセスにtorch等が読み込まれていないことを確認する。
+比較のため、以前のimport連鎖で読み込まれていた image_generator のimport時間も測る。
+
+    python -m benchmarks.bench_startup [--repeat 3] [--importtime 15] [--json out.json]
+"""
+if __name__ == "__main__":
+    import sys,os
+    sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Any
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ML_MODULES = ("torch", "diffusers", "transformers", "huggingface_hub")
+
+# 計測対象の子プロセスで実行するコード
+_SERVER_CODE = """
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+from pixelart_mcp.image_mcp import create_mcp
+t_import = time.perf_counter()
+mcp = create_mcp()
+t_create = time.perf_counter()
+asyncio.run(mcp.call_tool("list_jobs_tool", {}))
+t_first = time.perf_counter()
+print(json.dumps({
+    "import": t_import - t0,
+    "create_mcp": t_create - t_import,
+    "first_list_jobs": t_first - t_create,
+    "total": t_first - t0,
+    "ml_modules": [m for m in %r if m in sys.modules],
+}))
+""" % (ML_MODULES,)
+
+_EAGER_CODE = """
+import json, time
+t0 = time.perf_counter()
+import pixelart_mcp.image_generator
+print(json.dumps({"import": time.perf_counter() - t0}))
+"""
+
+
+def _run_child(code: str, home: str) -> dict[str, Any]:
+    env = dict(os.environ, HOME=home, PYTHONPATH=ROOT)
+    out = subprocess.run([sys.executable, "-c", code], env=env, cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def importtime(top: int) -> list[tuple[str, int]]:
+    """
+    python -X importtime で image_mcp のimportを計測し、累積時間の大きいモジュールを返す
+    :return: (モジュール名, 累積マイクロ秒) のリスト
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import pixelart_mcp.image_mcp"],
+                         env=env, cwd=ROOT, capture_output=True, text=True, check=True)
+    rows: list[tuple[str, int]] = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(cumulative)))
+    return sorted(rows, key=lambda r: r[1], reverse=True)[:top]
+
+
+def run(repeat: int) -> list[dict[str, Any]]:
+    results: list[dict[str, Any]] = []
+    for i in range(repeat):
+        # 既存のジョブディレクトリを使わないよう、HOMEを一時ディレクトリにする
+        with tempfile.TemporaryDirectory() as home:
+            results.append({"case": "server", "run": i, **_run_child(_SERVER_CODE, home)})
+            results.append({"case": "eager_image_generator", "run": i, **_run_child(_EAGER_CODE, home)})
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="MCPサーバーの起動レイテンシの計測")
+    parser.add_argument("--repeat", type=int, default=3, help="試行回数")
+    parser.add_argument("--importtime", type=int, default=0, help="-X importtime の累積上位N件を表示する（0なら表示しない）")
+    parser.add_argument("--json", type=str, default=None, help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    print(f"{'case':<22} {'import':>8} {'create':>8} {'first':>8} {'total':>8}  ml_modules")
+    for r in results:
+        if r["case"] == "server":
+            print(f"{r['case']:<22} {r['import']:>8.3f} {r['create_mcp']:>8.3f} {r['first_list_jobs']:>8.3f} {r['total']:>8.3f}  {','.join(r['ml_modules']) or '-'}")
+        else:
+            print(f"{r['case']:<22} {r['import']:>8.3f}")
+    if args.importtime:
+        print(f"\n{'cumulative ms':>13}  module")
+        for name, cumulative in importtime(args.importtime):
+            print(f"{cumulative / 1000:>13.1f}  {name}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+ネットワーク不要・CPUのみで動くオフラインのベンチマークスイート。
+ランダム重みの極小パイプライン（StableDiffusionPipeline / LatentConsistencyModelPipeline）をローカルに保存してモデルとして登録し、
+1) generate_image: モデルのロード・プロンプトの埋め込み・1ステップあたりの時間・デコード・リサイズ・保存の段階ごとの時間
+2) ImageJobManager: 投入のレイテンシ・キュー待ち・実行時間・完了までの合計時間（1件ずつ / まとめて投入）
+を測り、回帰の追跡に使えるようJSONで保存する。--baseline に以前の結果を渡すと、中央値が tolerance を超えて
+遅くなった項目を表示して終了コード1で終わる。
+
+    python -m benchmarks.bench_suite [--kinds sd lcm] [--size 64] [--width 8] [--repeat 5] [--jobs 8] [--json out.json] [--baseline base.json]
+"""
+if __name__ == "__main__":
+    import sys,os
+    sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Literal
+
+import diffusers
+import torch
+
+from benchmarks.tiny_pipeline import register_tiny_model
+from pixelart_mcp.image_generator import generate_image
+from pixelart_mcp.image_jobs import ImageJobInfo, ImageJobManager, JobStatus, WorkerConfig
+from pixelart_mcp.pipeline_cache import PipelineCache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# generate_imageの段階（timingsのキー）
+STAGES = ("load", "encode", "step", "denoise", "decode", "resize", "save")
+
+
+def summarize(case: str, model: str, metric: str, values: list[float]) -> dict[str, Any]:
+    """
+    1項目の計測値を中央値・平均・p95・最大にまとめる（単位は秒）
+    """
+    ordered = sorted(values)
+    return {
+        "case": case,
+        "model": model,
+        "metric": metric,
+        "unit": "s",
+        "n": len(ordered),
+        "median": statistics.median(ordered),
+        "mean": statistics.fmean(ordered),
+        "p95": ordered[max(0, int(len(ordered) * 0.95 + 0.5) - 1)],
+        "max": ordered[-1],
+    }
+
+
+def bench_generate(model: str, size: int, repeat: int, work_dir: str) -> list[dict[str, Any]]:
+    """
+    generate_imageの段階ごとの時間を測る。1回目（パイプラインのロードを含む）はcoldとして別に記録する
+    """
+    cache = PipelineCache()
+    samples: list[dict[str, Any]] = []
+    for i in range(repeat + 1):
+        timings: dict[str, Any] = {}
+        t0 = time.perf_counter()
+        generate_image(
+            f"a knight number {i}", os.path.join(work_dir, f"{model}_{i}.png"), model_id_key=model,
+            size=(size, size), resize_to=(size // 2, size // 2), pipeline_cache=cache, seed=i, timings=timings,
+        )
+        timings["total"] = time.perf_counter() - t0
+        if "save" not in timings:
+            raise RuntimeError(f"生成に失敗しました: {model}")
+        samples.append(timings)
+
+    cold, warm = samples[0], samples[1:]
+    results = [summarize("generate_cold", model, metric, [cold[metric]]) for metric in ("load", "total")]
+    for stage in STAGES:
+        if stage == "step":
+            values = [t for timings in warm for t in timings["step_seconds"]]
+        else:
+            values = [timings[stage] for timings in warm]
+        results.append(summarize("generate", model, stage, values))
+    results.append(summarize("generate", model, "total", [timings["total"] for timings in warm]))
+    return results
+
+
+def _queue_wait(submitted: ImageJobInfo, job: ImageJobInfo) -> float:
+    # 投入時のstart_timeは投入時刻で、実行を始めると開始時刻に置き換わる
+    return (datetime.fromisoformat(job.start_time) - datetime.fromisoformat(submitted.start_time)).total_seconds()
+
+
+def bench_manager(model: str, size: int, jobs: int, work_dir: str, timeout: float) -> list[dict[str, Any]]:
+    """
+    ImageJobManagerに投入して完了を待つまでを測る。
+    1件ずつ投入して待つ場合（1件目はワーカーでのロードを含むのでcoldとして別に記録する）と、まとめて投入する場合
+    """
+    # 同じ条件の要求として結果を再利用しないよう、シードはすべて変える
+    manager = ImageJobManager(
+        image_dir=os.path.join(work_dir, f"manager_{model}"),
+        worker_config=WorkerConfig(num_workers=1, max_batch_size=1, result_cache_bytes=0),
+    )
+    try:
+        def run(submitted: list[tuple[float, float, ImageJobInfo]]) -> list[dict[str, float]]:
+            samples = []
+            for t0, submit_latency, info in submitted:
+                job = manager.wait_for_job(info.job_id, timeout=timeout)
+                if job.status != JobStatus.finished:
+                    raise RuntimeError(f"ジョブが完了しませんでした: {job.status.value} {job.error}")
+                samples.append({
+                    "submit": submit_latency,
+                    "queue_wait": _queue_wait(info, job),
+                    "run": job.elapsed or 0.0,
+                    "total": time.perf_counter() - t0,
+                })
+            return samples
+
+        def submit(seed: int) -> tuple[float, float, ImageJobInfo]:
+            t0 = time.perf_counter()
+            info = manager.submit_image_job(f"a knight number {seed}", size, size, model=model, seed=seed)
+            return t0, time.perf_counter() - t0, info
+
+        sequential = [run([submit(seed)])[0] for seed in range(jobs + 1)]
+        burst = run([submit(seed) for seed in range(jobs + 1, 2 * jobs + 1)])
+    finally:
+        manager.shutdown()
+
+    results = [summarize("manager_cold", model, metric, [sequential[0][metric]]) for metric in ("run", "total")]
+    for case, samples in (("manager", sequential[1:]), ("manager_burst", burst)):
+        for metric in ("submit", "queue_wait", "run", "total"):
+            results.append(summarize(case, model, metric, [s[metric] for s in samples]))
+    return results
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata(args: argparse.Namespace) -> dict[str, Any]:
+    """
+    結果を比べるときに条件をそろえるための実行環境の情報
+    """
+    return {
+        "timestamp": datetime.now().astimezone().isoformat(),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "diffusers": diffusers.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "torch_threads": torch.get_num_threads(),
+        "args": {k: v for k, v in vars(args).items() if k not in ("json", "baseline")},
+    }
+
+
+def run(kinds: list[Literal["sd", "lcm"]], size: int, width: int, steps: int, repeat: int, jobs: int, timeout: float) -> list[dict[str, Any]]:
+    results: list[dict[str, Any]] = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        # ワーカープロセスはマネージャーの起動時にforkされ、登録済みのMODEL_IDSを引き継ぐ
+        models = []
+        for kind in kinds:
+            model = f"tiny-{kind}"
+            register_tiny_model(model, os.path.join(work_dir, model), kind=kind, num_inference_steps=steps, width=width)
+            models.append(model)
+        for model in models:
+            results += bench_generate(model, size, repeat, work_dir)
+        for model in models:
+            results += bench_manager(model, size, jobs, work_dir, timeout)
+    return results
+
+
+def compare(results: list[dict[str, Any]], baseline: list[dict[str, Any]], tolerance: float) -> list[dict[str, Any]]:
+    """
+    以前の結果と中央値を比べ、tolerance（割合）を超えて遅くなった項目を返す
+    """
+    base = {(r["case"], r["model"], r["metric"]): r["median"] for r in baseline}
+    regressions = []
+    for r in results:
+        before = base.get((r["case"], r["model"], r["metric"]))
+        if before and r["median"] > before * (1 + tolerance):
+            regressions.append({**r, "baseline_median": before, "ratio": r["median"] / before})
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="極小パイプラインによるオフラインのベンチマークスイート")
+    parser.add_argument("--kinds", nargs="+", choices=["sd", "lcm"], default=["sd", "lcm"], help="計測するパイプラインの種類")
+    parser.add_argument("--size", type=int, default=64, help="生成サイズ（正方形）")
+    parser.add_argument("--width", type=int, default=8, help="極小パイプラインの基本チャネル数")
+    parser.add_argument("--steps", type=int, default=4, help="推論ステップ数（LCMパイプラインは6ステップ固定）")
+    parser.add_argument("--repeat", type=int, default=5, help="generate_imageの試行回数")
+    parser.add_argument("--jobs", type=int, default=8, help="ImageJobManagerに投入するジョブ数")
+    parser.add_argument("--timeout", type=float, default=300.0, help="1ジョブの完了を待つ最大秒数")
+    parser.add_argument("--json", type=str, default=None, help="結果をJSONで保存するパス")
+    parser.add_argument("--baseline", type=str, default=None, help="比較する以前の結果のJSON")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="回帰とみなす中央値の増加の割合")
+    args = parser.parse_args()
+
+    results = run(args.kinds, args.size, args.width, args.steps, args.repeat, args.jobs, args.timeout)
+    print(f"{'case':<14} {'model':<9} {'metric':<10} {'n':>3} {'median ms':>10} {'p95 ms':>10}")
+    for r in results:
+        print(f"{r['case']:<14} {r['model']:<9} {r['metric']:<10} {r['n']:>3} {r['median'] * 1000:>10.2f} {r['p95'] * 1000:>10.2f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"meta": metadata(args), "results": results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+        for r in regressions:
+            print(f"回帰: {r['case']} {r['model']} {r['metric']} {r['baseline_median'] * 1000:.2f}ms -> {r['median'] * 1000:.2f}ms (x{r['ratio']:.2f})")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
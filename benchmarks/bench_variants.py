@@ -0,0 +1,97 @@
+"""
+バリエーション生成（generate_variants_tool）のスループット計測。
+同じプロンプトのN枚のピクセルアートを、(1) シードごとに別のジョブとして1枚ずつ生成する場合と、
+(2) バリエーションのジョブとして1回のパイプライン呼び出しで生成してスプライトシートにまとめる場合で、images/s を比べる。
+既定では極小パイプライン（ネットワーク不要。VAEの縮小率はSD1.5と同じ1/8）を測る。--model に p1 などを指定すると実モデルを測る。
+
+    python -m benchmarks.bench_variants [--counts 4 8] [--pixel-size 32] [--repeat 2] [--json out.json]
+"""
+if __name__ == "__main__":
+    import sys,os
+    sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Any
+
+from benchmarks.tiny_pipeline import register_tiny_model
+from pixelart_mcp.image_generator import generate_images
+from pixelart_mcp.image_jobs import ImageJobInfo, _run_variants
+from pixelart_mcp.models import MODEL_IDS
+from pixelart_mcp.pipeline_cache import EmbeddingCache, PipelineCache
+
+PROMPT = "a knight sprite, pixel art"
+
+
+def bench_separate(model_key: str, count: int, pixel_size: int, cache: PipelineCache, embeddings: EmbeddingCache, work_dir: str) -> float:
+    t0 = time.perf_counter()
+    for seed in range(count):
+        errors = generate_images([PROMPT], [os.path.join(work_dir, f"separate_{seed}.png")], model_id_key=model_key, pixel_art_mode=pixel_size,
+                                 pipeline_cache=cache, embedding_cache=embeddings, seeds=[seed])
+        if errors[0] is not None:
+            raise RuntimeError(errors[0])
+    return time.perf_counter() - t0
+
+
+def bench_variants(model_key: str, count: int, pixel_size: int, cache: PipelineCache, embeddings: EmbeddingCache, work_dir: str) -> float:
+    job_info = ImageJobInfo.new_variants(PROMPT, pixel_size, list(range(count)), model=model_key)  # type: ignore[arg-type]
+    os.makedirs(os.path.join(work_dir, job_info.job_id), exist_ok=True)
+    t0 = time.perf_counter()
+    errors = _run_variants(work_dir, job_info.job_id, job_info, cache, embeddings, None, None, None, 0, None)
+    if errors[0] is not None:
+        raise RuntimeError(errors[0])
+    return time.perf_counter() - t0
+
+
+def run(model_key: str, counts: list[int], pixel_size: int, repeat: int, steps: int, width: int) -> list[dict[str, Any]]:
+    results: list[dict[str, Any]] = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        if model_key.startswith("tiny-") and model_key not in MODEL_IDS:
+            register_tiny_model(model_key, os.path.join(work_dir, model_key), kind="sd", num_inference_steps=steps, width=width, vae_blocks=4)
+        cache = PipelineCache()
+        embeddings = EmbeddingCache()
+        # ロードは計測に含めない
+        bench_separate(model_key, 1, pixel_size, cache, embeddings, work_dir)
+        for count in counts:
+            separate = statistics.median(bench_separate(model_key, count, pixel_size, cache, embeddings, work_dir) for _ in range(repeat))
+            variants = statistics.median(bench_variants(model_key, count, pixel_size, cache, embeddings, work_dir) for _ in range(repeat))
+            results.append({
+                "model": model_key,
+                "count": count,
+                "pixel_size": pixel_size,
+                "separate_s": separate,
+                "variants_s": variants,
+                "separate_images_per_sec": count / separate,
+                "variants_images_per_sec": count / variants,
+                "speedup": separate / variants,
+            })
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="バリエーション生成のスループット計測")
+    parser.add_argument("--model", type=str, default="tiny-sd", help="計測するモデルキー（tiny-sd は極小パイプライン）")
+    parser.add_argument("--counts", nargs="+", type=int, default=[4, 8], help="フレーム数")
+    parser.add_argument("--pixel-size", type=int, choices=[32, 48, 64, 128], default=32, help="ピクセルアートのサイズ")
+    parser.add_argument("--repeat", type=int, default=2, help="試行回数（中央値を出す）")
+    parser.add_argument("--steps", type=int, default=4, help="極小パイプラインの推論ステップ数")
+    parser.add_argument("--width", type=int, default=8, help="極小パイプラインの基本チャネル数")
+    parser.add_argument("--json", type=str, default=None, help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    results = run(args.model, args.counts, args.pixel_size, args.repeat, args.steps, args.width)
+    print(f"{'model':<10} {'count':>5} {'separate s':>10} {'variants s':>10} {'sep img/s':>9} {'var img/s':>9} {'speedup':>7}")
+    for r in results:
+        print(f"{r['model']:<10} {r['count']:>5} {r['separate_s']:>10.2f} {r['variants_s']:>10.2f} "
+              f"{r['separate_images_per_sec']:>9.2f} {r['variants_images_per_sec']:>9.2f} {r['speedup']:>7.2f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+ネットワーク不要・CPUのみで動く、ランダム重みの極小パイプラインを作成するヘルパー。
+保存したディレクトリを hf_model_id に指定した ModelInfo を MODEL_IDS に登録すると、
+generate_image からは通常のモデルと同じ経路（from_pretrained）で読み込まれる。
+"""
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+from typing import Literal
+
+import torch
+from diffusers.models.autoencoders.autoencoder_kl import AutoencoderKL
+from diffusers.models.unets.unet_2d_condition import UNet2DConditionModel
+from diffusers.pipelines.latent_consistency_models.pipeline_latent_consistency_text2img import LatentConsistencyModelPipeline
+from diffusers.pipelines.stable_diffusion.pipeline_stable_diffusion import StableDiffusionPipeline
+from diffusers.schedulers.scheduling_ddim import DDIMScheduler
+from diffusers.schedulers.scheduling_lcm import LCMScheduler
+from transformers import CLIPTextConfig, CLIPTextModel, CLIPTokenizer
+
+from pixelart_mcp.models import MODEL_IDS, ModelInfo
+
+_CHARS = "abcdefghijklmnopqrstuvwxyz0123456789,.-_ "
+
+
+def _build_tokenizer(work_dir: str) -> CLIPTokenizer:
+    # 1文字=1トークンの語彙（マージ規則なし）
+    vocab: dict[str, int] = {"<|startoftext|>": 0, "<|endoftext|>": 1}
+    for c in _CHARS:
+        vocab[c] = len(vocab)
+        vocab[c + "</w>"] = len(vocab)
+    vocab_path = os.path.join(work_dir, "vocab.json")
+    merges_path = os.path.join(work_dir, "merges.txt")
+    with open(vocab_path, "w", encoding="utf-8") as f:
+        json.dump(vocab, f)
+    with open(merges_path, "w", encoding="utf-8") as f:
+        f.write("#version: 0.2\n")
+    return CLIPTokenizer(vocab_path, merges_path, model_max_length=77)
+
+
+def build_tiny_pipeline(kind: Literal["sd", "lcm"] = "sd", seed: int = 0, width: int = 32, vae_blocks: int = 2) -> StableDiffusionPipeline | LatentConsistencyModelPipeline:
+    """
+    ランダム重みの極小パイプラインを作成する
+    :param kind: "sd"ならStableDiffusionPipeline、"lcm"ならLatentConsistencyModelPipeline
+    :param seed: 重み初期化の乱数シード
+    :param width: UNet/VAEの基本チャネル数（大きいほど重い）
+    :param vae_blocks: VAEのブロック数。縮小率は 2**(vae_blocks-1)（4ならSD1.5と同じ1/8）
+    """
+    torch.manual_seed(seed)
+    with tempfile.TemporaryDirectory() as work_dir:
+        tokenizer = _build_tokenizer(work_dir)
+    unet = UNet2DConditionModel(
+        block_out_channels=(width, width * 2),
+        layers_per_block=1,
+        sample_size=32,
+        in_channels=4,
+        out_channels=4,
+        down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"),
+        up_block_types=("CrossAttnUpBlock2D", "UpBlock2D"),
+        cross_attention_dim=32,
+        norm_num_groups=min(32, width),
+        attention_head_dim=4,
+        time_cond_proj_dim=32 if kind == "lcm" else None,
+    )
+    vae = AutoencoderKL(
+        block_out_channels=tuple(width * min(2 ** i, 4) for i in range(vae_blocks)),
+        in_channels=3,
+        out_channels=3,
+        down_block_types=("DownEncoderBlock2D",) * vae_blocks,
+        up_block_types=("UpDecoderBlock2D",) * vae_blocks,
+        latent_channels=4,
+        norm_num_groups=min(32, width),
+        # VAEをタイルに分けるときのタイルの辺（SD1.5のVAEと同じ）
+        sample_size=512,
+    )
+    text_encoder = CLIPTextModel(CLIPTextConfig(
+        bos_token_id=0,
+        eos_token_id=1,
+        pad_token_id=1,
+        hidden_size=32,
+        intermediate_size=37,
+        layer_norm_eps=1e-5,
+        num_attention_heads=4,
+        num_hidden_layers=2,
+        vocab_size=len(tokenizer.get_vocab()),
+    ))
+    scheduler_kwargs = dict(beta_start=0.00085, beta_end=0.012, beta_schedule="scaled_linear", clip_sample=False, set_alpha_to_one=False, steps_offset=1)
+    if kind == "lcm":
+        return LatentConsistencyModelPipeline(
+            vae=vae, text_encoder=text_encoder, tokenizer=tokenizer, unet=unet,
+            scheduler=LCMScheduler(**scheduler_kwargs),
+            safety_checker=None, feature_extractor=None, requires_safety_checker=False,  # type: ignore[arg-type]
+        )
+    return StableDiffusionPipeline(
+        vae=vae, text_encoder=text_encoder, tokenizer=tokenizer, unet=unet,
+        scheduler=DDIMScheduler(**scheduler_kwargs),
+        safety_checker=None, feature_extractor=None, requires_safety_checker=False,  # type: ignore[arg-type]
+    )
+
+
+def save_tiny_lora(pipe: StableDiffusionPipeline | LatentConsistencyModelPipeline, save_dir: str, rank: int = 4) -> None:
+    """
+    極小パイプラインのUNetに合うランダム重みのLoRAを save_dir に保存する（LCM-LoRAの代わりに、LoRAを付けたときのコストを測る）
+    """
+    from peft import LoraConfig
+    from peft.utils import get_peft_model_state_dict
+
+    unet = pipe.unet
+    unet.add_adapter(LoraConfig(r=rank, lora_alpha=rank, init_lora_weights="gaussian", target_modules=["to_q", "to_k", "to_v", "to_out.0"]))
+    StableDiffusionPipeline.save_lora_weights(save_dir, unet_lora_layers=get_peft_model_state_dict(unet), safe_serialization=True)
+    unet.delete_adapters("default")
+
+
+def register_tiny_model(model_id_key: str, save_dir: str, kind: Literal["sd", "lcm"] = "sd", num_inference_steps: int = 4, width: int = 32, lcm_lora: bool = False, vae_blocks: int = 2) -> ModelInfo:
+    """
+    極小パイプラインを save_dir に保存し、MODEL_IDS[model_id_key] として登録する
+    :param vae_blocks: VAEのブロック数（build_tiny_pipelineを参照）
+    :param lcm_lora: ランダム重みのLoRAを save_dir/lcm_lora に保存し、speed="turbo"で付けるLCM-LoRAとして登録する
+    :return: 登録したModelInfo
+    """
+    lora_dir = os.path.join(save_dir, "lcm_lora")
+    if not os.path.isfile(os.path.join(save_dir, "model_index.json")) or (lcm_lora and not os.path.isdir(lora_dir)):
+        pipe = build_tiny_pipeline(kind, width=width, vae_blocks=vae_blocks)
+        pipe.save_pretrained(save_dir, safe_serialization=True)
+        if lcm_lora:
+            save_tiny_lora(pipe, lora_dir)
+    info = ModelInfo(
+        name=f"tiny-{kind}",
+        description=f"ランダム重みの極小パイプライン ({kind})",
+        hf_model_id=save_dir,
+        num_inference_steps=num_inference_steps,
+        lcm_lora_id=lora_dir if lcm_lora else None,
+    )
+    MODEL_IDS[model_id_key] = info
+    return info
@@ -34,6 +34,7 @@ def main():
     parser.add_argument("-p", "--pixel", choices=["off", "32", "48", "64", "128"], default="off", help="ピクセルアート化サイズ (off, 32, 48, 64, 128)")
 
     parser.add_argument("-o", "--output", default="output.png", help="出力ファイル名 (デフォルト: output.png)")
+    parser.add_argument("--seed", type=int, default=None, help="乱数シード (デフォルト: 毎回ランダム)")
 
     args = parser.parse_args()
 
@@ -52,7 +53,8 @@ def main():
             steps=args.num_steps,
             size=(512, 512),
             resize_to=None,
-            pixel_art_mode=pixel_art_mode
+            pixel_art_mode=pixel_art_mode,
+            seed=args.seed,
         )
     else:
         # 通常画像生成
@@ -65,7 +67,8 @@ def main():
             steps=args.num_steps,
             size=size,
             resize_to=resize_to,
-            pixel_art_mode=None
+            pixel_art_mode=None,
+            seed=args.seed,
         )
 
 if __name__ == "__main__":
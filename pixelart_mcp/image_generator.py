@@ -1,12 +1,15 @@
-from dataclasses import dataclass
+import contextlib
+import dataclasses
 import os
 import logging
+import tempfile
+import weakref
 
 import torch
 import torch.version as torch_version
 from PIL import Image
 import numpy as np
-from typing import Literal
+from typing import Any, Callable, Literal
 import time
 
 from huggingface_hub.utils import logging as hf_logging
@@ -16,10 +19,19 @@ from diffusers.pipelines.stable_diffusion.pipeline_stable_diffusion import Stabl
 from diffusers.pipelines.stable_diffusion.pipeline_output import StableDiffusionPipelineOutput
 from diffusers.pipelines.pixart_alpha.pipeline_pixart_alpha import PixArtAlphaPipeline
 from diffusers.pipelines.latent_consistency_models.pipeline_latent_consistency_text2img import LatentConsistencyModelPipeline
-from diffusers.schedulers.scheduling_ddim import DDIMScheduler
+from diffusers import schedulers as diffusers_schedulers
 from diffusers.callbacks import PipelineCallback
+from diffusers.models.unets.unet_2d_condition import UNet2DConditionOutput
 from diffusers.utils import logging as diffusers_logging
 
+from .image_output import save_image
+from .latent_preview import latents_to_images, supports_preview
+from .memory_budget import MemoryPlan, estimate_model_bytes, plan_memory
+from .models import MODEL_ID_LCM, MODEL_IDS, ModelInfo, PixelArtResolution, default_negave_prompt, resolve_model_key
+from .pipeline_cache import EmbeddingCache, PipelineCache, PipelineKey
+from .pixel_engine import PixelArtOptions, pixelate_images
+from .samplers import SAMPLERS, SpeedTier, pipeline_model_key, plan_sampling
+
 logging.getLogger("diffusers").setLevel(logging.ERROR)
 diffusers_logging.set_verbosity_error()
 hf_logging.set_verbosity_error()
@@ -27,64 +39,6 @@ os.environ["TRANSFORMERS_NO_TQDM"] = "1"
 
 logger = logging.getLogger(__name__)
 
-default_negave_prompt: str = "low quality, worst quality, normal quality, jpeg artifacts, ugly, duplicate, morbid, mutilated, extra fingers, fewer digits, cropped, worst quality, low quality, normal quality, error, missing fingers, extra digit, fewer digits, bad anatomy, bad hands, text, error, missing fingers, extra digit and fewer digits"
-
-@dataclass
-class ModelInfo:
-    name: str
-    description: str
-    hf_model_id: str
-    hf_lora_id: str|None = None
-    use_lcm:bool = False
-    dtype: torch.dtype = torch.float32
-    use_safetensors: bool = True
-    num_inference_steps: int = 40
-    sampler: str|None = None
-    guidance_scale:float|None = None
-    prompt_prefix: str = ""
-    prompt_suffix: str = ""
-    negave_prompt: str = ""
-
-MODEL_IDS: dict[str, ModelInfo] = {
-    "s1": ModelInfo(
-        name="SD‑1.5 Base",
-        description="汎用 Stable Diffusion v1.5",
-        hf_model_id="runwayml/stable-diffusion-v1-5",
-        prompt_prefix="",
-        negave_prompt = default_negave_prompt,
-    ),
-    "s2": ModelInfo(
-        name="LCM_Dreamshaper_v7",
-        description="LCM_Dreamshaper_v7",
-        hf_model_id="SimianLuo/LCM_Dreamshaper_v7",
-        dtype=torch.float16,
-        num_inference_steps=6,
-        prompt_prefix="",
-        negave_prompt = default_negave_prompt,
-    ),
-    "p1": ModelInfo(
-        name="All-In-One Pixel Model",
-        description="for pixel art",
-        hf_model_id="PublicPrompts/All-In-One-Pixel-Model",
-        use_safetensors=False,
-        sampler="DDIM",
-        guidance_scale=10.0,
-        prompt_suffix=",full body game asset, in pixelsprite style",
-    ),
-    "par": ModelInfo(
-        name="PixelArt.Redmond (SD1.5 LoRA)",
-        description="SD1.5 向けドット絵キャラ特化LoRA",
-        hf_model_id="runwayml/stable-diffusion-v1-5",
-        hf_lora_id="artificialguybr/pixelartredmond-1-5v-pixel-art-loras-for-sd-1-5",
-        # use_lcm=True,
-        prompt_suffix=", pixel art, PixArFK,",
-    ),
-}
-"""
-# https://huggingface.co/artificialguybr/pixelartredmond-1-5v-pixel-art-loras-for-sd-1-5
-"""
-
-MODEL_ID_LCM = "latent-consistency/lcm-lora-sdv1-5"
 
 def get_best_device() -> torch.device:
     """
@@ -106,6 +60,143 @@ def get_best_device() -> torch.device:
         logger.info("CPUのみ利用可能です。")
         return torch.device("cpu")
 
+def configure_torch_threads(num_threads: int | None, interop_threads: int | None = None) -> None:
+    """
+    このプロセスでtorchが使うスレッド数を設定する
+    :param num_threads: intra-opスレッド数（Noneなら変更しない）
+    :param interop_threads: inter-opスレッド数（Noneなら変更しない）。torchで並列処理を始める前にしか設定できない
+    """
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+    if interop_threads is not None:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            logger.warning(f"inter-opスレッド数を設定できませんでした: {e}")
+    logger.info(f"torchスレッド数: {torch.get_num_threads()} inter-op: {torch.get_num_interop_threads()}")
+
+def reset_device_peak_memory() -> None:
+    """
+    デバイスメモリの最大使用量の記録をリセットする（CUDAのみ）
+    """
+    if torch.cuda.is_available():
+        torch.cuda.reset_peak_memory_stats()
+
+def device_peak_memory() -> int | None:
+    """
+    デバイスメモリの使用量（バイト）。CUDAはreset_device_peak_memory以降の最大値、MPSは現在の確保量。CPUのみならNone
+    """
+    if torch.cuda.is_available():
+        return int(torch.cuda.max_memory_allocated())
+    if hasattr(torch.backends, "mps") and torch.backends.mps.is_available():
+        return int(torch.mps.driver_allocated_memory())
+    return None
+
+def dtype_name(model_info: ModelInfo, device: torch.device | None = None) -> str:
+    """
+    デバイスに合わせて使うdtype名。CPUではModelInfo.dtypeの代わりにperformance.cpu_dtypeを使い、
+    bfloat16はCPUが対応していなければfloat32にする
+    :param device: 配置先デバイス（Noneならデバイスを考慮せずModelInfo.dtype）
+    """
+    if device is None or device.type != "cpu":
+        return model_info.dtype
+    name = model_info.performance.cpu_dtype
+    if name == "bfloat16" and not torch.ops.mkldnn._is_mkldnn_bf16_supported():
+        logger.warning("このCPUはbfloat16に対応していないため、float32を使います。")
+        return "float32"
+    return name
+
+def torch_dtype(model_info: ModelInfo, device: torch.device | None = None) -> torch.dtype:
+    """
+    デバイスに合わせたdtype名（dtype_name）をtorch.dtypeに変換する
+    """
+    name = dtype_name(model_info, device)
+    dtype = getattr(torch, name, None)
+    if not isinstance(dtype, torch.dtype):
+        raise ValueError(f"不明なdtypeです: {name}")
+    return dtype
+
+def apply_performance_options(pipe: DiffusionPipeline, model_info: ModelInfo) -> None:
+    """
+    ModelInfo.performanceの速度向上の設定をパイプラインに適用する
+    """
+    options = model_info.performance
+    unet = getattr(pipe, "unet", None)
+    if options.channels_last:
+        for module in (unet, getattr(pipe, "vae", None)):
+            if module is not None:
+                module.to(memory_format=torch.channels_last)
+        logger.info("channels_lastのメモリ配置を使用します。")
+    if options.attention_slicing is not None:
+        pipe.enable_attention_slicing(options.attention_slicing)
+        logger.info(f"アテンションを分割して計算します: {options.attention_slicing}")
+    if options.compile_unet and unet is not None:
+        # 実際のコンパイルは最初の推論で行われ、以後はキャッシュしたパイプラインごと使い回す
+        pipe.unet = torch.compile(unet, mode=options.compile_mode)  # type: ignore[attr-defined]
+        logger.info(f"UNetをtorch.compileします: mode={options.compile_mode}")
+
+def use_memory_plan(pipe: DiffusionPipeline, model_info: ModelInfo, size: tuple[int, int], batch_size: int) -> MemoryPlan:
+    """
+    生成サイズとバッチの枚数に合わせて、VAEの分割・タイル化を切り替える（キャッシュしたパイプラインを使い回すので毎回設定する）
+    :return: 省メモリ設定とメモリ使用量の見積もり（UNetの領域分けはtiled_unetで行う）
+    """
+    plan = plan_memory(model_info, size[0], size[1], batch_size)
+    vae = getattr(pipe, "vae", None)
+    if vae is not None and hasattr(vae, "enable_tiling"):
+        vae.enable_slicing() if plan.vae_slicing else vae.disable_slicing()
+        vae.enable_tiling() if plan.vae_tiling else vae.disable_tiling()
+    return plan
+
+
+def _tile_starts(length: int, tile: int, stride: int) -> list[int]:
+    if length <= tile:
+        return [0]
+    return [*range(0, length - tile, stride), length - tile]
+
+
+@contextlib.contextmanager
+def tiled_unet(pipe: DiffusionPipeline, tile: int | None, overlap: int):
+    """
+    この中でのUNetの呼び出しを、潜在表現を重なりのある領域に分けて1領域ずつ行い、重なりを平均して1つのノイズ予測にする
+    （MultiDiffusionと同じ方式）。UNetのメモリは領域の大きさで決まる
+    :param tile: 領域の辺（画素。Noneまたは潜在表現が領域以下なら分けない）
+    :param overlap: 隣り合う領域の重なり（画素）
+    """
+    unet = getattr(pipe, "unet", None)
+    if tile is None or unet is None:
+        yield
+        return
+    factor = pipe.vae_scale_factor  # type: ignore[attr-defined]
+    # UNetの3回のダウンサンプルで割り切れるよう、潜在表現での辺は8の倍数にする
+    tile_latent = max(8, tile // factor // 8 * 8)
+    stride = max(8, tile_latent - overlap // factor)
+    had_forward = "forward" in unet.__dict__
+    original = unet.forward
+
+    def forward(sample: torch.Tensor, timestep: Any, *args: Any, return_dict: bool = True, **kwargs: Any) -> Any:
+        height, width = sample.shape[-2:]
+        if height <= tile_latent and width <= tile_latent:
+            return original(sample, timestep, *args, return_dict=return_dict, **kwargs)
+        noise = torch.zeros_like(sample)
+        count = torch.zeros((1, 1, height, width), dtype=sample.dtype, device=sample.device)
+        for y in _tile_starts(height, tile_latent, stride):
+            for x in _tile_starts(width, tile_latent, stride):
+                region = (..., slice(y, y + tile_latent), slice(x, x + tile_latent))
+                noise[region] += original(sample[region], timestep, *args, return_dict=False, **kwargs)[0]
+                count[region] += 1
+        noise = noise / count
+        return UNet2DConditionOutput(sample=noise) if return_dict else (noise,)
+
+    unet.forward = forward
+    try:
+        yield
+    finally:
+        # torch.compileしたUNetはインスタンスにforwardを持つので元に戻す
+        if had_forward:
+            unet.forward = original
+        else:
+            del unet.forward
+
 def make_dummy_image( output_file:str, size: tuple[int, int], resize_to: tuple[int, int] | None = None, ):
     try:
         placeholder_size = resize_to if resize_to is not None else size
@@ -121,6 +212,99 @@ def make_dummy_image( output_file:str, size: tuple[int, int], resize_to: tuple[i
         logger.warning(f"プレースホルダー画像の保存に失敗しました: {e}")
 
 
+def make_scheduler(sampler: str, config: Any) -> Any:
+    """
+    サンプラー名（samplers.SAMPLERSのキー）のスケジューラーを、既存のスケジューラーの設定から作る
+    :raises ValueError: 不明なサンプラー名の場合
+    """
+    preset = SAMPLERS.get(sampler)
+    if preset is None:
+        raise ValueError(f"不明なサンプラーです: {sampler}（{', '.join(SAMPLERS)}のいずれか）")
+    scheduler_class = getattr(diffusers_schedulers, preset.scheduler)
+    return scheduler_class.from_config(config, **preset.config)
+
+# パイプラインごとに作ったスケジューラー（サンプラー名 -> スケジューラー。Noneはロード時のスケジューラー）
+_schedulers: weakref.WeakKeyDictionary[Any, dict[str | None, Any]] = weakref.WeakKeyDictionary()
+
+def use_scheduler(pipe: DiffusionPipeline, sampler: str | None) -> None:
+    """
+    キャッシュしたパイプラインのスケジューラーを切り替える。作ったスケジューラーはパイプラインごとに使い回す
+    :param sampler: samplers.SAMPLERSのキー（Noneならロード時のスケジューラーに戻す）
+    """
+    if sampler is None and pipe not in _schedulers:
+        # 一度も切り替えていなければロード時のスケジューラーのまま
+        return
+    schedulers = _schedulers.setdefault(pipe, {None: pipe.scheduler})
+    scheduler = schedulers.get(sampler)
+    if scheduler is None:
+        scheduler = make_scheduler(sampler, schedulers[None].config)  # type: ignore[arg-type]
+        schedulers[sampler] = scheduler
+    pipe.scheduler = scheduler
+
+def load_pipeline(model_info: ModelInfo, device: torch.device) -> DiffusionPipeline:
+    """
+    モデルを読み込み、サンプラーの差し替えとLoRAの適用まで済ませたパイプラインを返す
+    :param model_info: モデル情報
+    :param device: 配置先デバイス
+    :return: パイプライン
+    """
+    if os.path.isdir("/fs/hdd1/hugging_face_cache"):
+        logger.info("Hugging Face キャッシュディレクトリを設定: /fs/hdd1/hugging_face_cache")
+        os.environ["HF_HOME"] = "/fs/hdd1/hugging_face_cache"
+    logger.info("モデル読み込み中...")
+
+    pipe = DiffusionPipeline.from_pretrained(
+        model_info.hf_model_id,
+        safety_checker=None,
+        torch_dtype=torch_dtype(model_info, device),
+        use_safetensors=model_info.use_safetensors,
+        
+    ).to(device)
+    logger.info(f"Pipeline: {type(pipe)}")
+    assert isinstance(pipe, (StableDiffusionPipeline, LatentConsistencyModelPipeline, PixArtAlphaPipeline)), f"Expected Pipeline, got {type(pipe)}"
+
+    if model_info.sampler:
+        logger.info(f"{model_info.sampler}サンプラーを使用します。")
+        pipe.scheduler = make_scheduler(model_info.sampler, pipe.scheduler.config)
+
+    # LoRA
+    adapters=[]
+    if model_info.hf_lora_id:
+        logger.info(f"LoRA を読み込み: {model_info.hf_lora_id}")
+        pipe.load_lora_weights(model_info.hf_lora_id, adapter_name="lora-1")
+        adapters.append("lora-1")
+
+    if model_info.use_lcm:
+        lcm_lora_id = model_info.lcm_lora_id or MODEL_ID_LCM
+        logger.info(f"Latent Consistency Model (LCM) を読み込み: {lcm_lora_id}")
+        pipe.load_lora_weights(lcm_lora_id, adapter_name="pixel")
+        adapters.append("pixel")
+        pipe.scheduler = make_scheduler("LCM", pipe.scheduler.config)
+
+    if adapters:
+        logger.info(f"LoRA アダプターを適用: {', '.join(adapters)}")
+        pipe.set_adapters(adapters)
+
+    apply_performance_options(pipe, model_info)
+    return pipe
+
+
+def _supports_prompt_embeds(pipe: Any) -> bool:
+    return isinstance(pipe, (StableDiffusionPipeline, LatentConsistencyModelPipeline))
+
+
+def encode_prompt_cached(pipe: Any, pipeline_key: PipelineKey, text: str, device: torch.device, embedding_cache: EmbeddingCache) -> torch.Tensor:
+    """
+    プロンプト1件をテキストエンコーダで埋め込みに変換する。同じモデル・同じ文字列はキャッシュを使う
+    :param pipeline_key: パイプラインキャッシュのキー
+    :return: (1, トークン数, 次元数) のprompt_embeds
+    """
+    def encode() -> torch.Tensor:
+        with torch.no_grad():
+            return pipe.encode_prompt(text, device, 1, False)[0]
+    return embedding_cache.get_or_encode((*pipeline_key, text), encode)
+
+
 def generate_image(
     prompt: str,
     output_file: str,
@@ -129,167 +313,415 @@ def generate_image(
     steps: int = 0,
     resize_to: tuple[int, int] | None = None,
     pixel_art_mode: Literal[None, 32, 48, 64, 128, 256, 512] = None,
+    pipeline_cache: PipelineCache | None = None,
+    pixel_art_options: PixelArtOptions | None = None,
+    seed: int | None = None,
+    timings: dict[str, Any] | None = None,
+    speed: SpeedTier = "quality",
 ):
+    generate_images(
+        [prompt],
+        [output_file],
+        model_id_key=model_id_key,
+        size=size,
+        steps=steps,
+        resize_to=resize_to,
+        pixel_art_mode=pixel_art_mode,
+        pipeline_cache=pipeline_cache,
+        pixel_art_options=pixel_art_options,
+        seeds=[seed],
+        timings=timings,
+        speed=speed,
+    )
+
+
+# デバッグ用プロンプト（"debug"を含む）で模擬するステップ数
+DEBUG_STEPS = 10
+
+# キャンセルで中断した画像のエラーメッセージ
+CANCELLED_MESSAGE = "キャンセルされました。"
+
+
+class GenerationCancelled(Exception):
+    """
+    should_cancelがTrueを返したため生成を中断した
+    """
+
+
+def make_generators(seeds: list[int | None]) -> list[torch.Generator]:
+    """
+    画像ごとの乱数生成器を作る。デバイスによらず同じ結果になるようCPUの生成器を使う
+    :param seeds: 画像ごとのシード（Noneの画像は毎回異なる乱数）
+    """
+    generators = []
+    for seed in seeds:
+        generator = torch.Generator(device="cpu")
+        if seed is None:
+            generator.seed()
+        else:
+            generator.manual_seed(int(seed))
+        generators.append(generator)
+    return generators
+
+
+def decode_pixel_art_latents(pipe: DiffusionPipeline, latents: torch.Tensor, pixel_art_size: int, resolution: PixelArtResolution) -> list[Image.Image]:
+    """
+    output_type="latent"で受け取った潜在表現を、ピクセルアート化する前の画像にする
+    :param latents: (B, C, H/f, W/f) の潜在表現（fはVAEの縮小率）
+    :param pixel_art_size: ピクセルアートのサイズ
+    :param resolution: デコードの方法（resolution.decode）と、reducedで残す出力1ピクセルあたりの画素数（resolution.min_block）
+    :return: バッチの画像ごとのPIL画像
+    """
+    if resolution.decode == "latent":
+        if supports_preview(latents):
+            # 解像度は生成サイズの1/fになる。ピクセルアートのサイズより小さい場合は最近傍で拡大する
+            images = latents_to_images(latents)
+            return [image if min(image.size) >= pixel_art_size else image.resize((pixel_art_size, pixel_art_size), resample=Image.NEAREST) for image in images]  # type: ignore[attr-defined]
+        logger.warning(f"潜在表現からRGBへの変換に対応していないため、VAEでデコードします: shape={tuple(latents.shape)}")
+    elif resolution.decode == "reduced":
+        target = max(1, pixel_art_size * resolution.min_block // pipe.vae_scale_factor)  # type: ignore[attr-defined]
+        if target < latents.shape[-1] or target < latents.shape[-2]:
+            latents = torch.nn.functional.interpolate(latents, size=(min(target, latents.shape[-2]), min(target, latents.shape[-1])), mode="area")
+    vae = pipe.vae  # type: ignore[attr-defined]
+    with torch.no_grad():
+        decoded = vae.decode(latents.to(vae.dtype) / vae.config.scaling_factor, return_dict=False)[0]
+    return pipe.image_processor.postprocess(decoded, output_type="pil")  # type: ignore[attr-defined]
+
+
+def generate_images(
+    prompts: list[str],
+    output_files: list[str],
+    model_id_key: str = "default",
+    size: tuple[int, int] = (512, 512),
+    steps: int = 0,
+    resize_to: tuple[int, int] | None = None,
+    pixel_art_mode: Literal[None, 32, 48, 64, 128, 256, 512] = None,
+    pipeline_cache: PipelineCache | None = None,
+    pixel_art_options: PixelArtOptions | None = None,
+    embedding_cache: EmbeddingCache | None = None,
+    seeds: list[int | None] | None = None,
+    progress: Callable[[int, int], None] | None = None,
+    should_cancel: Callable[[], bool] | None = None,
+    preview: Callable[[int, int, Image.Image], None] | None = None,
+    preview_interval: int = 0,
+    timings: dict[str, Any] | None = None,
+    speed: SpeedTier = "quality",
+    encoded: dict[int, bytes] | None = None,
+) -> list[str | None]:
+    """
+    同じモデル・サイズの複数プロンプトを1回のパイプライン呼び出しでまとめて生成する
+    :param prompts: プロンプトのリスト
+    :param output_files: プロンプトごとの出力ファイル（promptsと同じ長さ）
+    :param pixel_art_mode: ピクセルアート化サイズ。指定するとsizeは使わず、ModelInfo.pixel_artで決めた生成サイズで生成する
+    :param pixel_art_options: ピクセルアート化の設定（Noneなら既定値）
+    :param embedding_cache: プロンプト埋め込みのキャッシュ（Noneならこの呼び出しの間だけ使う）
+    :param seeds: プロンプトごとの乱数シード（Noneなら毎回異なる乱数）。バッチにまとめても1枚ずつ生成した場合と同じ画像になる
+    :param progress: デノイズの1ステップごとに (完了したステップ数, 総ステップ数) で呼ばれるコールバック
+    :param should_cancel: モデルのロード前とステップごとに呼ばれ、Trueを返すと生成を中断する（エラーはCANCELLED_MESSAGE）
+    :param preview: preview_intervalステップごとに (プロンプトの番号, 完了したステップ数, プレビュー画像) で呼ばれるコールバック。
+        プレビューは潜在表現を線形にRGBへ写した生成サイズの1/8の画像で、VAEのデコードはしない
+    :param preview_interval: プレビューを作るステップ間隔（0ならプレビューを作らない）
+    :param timings: 渡すと段階ごとの所要秒数を書き込む（"load", "encode", "denoise", "decode", "resize", "save" と、
+        ステップごとの秒数のリスト "step_seconds"）。実行しなかった段階のキーは書かない
+    :param speed: 速度の段階（samplers.plan_samplingでサンプラー・ステップ数を決める）。
+        turboではLCM-LoRAを付けたパイプラインを別にロードしてキャッシュする。LatentConsistencyModelPipelineのモデルは常に自身の設定で生成する
+    :param encoded: 渡すと保存した画像のバイト列を出力の番号ごとに書き込む
+    :return: 出力ごとのエラーメッセージ（成功したものはNone）
+    """
+    if len(prompts) != len(output_files):
+        raise ValueError("promptsとoutput_filesの長さが一致しません。")
+    if seeds is None:
+        seeds = [None] * len(prompts)
+    elif len(seeds) != len(prompts):
+        raise ValueError("promptsとseedsの長さが一致しません。")
     if pixel_art_mode is not None and resize_to is not None:
         raise ValueError("resize_toとpixel_art_modeは同時に指定できません。どちらか一方のみ指定してください。")
     elif pixel_art_mode is not None:
-        if model_id_key not in MODEL_IDS:
-            model_id_key = "p1"
-        size = (512, 512)
         resize_to = (int(pixel_art_mode), int(pixel_art_mode))
-    else:
-        if model_id_key not in MODEL_IDS:
-            model_id_key = "s2"
+    model_id_key = resolve_model_key(model_id_key, pixel_art_mode)
+
+    errors: list[str | None] = [None] * len(prompts)
+    if timings is None:
+        timings = {}
+
+    def fail(indices: list[int], message: str) -> list[str | None]:
+        logger.error(message)
+        for i in indices:
+            errors[i] = message
+        return errors
 
     model_info = MODEL_IDS.get(model_id_key)
     if model_info is None:
-        logger.error(f"モデルID '{model_id_key}' が見つかりません。")
-        return
+        return fail(list(range(len(prompts))), f"モデルID '{model_id_key}' が見つかりません。")
+    if pixel_art_mode is not None:
+        # 出力は小さいので、モデルが崩れずに生成できる小さめのサイズで生成する
+        generation_size = model_info.pixel_art.generation_size(int(pixel_art_mode))
+        size = (generation_size, generation_size)
 
+    plan = plan_sampling(model_info, speed)
     if steps <= 0:
-        steps = model_info.num_inference_steps or 10
+        steps = plan.steps or 10
 
-    logger.info(f"プロンプト: {prompt}")
+    for prompt in prompts:
+        logger.info(f"プロンプト: {prompt}")
     logger.info(f"生成サイズ: {size[0]}x{size[1]}")
     if pixel_art_mode is not None:
-        logger.info(f"ピクセルアート化サイズ: {pixel_art_mode}x{pixel_art_mode}")
+        logger.info(f"ピクセルアート化サイズ: {pixel_art_mode}x{pixel_art_mode} デコード: {model_info.pixel_art.decode}")
     elif resize_to is not None:
         logger.info(f"リサイズ後のサイズ: {resize_to[0]}x{resize_to[1]}")
     logger.info(f"モデル: {model_info.hf_model_id}")
     logger.info(f"{model_info.description}")
-    logger.info(f"数値タイプ: {model_info.dtype}")
-    logger.info(f"推論ステップ数: {steps}")
-    logger.info(f"出力ファイル: {output_file}")
+    device = get_best_device()
+    logger.info(f"数値タイプ: {dtype_name(model_info, device)}")
+    logger.info(f"推論ステップ数: {steps} speed={speed} サンプラー: {plan.sampler or '既定'}{' +LCM-LoRA' if plan.lcm_lora else ''}")
+    logger.info(f"バッチサイズ: {len(prompts)}")
+    for output_file in output_files:
+        logger.info(f"出力ファイル: {output_file}")
 
     # プレースホルダー画像のサイズを決定
-    make_dummy_image(output_file, size, resize_to)
+    for output_file in output_files:
+        make_dummy_image(output_file, size, resize_to)
 
-    if "debug" in prompt:
-        time.sleep(3)
-        dummy_image = Image.new("RGB", size, (128, 128, 128))
-        dummy_image.save(output_file)
-        logger.debug(f"ダミー画像を保存しました: {output_file}")
-        return
-    device = get_best_device()
+    def cancelled() -> bool:
+        return should_cancel is not None and should_cancel()
 
-    if os.path.isdir("/fs/hdd1/hugging_face_cache"):
-        logger.info("Hugging Face キャッシュディレクトリを設定: /fs/hdd1/hugging_face_cache")
-        os.environ["HF_HOME"] = "/fs/hdd1/hugging_face_cache"
-    logger.info("モデル読み込み中...")
+    def wants_preview(step: int, total: int) -> bool:
+        # 最後のステップは完成画像があるのでプレビューを作らない
+        return preview is not None and preview_interval > 0 and step % preview_interval == 0 and step < total
 
-    try:
-        pipe = DiffusionPipeline.from_pretrained(
-            model_info.hf_model_id,
-            safety_checker=None,
-            torch_dtype=model_info.dtype,
-            use_safetensors=model_info.use_safetensors,
-            
-        ).to(device)
-        logger.info(f"Pipeline: {type(pipe)}")
-        assert isinstance(pipe, (StableDiffusionPipeline, LatentConsistencyModelPipeline, PixArtAlphaPipeline)), f"Expected Pipeline, got {type(pipe)}"
-
-        if model_info.sampler == "DDIM":
-            logger.info("DDIMサンプラーを使用します。")
-            pipe.scheduler = DDIMScheduler.from_config(pipe.scheduler.config)
-
-        # LoRA
-        adapters=[]
-        if model_info.hf_lora_id:
-            logger.info(f"LoRA を読み込み: {model_info.hf_lora_id}")
-            pipe.load_lora_weights(model_info.hf_lora_id, adapter_name="lora-1")
-            adapters.append("lora-1")
-
-        if model_info.use_lcm:
-            logger.info(f"Latent Consistency Model (LCM) を読み込み: {MODEL_ID_LCM}")
-            pipe.load_lora_weights(MODEL_ID_LCM, adapter_name="pixel")
-            adapters.append("pixel")
-            steps=4
-
-        if adapters:
-            logger.info(f"LoRA アダプターを適用: {', '.join(adapters)}")
-            pipe.set_adapters(adapters)
+    if cancelled():
+        return fail(list(range(len(prompts))), CANCELLED_MESSAGE)
+
+    debug_indices = [i for i, prompt in enumerate(prompts) if "debug" in prompt]
+    if debug_indices:
+        # 推論の代わりに、DEBUG_STEPSステップで合計3秒かかる処理を模擬する
+        for step in range(DEBUG_STEPS):
+            time.sleep(3 / DEBUG_STEPS)
+            if cancelled():
+                return fail(list(range(len(prompts))), CANCELLED_MESSAGE)
+            if progress is not None:
+                progress(step + 1, DEBUG_STEPS)
+            if wants_preview(step + 1, DEBUG_STEPS):
+                for i in debug_indices:
+                    preview(i, step + 1, Image.new("RGB", (size[0] // 8, size[1] // 8), (128, 128, 128)))  # type: ignore
+        for i in debug_indices:
+            dummy_image = Image.new("RGB", size, (128, 128, 128))
+            data = save_image(dummy_image, output_files[i])
+            if encoded is not None:
+                encoded[i] = data
+            logger.debug(f"ダミー画像を保存しました: {output_files[i]}")
+    indices = [i for i in range(len(prompts)) if i not in debug_indices]
+    if not indices:
+        return errors
+
+    load_info = model_info
+    if plan.lcm_lora and not model_info.use_lcm:
+        # LCM-LoRAを付けたパイプラインは、付けていないものとは別にキャッシュする
+        load_info = dataclasses.replace(model_info, use_lcm=True)
+    load_dtype = dtype_name(model_info, device)
+    cache_key = PipelineCache.make_key(pipeline_model_key(model_id_key, plan), load_dtype, device)
+    if embedding_cache is None:
+        embedding_cache = EmbeddingCache()
 
+    def load() -> DiffusionPipeline:
+        pipe = load_pipeline(load_info, device)
+        # 固定のネガティブプロンプトはロード時に埋め込みを計算しておく（CFGを使わないLCMでは不要）
+        if _supports_prompt_embeds(pipe) and not isinstance(pipe, LatentConsistencyModelPipeline):
+            encode_prompt_cached(pipe, cache_key, model_info.negave_prompt, device, embedding_cache)
+        return pipe
+
+    t0 = time.perf_counter()
+    try:
+        if pipeline_cache is not None:
+            pipe = pipeline_cache.get_or_load(cache_key, load, nbytes_hint=estimate_model_bytes(load_dtype))
+            logger.info(f"パイプラインキャッシュ: {pipeline_cache.stats()}")
+        else:
+            pipe = load()
     except Exception as e:
-        logger.error(f"モデルの読み込みに失敗しました: {e}")
-        return
-    
+        return fail(indices, f"モデルの読み込みに失敗しました: {e}")
+    timings["load"] = time.perf_counter() - t0
+
     try:
-        logger.info(f"画像生成中... Prompt: {prompt}")
-        promptx = prompt
-        if model_info.prompt_prefix:
-            promptx = f"{model_info.prompt_prefix} {prompt}"
-        if model_info.prompt_suffix:
-            promptx = f"{promptx} {model_info.prompt_suffix}"
-        negative_prompt = model_info.negave_prompt
+        promptx_list: list[str] = []
+        for i in indices:
+            logger.info(f"画像生成中... Prompt: {prompts[i]}")
+            promptx = prompts[i]
+            if model_info.prompt_prefix:
+                promptx = f"{model_info.prompt_prefix} {promptx}"
+            if model_info.prompt_suffix:
+                promptx = f"{promptx} {model_info.prompt_suffix}"
+            promptx_list.append(promptx)
+
+        t0 = time.perf_counter()
+        prompt_kwargs: dict[str, Any]
+        if _supports_prompt_embeds(pipe):
+            prompt_kwargs = {
+                "prompt_embeds": torch.cat([encode_prompt_cached(pipe, cache_key, text, device, embedding_cache) for text in promptx_list]),
+            }
+            # LCMパイプラインはCFGを使わないのでネガティブプロンプトは不要
+            if not isinstance(pipe, LatentConsistencyModelPipeline):
+                negative_embeds = encode_prompt_cached(pipe, cache_key, model_info.negave_prompt, device, embedding_cache)
+                prompt_kwargs["negative_prompt_embeds"] = negative_embeds.repeat(len(promptx_list), 1, 1)
+            logger.info(f"埋め込みキャッシュ: {embedding_cache.stats()}")
+        else:
+            prompt_kwargs = {"prompt": promptx_list, "negative_prompt": [model_info.negave_prompt] * len(promptx_list)}
+        timings["encode"] = time.perf_counter() - t0
 
         pipe.set_progress_bar_config(disable=True)  # プログレスバーを無効化
+        prompt_kwargs["generator"] = make_generators([seeds[i] for i in indices])
+        logger.info(f"シード: {[seeds[i] for i in indices]}")
 
         end_step:int = -1
-        def PipelineCallback( pipe, step:int, timestamp:int, *args, **kwargs) ->None:
+        # ステップが終わった時刻（先頭はパイプラインの呼び出し時刻）
+        step_times: list[float] = []
+        def PipelineCallback( pipe, step:int, timestamp:int, callback_kwargs:dict[str, Any]) -> dict[str, Any]:
+            step_times.append(time.perf_counter())
             if end_step>=0:
                 logger.info(f"progress {step}/{end_step}")
             else:
                 logger.info(f"progress {step}")
-            return {} # type: ignore
-
-        if isinstance(pipe, LatentConsistencyModelPipeline):
-            result = pipe(prompt=promptx, negative_prompt=negative_prompt, height=size[1], width=size[0],
-                num_inference_steps=6,
-                guidance_scale=8, 
-                lcm_origin_steps=50,
-                progress_bar=False,
-                #callback_on_step_end=custom_callback,
-            )
-        elif model_info.use_lcm:
-            result = pipe(prompt=promptx, negative_prompt=negative_prompt, height=size[1], width=size[0],
-                num_inference_steps=6,
-                guidance_scale=8, 
-                lcm_origin_steps=50,
-                progress_bar=False,
-                #callback_on_step_end=custom_callback,
-            )
-        else:
-            end_step = steps
-            result = pipe(prompt=promptx, negative_prompt=negative_prompt, height=size[1], width=size[0],
-                num_inference_steps=steps,
-                guidance_scale=model_info.guidance_scale or 7.0,
-                progress_bar=False,
-                callback_on_step_end=PipelineCallback, # type: ignore
-            )
-
-        image = getattr(result, "images", result[0])
-    except Exception as e:
-        logger.error(f"画像生成に失敗しました: {e}")
-        return
-    try:
-        if not isinstance(image, Image.Image):
-            if isinstance(image, torch.Tensor):
-                image = image.cpu().numpy()
-            elif not isinstance(image, np.ndarray):
-                image = np.array(image)
-            logger.info(f"{type(image)}, shape={getattr(image, 'shape', None)}")
-            while hasattr(image, "ndim") and image.ndim > 3:
-                image = np.squeeze(image, axis=0)
-            logger.info(f"{type(image)}, shape={getattr(image, 'shape', None)}")
-            image = Image.fromarray(image)
-    except Exception as e:
-        logger.error(f"画像の変換に失敗しました: {e}")
-        return
+            if cancelled():
+                # 例外でデノイズのループを抜ける
+                raise GenerationCancelled()
+            if progress is not None and end_step > 0:
+                progress(step + 1, end_step)
+            latents = callback_kwargs.get("latents")
+            if wants_preview(step + 1, end_step) and latents is not None and supports_preview(latents):
+                try:
+                    for i, image in zip(indices, latents_to_images(latents)):
+                        preview(i, step + 1, image)  # type: ignore
+                except Exception as e:
+                    logger.warning(f"プレビューの作成に失敗しました: {e}")
+            return {}
 
-    try:
-        if resize_to is not None:
-            resample = Image.NEAREST if pixel_art_mode else Image.LANCZOS  # type: ignore
-            image = image.resize(resize_to, resample=resample)
-            logger.info(f"画像をリサイズ: {resize_to[0]}x{resize_to[1]} (pixel_art_mode={pixel_art_mode})")
-    except Exception as e:
-        logger.error(f"画像のリサイズに失敗しました: {e}")
-        return
-    try:
-        image.save(output_file)
+        # ピクセルアート化でVAEのデコードを省く・縮めるときは、潜在表現のまま受け取って自前で画像にする
+        latent_decode = pixel_art_mode is not None and model_info.pixel_art.decode != "full"
+        if latent_decode:
+            prompt_kwargs["output_type"] = "latent"
+
+        memory = use_memory_plan(pipe, model_info, size, len(indices))
+        logger.info(f"メモリ見積もり: {memory.peak_bytes >> 20}MB vae_slicing={memory.vae_slicing} vae_tiling={memory.vae_tiling} unet_tile={memory.unet_tile}")
+
+        step_times.append(time.perf_counter())
+        with tiled_unet(pipe, memory.unet_tile, model_info.performance.unet_tile_overlap):
+            if isinstance(pipe, LatentConsistencyModelPipeline):
+                end_step = 6
+                result = pipe(**prompt_kwargs, height=size[1], width=size[0],
+                    num_inference_steps=6,
+                    guidance_scale=8, 
+                    lcm_origin_steps=50,
+                    progress_bar=False,
+                    callback_on_step_end=PipelineCallback, # type: ignore
+                )
+            else:
+                use_scheduler(pipe, plan.sampler)
+                end_step = steps
+                result = pipe(**prompt_kwargs, height=size[1], width=size[0],
+                    num_inference_steps=steps,
+                    guidance_scale=plan.guidance_scale or 7.0,
+                    progress_bar=False,
+                    callback_on_step_end=PipelineCallback, # type: ignore
+                )
+
+        # 最後のステップの後は、VAEのデコードと画像への変換
+        images = getattr(result, "images", None)
+        if images is None:
+            images = result[0]
+        if latent_decode:
+            images = decode_pixel_art_latents(pipe, images, int(pixel_art_mode), model_info.pixel_art)  # type: ignore[arg-type]
+        timings["denoise"] = step_times[-1] - step_times[0]
+        timings["step_seconds"] = [b - a for a, b in zip(step_times, step_times[1:])]
+        timings["decode"] = time.perf_counter() - step_times[-1]
+        if not isinstance(images, (list, tuple)):
+            images = [images] if len(indices) == 1 else list(images)
+        if len(images) != len(indices):
+            raise RuntimeError(f"生成枚数が一致しません: {len(images)} != {len(indices)}")
+    except GenerationCancelled:
+        return fail(indices, CANCELLED_MESSAGE)
     except Exception as e:
-        logger.error(f"画像の保存に失敗しました: {e}")
-        return
-    logger.info(f"[DONE] 保存完了: {output_file}")
+        return fail(indices, f"画像生成に失敗しました: {e}")
+
+    t0 = time.perf_counter()
+    converted: dict[int, Image.Image] = {}
+    for i, image in zip(indices, images):
+        try:
+            if not isinstance(image, Image.Image):
+                if isinstance(image, torch.Tensor):
+                    image = image.cpu().numpy()
+                elif not isinstance(image, np.ndarray):
+                    image = np.array(image)
+                logger.info(f"{type(image)}, shape={getattr(image, 'shape', None)}")
+                while hasattr(image, "ndim") and image.ndim > 3:
+                    image = np.squeeze(image, axis=0)
+                logger.info(f"{type(image)}, shape={getattr(image, 'shape', None)}")
+                image = Image.fromarray(image)
+            converted[i] = image
+        except Exception as e:
+            fail([i], f"画像の変換に失敗しました: {e}")
+
+    if pixel_art_mode is not None and converted:
+        try:
+            # ピクセルアート化はバッチ全体をまとめて処理する
+            keys = list(converted.keys())
+            pixelated = pixelate_images([converted[i] for i in keys], int(pixel_art_mode), pixel_art_options)
+            converted = dict(zip(keys, pixelated))
+            logger.info(f"ピクセルアート化: {pixel_art_mode}x{pixel_art_mode} ({len(keys)}枚)")
+        except Exception as e:
+            fail(list(converted.keys()), f"ピクセルアート化に失敗しました: {e}")
+            converted = {}
+
+    resized: dict[int, Image.Image] = {}
+    for i, image in converted.items():
+        try:
+            if resize_to is not None and pixel_art_mode is None:
+                image = image.resize(resize_to, resample=Image.LANCZOS)  # type: ignore
+                logger.info(f"画像をリサイズ: {resize_to[0]}x{resize_to[1]}")
+            resized[i] = image
+        except Exception as e:
+            fail([i], f"画像のリサイズに失敗しました: {e}")
+    timings["resize"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for i, image in resized.items():
+        output_file = output_files[i]
+        try:
+            data = save_image(image, output_file)
+        except Exception as e:
+            fail([i], f"画像の保存に失敗しました: {e}")
+            continue
+        if encoded is not None:
+            encoded[i] = data
+        logger.info(f"[DONE] 保存完了: {output_file}")
+    timings["save"] = time.perf_counter() - t0
+    return errors
+
+WARMUP_SIZE: tuple[int, int] = (64, 64)
+
+def warm_up_model(model_id_key: str, pipeline_cache: PipelineCache, embedding_cache: EmbeddingCache | None = None) -> float:
+    """
+    モデルをロードしてパイプラインキャッシュに載せ、小さなサイズで1ステップだけ推論して初回実行のコストを済ませる
+    :param model_id_key: MODEL_IDSのキー
+    :return: ロードと推論にかかった秒数
+    :raises ValueError: モデルキーが存在しない場合
+    :raises RuntimeError: ロード・推論に失敗した場合
+    """
+    if model_id_key not in MODEL_IDS:
+        raise ValueError(f"モデルID '{model_id_key}' が見つかりません。")
+    t0 = time.perf_counter()
+    with tempfile.TemporaryDirectory() as work_dir:
+        errors = generate_images(
+            ["warm up"],
+            [os.path.join(work_dir, "warmup.png")],
+            model_id_key=model_id_key,
+            size=WARMUP_SIZE,
+            steps=1,
+            pipeline_cache=pipeline_cache,
+            embedding_cache=embedding_cache,
+            seeds=[0],
+        )
+    if errors[0] is not None:
+        raise RuntimeError(errors[0])
+    return time.perf_counter() - t0
 
 def parse_size(size_str: str) -> tuple[int, int]:
     """WIDTHxHEIGHT形式の文字列を(int, int)に変換"""
@@ -1,16 +1,19 @@
 from __future__ import annotations
 
+from collections import deque
+from dataclasses import asdict, dataclass, field
 from enum import Enum
+import math
 import os
+import queue
 import shutil
 
 import time
 import json
-from typing import Any, ClassVar, Literal
+from typing import Any, Callable, ClassVar, Literal
 import uuid
 
-from datetime import datetime
-from pathlib import Path
+from datetime import datetime, timedelta
 
 import multiprocessing
 import threading
@@ -18,11 +21,35 @@ import threading
 from typing import Any
 
 from pydantic import BaseModel
-from .image_generator import generate_image
+from .image_output import ImageBytesCache, ImageFormat, convert_image, discard_shared_bytes, share_bytes, take_shared_bytes
+from .job_index import JobIndex
+from .job_journal import JobJournal
+from .job_scheduler import JobScheduler, SchedulingPolicy, job_cost
+from .job_metrics import JobMetrics, MetricsSnapshot, peak_rss_bytes, stage_timings
+from .memory_budget import fit_to_budget, max_batch_size, plan_memory
+from .models import MODEL_IDS, ModelInfo, resolve_model_key
+from .pipeline_cache import EmbeddingCache, PipelineCache
+from .pixel_engine import PixelArtOptions
+from .result_store import ResultStore, make_request_key
+from .samplers import SpeedTier, effective_speed, pipeline_model_key, plan_sampling
+from .sprite_sheet import ATLAS_FILE, MAX_VARIANTS, assemble_sprite_sheet, export_sprite_sheet, frame_files, split_sprite_sheet
+from .retention import FINISHED_STATUSES, PurgeResult, RetentionPolicy, StorageStats, measure_dir, measure_unmeasured, remeasure_shared, select_expired
 
 import logging
 logger = logging.getLogger(__name__)
 
+# シードを省略したジョブに使うシード。同じ条件の要求は同じ画像になり、生成済みの結果を再利用できる
+DEFAULT_SEED = 0
+# サーバーが止まって中断されたジョブのエラーメッセージ
+INTERRUPTED_MESSAGE = "サーバーの停止によりジョブが中断されました"
+# ワーカープロセスが異常終了して中断されたジョブのエラーメッセージ
+WORKER_DIED_MESSAGE = "ワーカープロセスが異常終了したためジョブが中断されました"
+# ワーカープロセスが生きているか確認する間隔（秒）
+WORKER_CHECK_INTERVAL = 1.0
+# ワーカープロセスの起動方法。異常終了したワーカーはイベント処理・保持ポリシー・ジャーナルのfsyncのスレッドが
+# 動いている間に起動し直すので、それらが持つロックやSQLiteの接続をforkで引き継がないようspawnにする
+_MP_CONTEXT = multiprocessing.get_context("spawn")
+
 
 class JobStatus(Enum):
     not_start = "not_start"
@@ -40,15 +67,60 @@ class ImageJobInfo(BaseModel):
     prompt: str
     image_width: int | None = None
     image_height: int | None = None
+    # メモリの上限に収めるため要求より小さく生成する場合の生成サイズ（出力は要求サイズに拡大する。Noneなら要求サイズで生成する）
+    generation_width: int | None = None
+    generation_height: int | None = None
+    # 投入時に見積もった生成時の最大メモリ使用量（バイト。WorkerConfig.memory_budget_bytesを指定した場合）
+    memory_estimate_bytes: int | None = None
     pixel_art_size: Literal[None, 32, 48, 64, 128] = None
+    model: str | None = None
+    seed: int | None = None
+    # バリエーションのジョブのフレームごとのシード（output.pngはフレームを並べたスプライトシートになる）
+    variant_seeds: list[int] | None = None
+    # バリエーションのジョブのアトラス（sprite_sheet.make_atlas。完了後に設定する）
+    atlas: dict[str, Any] | None = None
+    # メモリの上限に収めるため、バリエーションのジョブで1回のパイプライン呼び出しに生成するフレーム数（Noneなら全フレーム）
+    frames_per_call: int | None = None
+    # 速度の段階（samplers.SpeedTier）
+    speed: SpeedTier = "quality"
+    # ディスパッチの優先度（大きいほど先。WorkerConfig.schedulingで待ち時間に換算する）
+    priority: int = 0
+    # 投入したクライアント（クライアントごとの同時実行数の上限に使う。Noneなら上限なし）
+    client_id: str | None = None
+    # 生成条件から求めた内容アドレスのキー
+    request_key: str | None = None
+    # 生成済みの結果を再利用して完了したか
+    cached: bool = False
+    error: str | None = None
+    # 実行中の進捗（get_jobでワーカーからの通知をもとに設定する。完了後はNone）
+    current_step: int | None = None
+    total_steps: int | None = None
+    eta_seconds: float | None = None
+    # 実行中の最新のプレビュー画像（WorkerConfig.preview_intervalを指定した場合。完了後はNone）
+    preview_step: int | None = None
+    preview_path: str | None = None
+    # 段階ごとの所要時間（秒）。job_metrics.JOB_STAGESのうち実行した段階を記録する（stepは1ステップの平均）。
+    # バッチにまとめて生成したジョブは、キュー待ち以外はバッチ全体の値になる
+    timings: dict[str, float] | None = None
+    # 実行したワーカーの最大常駐メモリと、デバイスメモリの最大使用量（バイト。CPUのみならNone）
+    peak_rss_bytes: int | None = None
+    device_peak_bytes: int | None = None
+    # 実行待ちの間の待ち順（1なら次に始まる）と開始時刻の見積もり（get_jobで設定する。実行を始めるとNone）
+    queue_position: int | None = None
+    estimated_start_time: str | None = None
 
     @staticmethod
-    def new_image(prompt:str, width:int, height:int) -> ImageJobInfo:
+    def new_image(prompt:str, width:int, height:int, model:str|None=None, seed:int|None=None, speed:SpeedTier="quality", priority:int=0, client_id:str|None=None) -> ImageJobInfo:
         """
         新しい画像生成ジョブを作成する
         :param prompt: 生成する画像のプロンプト
         :param width: 画像の幅
         :param height: 画像の高さ
+        :param model: 使用するモデルキー（Noneなら既定のモデル）
+        :param seed: 乱数シード（NoneならDEFAULT_SEED）
+        :param speed: 速度の段階
+        :param priority: ディスパッチの優先度
+        :param client_id: 投入したクライアント
         :param output_path: 出力先パス
         :return: ImageJobInfoインスタンス
         """
@@ -60,14 +132,24 @@ class ImageJobInfo(BaseModel):
             prompt=prompt,
             image_width=width,
             image_height=height,
+            model=model,
+            seed=DEFAULT_SEED if seed is None else seed,
+            speed=speed,
+            priority=priority,
+            client_id=client_id,
         )
 
     @staticmethod
-    def new_pixelart(prompt:str, pixel_art_size:Literal[None, 32, 48, 64, 128]) -> ImageJobInfo:
+    def new_pixelart(prompt:str, pixel_art_size:Literal[None, 32, 48, 64, 128], model:str|None=None, seed:int|None=None, speed:SpeedTier="quality", priority:int=0, client_id:str|None=None) -> ImageJobInfo:
         """
         新しいピクセルアート生成ジョブを作成する
         :param prompt: 生成するピクセルアートのプロンプト
         :param pixel_art_size: ピクセルアートのサイズ（32, 48, 64, 128）
+        :param model: 使用するモデルキー（Noneならピクセルアート向けの既定モデル）
+        :param seed: 乱数シード（NoneならDEFAULT_SEED）
+        :param speed: 速度の段階
+        :param priority: ディスパッチの優先度
+        :param client_id: 投入したクライアント
         :param output_path: 出力先パス
         :return: ImageJobInfoインスタンス
         """
@@ -78,8 +160,30 @@ class ImageJobInfo(BaseModel):
             start_time=datetime.now().astimezone().isoformat(),
             prompt=prompt,
             pixel_art_size=pixel_art_size,
+            model=model,
+            seed=DEFAULT_SEED if seed is None else seed,
+            speed=speed,
+            priority=priority,
+            client_id=client_id,
         )
 
+    @staticmethod
+    def new_variants(prompt:str, pixel_art_size:Literal[32, 48, 64, 128], seeds:list[int], model:str|None=None, speed:SpeedTier="quality", priority:int=0, client_id:str|None=None) -> ImageJobInfo:
+        """
+        同じプロンプトをシードを変えて生成し、スプライトシートにまとめるジョブを作成する
+        :param prompt: 生成するピクセルアートのプロンプト
+        :param pixel_art_size: ピクセルアートのサイズ（32, 48, 64, 128）
+        :param seeds: フレームごとの乱数シード（並べる順）
+        :param model: 使用するモデルキー（Noneならピクセルアート向けの既定モデル）
+        :param speed: 速度の段階
+        :param priority: ディスパッチの優先度
+        :param client_id: 投入したクライアント
+        :return: ImageJobInfoインスタンス
+        """
+        job_info = ImageJobInfo.new_pixelart(prompt, pixel_art_size, model=model, seed=seeds[0], speed=speed, priority=priority, client_id=client_id)
+        job_info.variant_seeds = list(seeds)
+        return job_info
+
     @staticmethod
     def load(job_json_path: str) -> ImageJobInfo:
         """
@@ -134,57 +238,796 @@ class ImageJobInfo(BaseModel):
 
     def save(self, job_json_path: str) -> None:
         """
-        ImageJobInfoインスタンスの内容をjob.jsonに保存する
+        ImageJobInfoインスタンスの内容をjob.jsonに保存する。書きかけのファイルが残らないよう一時ファイルから置き換える
         :param job_json_path: 保存先のjob.jsonパス
         """
-        with open(job_json_path, "w", encoding="utf-8") as f:
+        tmp_path = f"{job_json_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
             f.write(self.model_dump_json(indent=2))
+        os.replace(tmp_path, job_json_path)
     
-def _worker_main(job_queue: Any, jobs_dir: str, ready_event: Any) -> None:
+@dataclass
+class WorkerConfig:
+    """
+    ワーカープロセスの設定
+    """
+    # ロード済みパイプラインを保持する最大数
+    pipeline_cache_size: int = 2
+    # ロード済みパイプラインの合計バイト数の上限（Noneなら無制限）
+    pipeline_cache_bytes: int | None = None
+    # プロンプト埋め込みを保持する最大数
+    embedding_cache_size: int = 256
+    # 1回のパイプライン呼び出しにまとめる最大ジョブ数（1ならバッチ化しない）
+    max_batch_size: int = 4
+    # 先頭のジョブを取り出してから同条件のジョブを待つ時間（秒）
+    batch_window: float = 0.05
+    # ワーカープロセス数
+    num_workers: int = 1
+    # ワーカー1つあたりのtorchスレッド数（Noneなら num_workers>1 のときCPUコア数を等分する）
+    torch_threads: int | None = None
+    # ワーカー1つあたりのtorchのinter-opスレッド数（Noneならtorchの既定）
+    interop_threads: int | None = None
+    # 生成済み画像のストアの合計バイト数の上限（0なら結果を再利用しない）
+    result_cache_bytes: int = 1 << 30
+    # 起動時にロードして試し推論まで済ませておくモデル（MODEL_IDSのキー）
+    preload_models: list[str] = field(default_factory=list)
+    # マネージャーがメモリ上に保持する最近の出力画像の合計バイト数の上限（0ならワーカーから受け取らない）
+    output_cache_bytes: int = 64 << 20
+    # 何ステップごとにジョブディレクトリへpreview.pngを書き出すか（0ならプレビューを作らない）
+    preview_interval: int = 0
+    # 終了したジョブのディレクトリを削除する保持ポリシー（マネージャーのバックグラウンドスレッドで適用する）
+    retention: RetentionPolicy = field(default_factory=RetentionPolicy)
+    # ワーカー1つあたりのメモリの上限（バイト）。投入時に生成時のメモリを見積もり、上限を超える要求はmemory_policyに従って扱う。
+    # バッチにまとめる枚数も上限に収まる範囲にする（Noneなら見積もらない）
+    memory_budget_bytes: int | None = None
+    # 見積もりが上限を超える要求の扱い。"reject": ValueErrorで断る / "downgrade": 上限に収まるサイズで生成して要求サイズに拡大する
+    memory_policy: Literal["reject", "downgrade"] = "downgrade"
+    # ディスパッチ待ちのジョブの順序とクライアントごとの上限
+    scheduling: SchedulingPolicy = field(default_factory=SchedulingPolicy)
 
+    def resolved_torch_threads(self) -> int | None:
+        """
+        ワーカー1つあたりに割り当てるtorchスレッド数
+        """
+        if self.torch_threads is not None:
+            return max(1, self.torch_threads)
+        if self.num_workers > 1:
+            return max(1, (os.cpu_count() or 1) // self.num_workers)
+        return None
 
-    logger.info("[ImageJobManager] ワーカープロセス開始")
-    ready_event.set()
-    while True:
-        job_id = job_queue.get()
+
+def configure_torch_threads(num_threads: int | None, interop_threads: int | None = None) -> None:
+    """
+    torchのスレッド数を設定する（torchはワーカープロセスでのみ読み込む）
+    """
+    from .image_generator import configure_torch_threads as _configure_torch_threads
+    _configure_torch_threads(num_threads, interop_threads)
+
+
+def generate_images(*args: Any, **kwargs: Any) -> list[str | None]:
+    """
+    image_generator.generate_imagesを呼び出す（torch/diffusersはワーカープロセスで初めて使うときに読み込む）
+    """
+    from .image_generator import generate_images as _generate_images
+    return _generate_images(*args, **kwargs)
+
+
+def warm_up_model(*args: Any, **kwargs: Any) -> float:
+    """
+    image_generator.warm_up_modelを呼び出す（torch/diffusersはワーカープロセスで初めて使うときに読み込む）
+    """
+    from .image_generator import warm_up_model as _warm_up_model
+    return _warm_up_model(*args, **kwargs)
+
+
+def reset_device_peak_memory() -> None:
+    """
+    image_generator.reset_device_peak_memoryを呼び出す（torchはワーカープロセスでのみ読み込む）
+    """
+    from .image_generator import reset_device_peak_memory as _reset_device_peak_memory
+    _reset_device_peak_memory()
+
+
+def device_peak_memory() -> int | None:
+    """
+    image_generator.device_peak_memoryを呼び出す（torchはワーカープロセスでのみ読み込む）
+    """
+    from .image_generator import device_peak_memory as _device_peak_memory
+    return _device_peak_memory()
+
+
+def _batch_key(job_info: ImageJobInfo) -> tuple[Any, ...]:
+    """
+    同じパイプライン呼び出しにまとめられるジョブは同じキーになる。先頭はパイプラインキャッシュでのモデルのキー
+    """
+    if job_info.pixel_art_size is not None:
+        model_key = resolve_model_key(job_info.model, job_info.pixel_art_size)
+        plan = plan_sampling(MODEL_IDS[model_key], job_info.speed)
+        if job_info.variant_seeds:
+            # バリエーションのジョブはそれだけで1回のパイプライン呼び出しにする
+            return (pipeline_model_key(model_key, plan), "variants", job_info.job_id)
+        return (pipeline_model_key(model_key, plan), "pixel", job_info.pixel_art_size, effective_speed(MODEL_IDS[model_key], job_info.speed))
+    model_key = resolve_model_key(job_info.model)
+    plan = plan_sampling(MODEL_IDS[model_key], job_info.speed)
+    return (pipeline_model_key(model_key, plan), *_generation_size(job_info), job_info.image_width or 512, job_info.image_height or 512,
+            effective_speed(MODEL_IDS[model_key], job_info.speed))
+
+
+def _generation_size(job_info: ImageJobInfo) -> tuple[int, int]:
+    """
+    ジョブの生成サイズ。画像生成ジョブはメモリの上限に収めるため縮めた場合はそのサイズ、
+    ピクセルアートのジョブはモデルのPixelArtResolutionで決まるサイズ
+    """
+    if job_info.pixel_art_size is not None:
+        size = MODEL_IDS[resolve_model_key(job_info.model, job_info.pixel_art_size)].pixel_art.generation_size(job_info.pixel_art_size)
+        return size, size
+    return (job_info.generation_width or job_info.image_width or 512, job_info.generation_height or job_info.image_height or 512)
+
+
+def _job_cost(job_info: ImageJobInfo) -> float:
+    """
+    ジョブの重さの見積もり（job_scheduler.job_costの単位）
+    """
+    model_info = MODEL_IDS[resolve_model_key(job_info.model, job_info.pixel_art_size)]
+    steps = plan_sampling(model_info, job_info.speed).steps
+    return job_cost(steps, *_generation_size(job_info)) * len(job_info.variant_seeds or [None])
+
+
+def _batch_limit(job_info: ImageJobInfo, config: WorkerConfig) -> int:
+    """
+    ジョブを1回のパイプライン呼び出しにまとめられる最大数。メモリの上限を指定した場合は見積もりが収まる枚数まで
+    """
+    if job_info.variant_seeds:
+        return 1
+    if config.memory_budget_bytes is None:
+        return config.max_batch_size
+    model_info = MODEL_IDS[resolve_model_key(job_info.model, job_info.pixel_art_size)]
+    return max_batch_size(model_info, *_generation_size(job_info), config.memory_budget_bytes, config.max_batch_size)
+
+
+def _request_key(job_info: ImageJobInfo) -> str:
+    """
+    生成結果を決める条件（モデル・プロンプト・サイズ・ステップ数・シード・後処理）から内容アドレスのキーを求める
+    """
+    if job_info.pixel_art_size is not None:
+        model_key = resolve_model_key(job_info.model, job_info.pixel_art_size)
+        model_info = MODEL_IDS[model_key]
+        generation_size = model_info.pixel_art.generation_size(job_info.pixel_art_size)
+        size = [generation_size, generation_size]
+        post: dict[str, Any] | None = {
+            "pixel_art_size": job_info.pixel_art_size,
+            "options": asdict(PixelArtOptions()),
+            "resolution": asdict(model_info.pixel_art),
+        }
+    else:
+        model_key = resolve_model_key(job_info.model)
+        model_info = MODEL_IDS[model_key]
+        size = list(_generation_size(job_info))
+        post = None
+        if job_info.generation_width is not None or job_info.generation_height is not None:
+            post = {"resize_to": [job_info.image_width or 512, job_info.image_height or 512]}
+    request: dict[str, Any] = {
+        "model": model_key,
+        "hf_model_id": model_info.hf_model_id,
+        "hf_lora_id": model_info.hf_lora_id,
+        "prompt": job_info.prompt,
+        "size": size,
+        "steps": model_info.num_inference_steps,
+        "seed": job_info.seed,
+        "post": post,
+    }
+    if effective_speed(model_info, job_info.speed) != "quality":
+        # qualityは以前の要求と同じキーのままにして、生成済みの結果を使い続ける
+        plan = plan_sampling(model_info, job_info.speed)
+        request.update(steps=plan.steps, sampler=plan.sampler, lcm_lora_id=(model_info.lcm_lora_id if plan.lcm_lora else None))
+    if job_info.variant_seeds:
+        request["variant_seeds"] = job_info.variant_seeds
+    return make_request_key(request)
+
+
+class ImageJobSummary(BaseModel):
+    """
+    ジョブ一覧用の要約（詳細はget_jobで取得する）
+    """
+    PROMPT_LENGTH: ClassVar[int] = 80
+
+    job_id: str
+    status: JobStatus
+    start_time: str
+    elapsed: float | None = None
+    prompt: str
+    # 実行待ちのジョブの待ち順（1なら次に始まる）と開始時刻の見積もり
+    queue_position: int | None = None
+    estimated_start_time: str | None = None
+
+    @staticmethod
+    def from_row(row: dict[str, Any]) -> ImageJobSummary:
+        prompt = row["prompt"]
+        if len(prompt) > ImageJobSummary.PROMPT_LENGTH:
+            prompt = prompt[:ImageJobSummary.PROMPT_LENGTH - 1] + "…"
+        return ImageJobSummary(
+            job_id=row["job_id"],
+            status=JobStatus(row["status"]),
+            start_time=row["start_time"],
+            elapsed=row["elapsed"],
+            prompt=prompt,
+        )
+
+
+class JobListPage(BaseModel):
+    jobs: list[ImageJobSummary]
+    # 次のページを取得するためのカーソル（最終ページならNone）
+    next_cursor: str | None = None
+
+
+def _normalize_time(value: str | None) -> str | None:
+    """
+    ISO 8601の時刻を、start_timeと同じローカルタイムゾーン表記にそろえる
+    """
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).astimezone().isoformat()
+    except ValueError:
+        raise ValueError(f"時刻はISO 8601形式で指定してください: {value}")
+
+
+def _save_job(jobs_dir: str, job_info: ImageJobInfo, index: JobIndex | None, journal: JobJournal | None = None, view: str | None = "job.json") -> None:
+    """
+    状態遷移をジャーナルに追記してから、job.jsonとインデックスを更新する
+    :param journal: 状態遷移を記録するジャーナル（Noneなら記録しない）
+    :param view: 書き直すジョブディレクトリ内のファイル名（Noneならファイルは書き直さず、ジャーナルとインデックスだけ更新する）
+    """
+    data = job_info.model_dump(mode="json")
+    if journal is not None:
+        journal.append(data)
+    if view is not None:
+        job_info.save(os.path.join(jobs_dir, job_info.job_id, view))
+    if index is not None:
+        index.upsert_dict(data)
+
+
+def _queue_fields(estimate: tuple[int, float | None]) -> tuple[int, str | None]:
+    """
+    (待ち順, 開始までの秒数) を、ジョブ情報に設定する (待ち順, 開始時刻のISO 8601) にする
+    """
+    position, seconds = estimate
+    if seconds is None:
+        return position, None
+    return position, (datetime.now().astimezone() + timedelta(seconds=seconds)).isoformat(timespec="seconds")
+
+
+def _is_canceled(jobs_dir: str, job_id: str) -> bool:
+    """
+    キャンセル済みか（cancel_jobはjob.jsonをcancel.jsonに置き換える）
+    """
+    return os.path.isfile(os.path.join(jobs_dir, job_id, "cancel.json"))
+
+
+def _load_queued_job(jobs_dir: str, job_id: str) -> ImageJobInfo | None:
+    """
+    キューから取り出したジョブを読み込む。キャンセル等でjob.jsonが無いものはNone
+    """
+    job_json_path = os.path.join(jobs_dir, job_id, "job.json")
+    try:
+        job_info = ImageJobInfo.load(job_json_path)
+    except Exception as e:
+        logger.warning(f"[ImageJobManager] ジョブを読み込めないためスキップします: {job_id} {e}")
+        return None
+    if job_info.status != JobStatus.not_start:
+        logger.info(f"[ImageJobManager] 実行待ちではないためスキップします: {job_id} {job_info.status.value}")
+        return None
+    return job_info
+
+
+def _collect_batch(
+    job_queue: Any,
+    jobs_dir: str,
+    first: tuple[str, ImageJobInfo],
+    pending: deque[tuple[str, ImageJobInfo]],
+    config: WorkerConfig,
+    on_skip: Callable[[str], None] | None = None,
+) -> tuple[list[tuple[str, ImageJobInfo]], bool]:
+    """
+    先頭ジョブと同じモデル・サイズのジョブを、保留中のものとbatch_window内に届いたものから集める。
+    条件の合わないジョブは保留キューに回す。
+    :return: (バッチ, 終了要求を受け取ったか)
+    """
+    key = _batch_key(first[1])
+    limit = _batch_limit(first[1], config)
+    batch = [first]
+    for item in list(pending):
+        if len(batch) >= limit:
+            break
+        if _batch_key(item[1]) == key:
+            pending.remove(item)
+            batch.append(item)
+
+    deadline = time.monotonic() + config.batch_window
+    while len(batch) < limit:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            job_id = job_queue.get(timeout=remaining)
+        except queue.Empty:
+            break
         if job_id is None:
-            logger.info("[ImageJobManager] ワーカープロセス終了")
+            return batch, True
+        job_info = _load_queued_job(jobs_dir, job_id)
+        if job_info is None:
+            if on_skip is not None:
+                on_skip(job_id)
+            continue
+        if _batch_key(job_info) == key:
+            batch.append((job_id, job_info))
+        else:
+            pending.append((job_id, job_info))
+    return batch, False
+
+
+def _run_batch(
+    jobs_dir: str,
+    batch: list[tuple[str, ImageJobInfo]],
+    pipeline_cache: PipelineCache,
+    embedding_cache: EmbeddingCache | None = None,
+    progress: Callable[[int, int], None] | None = None,
+    should_cancel: Callable[[], bool] | None = None,
+    preview: Callable[[str, int, Any], None] | None = None,
+    preview_interval: int = 0,
+    timings: dict[str, Any] | None = None,
+    encoded: dict[str, bytes] | None = None,
+) -> list[str | None]:
+    """
+    バッチを1回のパイプライン呼び出しで生成する
+    :param progress: ステップごとに (完了したステップ数, 総ステップ数) で呼ばれるコールバック
+    :param should_cancel: Trueを返すと次のステップに進む前に生成を中断する
+    :param preview: preview_intervalステップごとに (job_id, 完了したステップ数, プレビュー画像) で呼ばれるコールバック
+    :param timings: 渡すとgenerate_imagesが段階ごとの所要秒数を書き込む
+    :param encoded: 渡すと保存したoutput.pngのバイト列をジョブIDごとに書き込む
+    :return: ジョブごとのエラーメッセージ（成功したものはNone）
+    """
+    first = batch[0][1]
+    if first.variant_seeds:
+        return _run_variants(jobs_dir, batch[0][0], first, pipeline_cache, embedding_cache, progress, should_cancel, preview, preview_interval, timings, encoded)
+    preview_kwargs: dict[str, Any] = {}
+    if preview is not None and preview_interval > 0:
+        preview_kwargs = {"preview": lambda i, step, image: preview(batch[i][0], step, image), "preview_interval": preview_interval}
+    prompts = [job_info.prompt for _, job_info in batch]
+    seeds = [job_info.seed for _, job_info in batch]
+    output_files = [os.path.join(jobs_dir, job_id, "output.png") for job_id, _ in batch]
+    outputs: dict[int, bytes] = {}
+    if first.pixel_art_size is None:
+        w = first.image_width or 512
+        h = first.image_height or 512
+        size = _generation_size(first)
+        errors = generate_images(
+            prompts,
+            output_files,
+            model_id_key=resolve_model_key(first.model),
+            size=size,
+            resize_to=(w, h) if size != (w, h) else None,
+            pipeline_cache=pipeline_cache,
+            embedding_cache=embedding_cache,
+            seeds=seeds,
+            progress=progress,
+            should_cancel=should_cancel,
+            timings=timings,
+            speed=first.speed,
+            encoded=outputs,
+            **preview_kwargs,
+        )
+    else:
+        errors = generate_images(
+            prompts,
+            output_files,
+            model_id_key=resolve_model_key(first.model, first.pixel_art_size),
+            pixel_art_mode=first.pixel_art_size,
+            pipeline_cache=pipeline_cache,
+            embedding_cache=embedding_cache,
+            seeds=seeds,
+            progress=progress,
+            should_cancel=should_cancel,
+            timings=timings,
+            speed=first.speed,
+            encoded=outputs,
+            **preview_kwargs,
+        )
+    if encoded is not None:
+        encoded.update({batch[i][0]: data for i, data in outputs.items()})
+    return errors
+
+
+def _run_variants(
+    jobs_dir: str,
+    job_id: str,
+    job_info: ImageJobInfo,
+    pipeline_cache: PipelineCache,
+    embedding_cache: EmbeddingCache | None,
+    progress: Callable[[int, int], None] | None,
+    should_cancel: Callable[[], bool] | None,
+    preview: Callable[[str, int, Any], None] | None,
+    preview_interval: int,
+    timings: dict[str, Any] | None,
+    encoded: dict[str, bytes] | None = None,
+) -> list[str | None]:
+    """
+    バリエーションのジョブの全フレームを1回のパイプライン呼び出しで生成し（プロンプトの埋め込みは1回だけ求める）、
+    ピクセルアートに変換したフレームをスプライトシートにまとめる。アトラスはjob_info.atlasに設定する。
+    job_info.frames_per_callを指定した場合は、その枚数ずつに分けて呼び出す（埋め込みはEmbeddingCacheで共有する）
+    :param encoded: 渡すと書き出したスプライトシートのバイト列をjob_idのキーで書き込む
+    :return: [エラーメッセージ（成功したらNone）]
+    """
+    seeds: list[int | None] = list(job_info.variant_seeds or [])
+    job_dir = os.path.join(jobs_dir, job_id)
+    output_files = frame_files(job_dir, len(seeds))
+    chunk = job_info.frames_per_call or len(seeds)
+    calls = math.ceil(len(seeds) / chunk)
+    errors: list[str | None] = []
+    for n, start in enumerate(range(0, len(seeds), chunk)):
+        preview_kwargs: dict[str, Any] = {}
+        if preview is not None and preview_interval > 0 and n == 0:
+            # プレビューは最初のフレームだけ
+            preview_kwargs = {"preview": lambda i, step, image: preview(job_id, step, image) if i == 0 else None, "preview_interval": preview_interval}
+        call_progress = None
+        if progress is not None:
+            # 分けて呼び出した場合も、全体で1つの進捗として通知する
+            call_progress = lambda step, total, n=n: progress(n * total + step, calls * total)
+        call_timings: dict[str, Any] = {}
+        errors += generate_images(
+            [job_info.prompt] * len(seeds[start:start + chunk]),
+            output_files[start:start + chunk],
+            model_id_key=resolve_model_key(job_info.model, job_info.pixel_art_size),
+            pixel_art_mode=job_info.pixel_art_size,
+            pipeline_cache=pipeline_cache,
+            embedding_cache=embedding_cache,
+            seeds=seeds[start:start + chunk],
+            progress=call_progress,
+            should_cancel=should_cancel,
+            timings=call_timings,
+            speed=job_info.speed,
+            **preview_kwargs,
+        )
+        if timings is not None:
+            for key, value in call_timings.items():
+                if isinstance(value, list):
+                    timings[key] = timings.get(key, []) + value
+                elif isinstance(value, (int, float)) and isinstance(timings.get(key), (int, float)):
+                    timings[key] += value
+                else:
+                    timings[key] = value
+        if any(error is not None for error in errors):
             break
+    error = next((error for error in errors if error is not None), None)
+    if error is not None:
+        return [error]
+    t0 = time.perf_counter()
+    job_info.atlas, sheet = assemble_sprite_sheet(job_dir, job_info.variant_seeds or [])
+    if encoded is not None:
+        encoded[job_id] = sheet
+    if timings is not None:
+        timings["save"] = timings.get("save", 0.0) + time.perf_counter() - t0
+    return [None]
+
+
+def _discard_outputs(event: dict[str, Any] | None) -> None:
+    """
+    完了の通知で渡された共有メモリのうち、受け取っていないものを解放する
+    """
+    for name, _ in (event or {}).get("outputs", {}).values():
+        discard_shared_bytes(name)
+
+
+def _worker_main(job_queue: Any, jobs_dir: str, ready_event: Any, config: WorkerConfig | None = None, worker_id: int = 0, event_queue: Any = None, index_path: str | None = None, results_dir: str | None = None, journal_path: str | None = None, models: dict[str, ModelInfo] | None = None) -> None:
+    """
+    ワーカープロセスの本体。job_queueからジョブIDを受け取り、画像を生成する。
+    :param event_queue: 開始・完了をマネージャーへ通知するキュー（Noneなら通知しない）
+    :param index_path: ステータス変更を反映するジョブインデックスのパス（Noneなら更新しない）
+    :param results_dir: 生成した画像を登録する結果ストアのディレクトリ（Noneなら登録しない）
+    :param journal_path: 状態遷移を記録するジャーナルのパス（Noneなら記録しない）
+    :param models: マネージャーのMODEL_IDS（spawnで起動したワーカーにも、実行時に登録したモデルを引き継ぐ）
+    """
+
+    if models is not None:
+        MODEL_IDS.update(models)
+    config = config or WorkerConfig()
+    torch_threads = config.resolved_torch_threads()
+    if torch_threads is not None or config.interop_threads is not None:
+        configure_torch_threads(torch_threads, config.interop_threads)
+    # ロード済みパイプラインはジョブをまたいで保持する
+    pipeline_cache = PipelineCache(max_entries=config.pipeline_cache_size, max_bytes=config.pipeline_cache_bytes)
+    embedding_cache = EmbeddingCache(max_entries=config.embedding_cache_size)
+    # バッチにまとめられず後回しになったジョブ
+    pending: deque[tuple[str, ImageJobInfo]] = deque()
+    index = JobIndex(index_path) if index_path else None
+    journal = JobJournal(journal_path) if journal_path else None
+    results = ResultStore(results_dir, config.result_cache_bytes) if results_dir else None
+
+    def save(job_info: ImageJobInfo, view: str | None = "job.json") -> None:
+        """
+        ジョブの状態を保存する。キャンセル済みのジョブはcancel.jsonの内容を優先し、job.jsonを作り直さない
+        :param view: Noneならjob.jsonは書き直さず、ジャーナルとインデックスだけ更新する
+        """
+        if _is_canceled(jobs_dir, job_info.job_id):
+            return
+        _save_job(jobs_dir, job_info, index, journal, view)
+        if _is_canceled(jobs_dir, job_info.job_id):
+            # 保存と同時にキャンセルされた
+            if view is not None:
+                os.remove(os.path.join(jobs_dir, job_info.job_id, "job.json"))
+            canceled = ImageJobInfo.load(os.path.join(jobs_dir, job_info.job_id, "cancel.json"))
+            # cancel_jobがcancel.jsonを書き直す前に読んだ場合もキャンセル済みとして記録する
+            canceled.set_cancel()
+            _save_job(jobs_dir, canceled, index, journal, view=None)
+
+    def notify(event: str, job_ids: list[str], **extra: Any) -> None:
+        if event_queue is None:
+            return
+        event_queue.put({
+            "event": event,
+            "worker_id": worker_id,
+            "job_ids": job_ids,
+            "models": [key[0] for key in pipeline_cache.keys()],
+            "pipeline_cache": pipeline_cache.stats(),
+            "embedding_cache": embedding_cache.stats(),
+            **extra,
+        })
+
+    def write_preview(job_id: str, step: int, image: Any) -> None:
+        """
+        プレビュー画像をジョブディレクトリに書き出す。読み手が書きかけのファイルを見ないよう置き換えで更新する
+        """
         try:
-            job_dir = os.path.join(jobs_dir, job_id)
-            job_json_path = os.path.join(job_dir, "job.json")
+            preview_path = os.path.join(jobs_dir, job_id, "preview.png")
+            tmp_path = preview_path + ".tmp"
+            image.save(tmp_path, format="PNG")
+            os.replace(tmp_path, preview_path)
+            notify("preview", [job_id], step=step)
+        except Exception as e:
+            logger.warning(f"[ImageJobManager] プレビューの保存に失敗しました: {job_id} {e}")
 
-            log_path = os.path.join(job_dir, "image.log")
+    logger.info(f"[ImageJobManager] ワーカープロセス開始 worker_id={worker_id} torch_threads={torch_threads}")
+    ready_event.set()
+    # 指定されたモデルをロードし、試し推論まで済ませてからジョブを受け付ける
+    for model_key in config.preload_models:
+        warmup: dict[str, Any] = {"model": model_key, "seconds": None, "error": None}
+        try:
+            warmup["seconds"] = warm_up_model(model_key, pipeline_cache, embedding_cache)
+            logger.info(f"[ImageJobManager] ウォームアップ完了: {model_key} {warmup['seconds']:.2f}秒 worker_id={worker_id}")
+        except Exception as e:
+            warmup["error"] = str(e)
+            logger.error(f"[ImageJobManager] ウォームアップに失敗しました: {model_key} {e}")
+        notify("warmup", [], warmup=warmup)
+    notify("ready", [])
+    stop = False
+    while not stop or pending:
+        if pending:
+            first = pending.popleft()
+        else:
+            job_id = job_queue.get()
+            if job_id is None:
+                break
+            job_info = _load_queued_job(jobs_dir, job_id)
+            if job_info is None:
+                notify("done", [job_id])
+                continue
+            first = (job_id, job_info)
+        if stop:
+            batch = [first]
+        else:
+            batch, stop = _collect_batch(job_queue, jobs_dir, first, pending, config, on_skip=lambda job_id: notify("done", [job_id]))
+        # 保留中・バッチ待ちの間にキャンセルされたジョブはモデルをロードする前に外す
+        canceled_ids = [job_id for job_id, _ in batch if _is_canceled(jobs_dir, job_id)]
+        if canceled_ids:
+            logger.info(f"[ImageJobManager] キャンセル済みのためスキップします: {canceled_ids}")
+            notify("done", canceled_ids)
+            batch = [item for item in batch if item[0] not in canceled_ids]
+            if not batch:
+                continue
+        batch_ids = [job_id for job_id, _ in batch]
+        notify("start", batch_ids)
+        # 完了した画像を共有メモリ経由でマネージャーへ渡す（job_id -> (共有メモリ名, バイト数)）
+        outputs: dict[str, tuple[str, int]] = {}
+        # 生成時に保存したoutput.pngのバイト列（読み直さずに共有メモリへ置く）
+        encoded: dict[str, bytes] = {}
+        # 終了したジョブの所要時間とメモリ使用量（job_id -> JobMetrics.observeの引数）
+        metrics: dict[str, dict[str, Any]] = {}
 
-            job_info = ImageJobInfo.load(job_json_path)
-            job_info.set_start()
-            job_info.save(job_json_path)
-            output_path = os.path.join(job_dir, "output.png")
+        try:
+            # ジョブごとの所要時間（キュー待ちは投入時刻から実行開始までの時間）
+            job_timings: dict[str, dict[str, float]] = {}
+            for job_id, job_info in batch:
+                submitted = datetime.fromisoformat(job_info.start_time)
+                job_info.set_start()
+                job_timings[job_id] = {"queue_wait": max(0.0, (datetime.fromisoformat(job_info.start_time) - submitted).total_seconds())}
+                # 実行中への遷移はジャーナルとインデックスだけに記録し、job.jsonの書き直しを1回減らす
+                save(job_info, view=None)
 
+            logger.info(f"[ImageJobManager] バッチ実行: {batch_ids}")
+            reset_device_peak_memory()
+            t0 = time.perf_counter()
+            batch_timings: dict[str, Any] = {}
             try:
-                if job_info.pixel_art_size is None:
-                    h = job_info.image_height or 512
-                    w = job_info.image_width or 512
-                    generate_image(
-                        prompt=job_info.prompt,
-                        size=(h,w),
-                        output_file=output_path,
-                    )
-                else:
-                    generate_image(
-                        prompt=job_info.prompt,
-                        pixel_art_mode=job_info.pixel_art_size,
-                        output_file=output_path,
-                    )
-                job_info.set_finished()
+                # バッチの全ジョブがキャンセルされたら、次のステップに進む前に中断する
+                errors = _run_batch(jobs_dir, batch, pipeline_cache, embedding_cache,
+                                    progress=lambda step, total: notify("progress", batch_ids, step=step, total=total),
+                                    should_cancel=lambda: all(_is_canceled(jobs_dir, job_id) for job_id in batch_ids),
+                                    preview=write_preview, preview_interval=config.preview_interval,
+                                    timings=batch_timings, encoded=encoded)
             except Exception as e:
-                import traceback
-                job_info.set_failed(str(e))
-            finally:
-                job_info.save(job_json_path)
+                errors = [str(e)] * len(batch)
+            for job_id in batch_ids:
+                job_timings[job_id].update(stage_timings(batch_timings))
+            if len(batch) > 1 and all(errors):
+                # バッチ全体が失敗した場合は、原因のジョブだけが失敗になるよう1件ずつ再実行する
+                logger.warning("[ImageJobManager] バッチ生成に失敗したため1件ずつ再実行します")
+                errors = []
+                for item in batch:
+                    if _is_canceled(jobs_dir, item[0]):
+                        errors.append("canceled")
+                        continue
+                    item_timings: dict[str, Any] = {}
+                    t1 = time.perf_counter()
+                    try:
+                        errors.extend(_run_batch(jobs_dir, [item], pipeline_cache, embedding_cache,
+                                                 progress=lambda step, total: notify("progress", [item[0]], step=step, total=total),
+                                                 should_cancel=lambda: _is_canceled(jobs_dir, item[0]),
+                                                 preview=write_preview, preview_interval=config.preview_interval,
+                                                 timings=item_timings, encoded=encoded))
+                    except Exception as e:
+                        errors.append(str(e))
+                    # 失敗したバッチの値は捨て、1件で再実行したときの値にする
+                    job_timings[item[0]] = {"queue_wait": job_timings[item[0]]["queue_wait"], **stage_timings(item_timings), "run": time.perf_counter() - t1}
+            elapsed = time.perf_counter() - t0
+            logger.info(f"[ImageJobManager] バッチ完了: {len(batch)}枚 {elapsed:.2f}秒 ({len(batch) / max(elapsed, 1e-9):.2f} images/s)")
+            peak_rss = peak_rss_bytes()
+            device_peak = device_peak_memory()
 
+            for (job_id, job_info), error in zip(batch, errors):
+                job_timings[job_id].setdefault("run", elapsed)
+                if _is_canceled(jobs_dir, job_id):
+                    metrics[job_id] = {"status": JobStatus.canceled.value, "timings": job_timings[job_id]}
+                    continue
+                job_info.timings = job_timings[job_id]
+                job_info.peak_rss_bytes = peak_rss
+                job_info.device_peak_bytes = device_peak
+                if error is None:
+                    job_info.set_finished()
+                    if results is not None and job_info.request_key:
+                        try:
+                            results.put(job_info.request_key, os.path.join(jobs_dir, job_id, "output.png"))
+                        except Exception as e:
+                            logger.warning(f"[ImageJobManager] 結果ストアへの登録に失敗しました: {job_id} {e}")
+                    if config.output_cache_bytes > 0 and job_id in encoded:
+                        try:
+                            outputs[job_id] = share_bytes(encoded[job_id])
+                        except Exception as e:
+                            logger.warning(f"[ImageJobManager] 出力画像を共有メモリに置けませんでした: {job_id} {e}")
+                else:
+                    job_info.set_failed(error)
+                save(job_info)
+                metrics[job_id] = {"status": job_info.status.value, "timings": job_info.timings,
+                                   "peak_rss_bytes": peak_rss, "device_peak_bytes": device_peak}
         except Exception as e:
-            break
+            logger.error(f"[ImageJobManager] ジョブの実行に失敗しました: {e}")
+        try:
+            notify("done", batch_ids, outputs=outputs, metrics=metrics)
+        except Exception as e:
+            # 通知できなければマネージャーは共有メモリを受け取らないので、ここで解放する
+            logger.error(f"[ImageJobManager] 完了の通知に失敗しました: {e}")
+            for name, _ in outputs.values():
+                discard_shared_bytes(name)
+    if index is not None:
+        index.close()
+    if journal is not None:
+        journal.close()
+    logger.info(f"[ImageJobManager] ワーカープロセス終了 worker_id={worker_id}")
+
+
+class WorkerStatus(BaseModel):
+    worker_id: int
+    pid: int | None = None
+    alive: bool
+    # ウォームアップが終わりジョブを受け付けられるか
+    ready: bool = True
+    busy: bool
+    job_ids: list[str] = []
+    loaded_models: list[str] = []
+    torch_threads: int | None = None
+    pipeline_cache: dict[str, int] = {}
+    embedding_cache: dict[str, float] = {}
+
+
+class WorkerPoolStatus(BaseModel):
+    queue_depth: int
+    workers: list[WorkerStatus]
+
+
+class ModelWarmup(BaseModel):
+    model: str
+    # ロードと試し推論にかかった秒数（失敗した場合はNone）
+    seconds: float | None = None
+    error: str | None = None
+
+
+class WorkerHealth(BaseModel):
+    worker_id: int
+    alive: bool
+    ready: bool
+    warm_models: list[ModelWarmup] = []
+
+
+class HealthStatus(BaseModel):
+    # すべての生存ワーカーがジョブを受け付けられるか
+    ready: bool
+    preload_models: list[str]
+    workers: list[WorkerHealth]
+
+
+@dataclass
+class _JobProgress:
+    """
+    実行中ジョブの進捗。ETAは最初の進捗通知以降のステップ速度から求める（モデルのロード時間を含めない）
+    """
+    step: int = 0
+    total: int | None = None
+    # 最初の進捗通知を受けた時刻とそのときのステップ数
+    first_time: float | None = None
+    first_step: int = 0
+    # 最新のプレビュー画像のステップ数
+    preview_step: int | None = None
+
+    def update(self, step: int, total: int) -> None:
+        now = time.monotonic()
+        if self.first_time is None or total != self.total or step < self.step:
+            # 最初の通知、またはバッチの再実行等でステップ数がやり直しになった
+            self.first_time = now
+            self.first_step = step
+        self.step = step
+        self.total = total
+
+    def eta(self) -> float | None:
+        if self.total is None or self.first_time is None or self.step <= self.first_step:
+            return None
+        rate = (time.monotonic() - self.first_time) / (self.step - self.first_step)
+        return rate * max(0, self.total - self.step)
+
+
+@dataclass
+class _QueuedJob:
+    job_id: str
+    model_key: str
+    batch_key: tuple[Any, ...]
+    # 同じバッチにまとめられる最大数（NoneならWorkerConfig.max_batch_size）
+    batch_limit: int | None = None
+    # 重さの見積もり・優先度・投入したクライアント・投入時刻（time.monotonic）
+    cost: float = 0.0
+    priority: int = 0
+    client_id: str | None = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class _WorkerHandle:
+    worker_id: int
+    process: multiprocessing.Process
+    job_queue: Any
+    ready_event: Any
+    # 割り当て済みで完了していないジョブ
+    assigned: list[str] = field(default_factory=list)
+    # 実行中のジョブ
+    running: list[str] = field(default_factory=list)
+    batch_key: tuple[Any, ...] | None = None
+    loaded_models: list[str] = field(default_factory=list)
+    pipeline_cache: dict[str, int] = field(default_factory=dict)
+    embedding_cache: dict[str, float] = field(default_factory=dict)
+    # 起動時のウォームアップ中か
+    warming: bool = False
+    warmup: list[dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def idle(self) -> bool:
+        return not self.assigned and not self.warming and self.process.is_alive()
 
 class ImageJobManager:
     """
@@ -194,26 +1037,496 @@ class ImageJobManager:
 
     DEFAULT_IMAGE_DIR: ClassVar[str] = os.path.expanduser("~/.cache/image_mcp")
 
-    def __init__(self, image_dir: str | None = None) -> None:
+    def __init__(self, image_dir: str | None = None, worker_config: WorkerConfig | None = None) -> None:
         """
         :param image_dir: ジョブ・ログ等を保存するディレクトリ（デフォルト: ~/.cache/image_mcp）
+        :param worker_config: ワーカープロセスの設定（パイプラインキャッシュ、バッチ化等）
         """
         self.image_dir = image_dir or self.DEFAULT_IMAGE_DIR
         self.jobs_dir = os.path.join(self.image_dir, "jobs")
         os.makedirs(self.jobs_dir, exist_ok=True)
+        self.index_path = os.path.join(self.image_dir, JobIndex.FILE_NAME)
+        self.journal_path = os.path.join(self.image_dir, JobJournal.FILE_NAME)
+        self.results_dir = os.path.join(self.image_dir, "results")
+        self.worker_config = worker_config or WorkerConfig()
+        self._results = ResultStore(self.results_dir, self.worker_config.result_cache_bytes)
+        # ディスパッチ待ちのジョブ（投入順。割り当てる順はself._schedulerで決める）
+        self._pending: list[_QueuedJob] = []
+        self._scheduler = JobScheduler(self.worker_config.scheduling)
+        # ワーカーに割り当てて完了していないジョブ（job_id -> ディスパッチ待ちだったときの情報）
+        self._dispatched: dict[str, _QueuedJob] = {}
+        # 実行待ち・実行中のジョブ（request_key -> job_id）
+        self._inflight: dict[str, str] = {}
+        # 同じ条件の要求が相乗りしている実行待ち・実行中のジョブの要求数（job_id -> 数。無ければ1）
+        self._attached: dict[str, int] = {}
+        # 実行中のジョブの進捗
+        self._progress: dict[str, _JobProgress] = {}
+        # 最近完了したジョブのエンコード済み画像
+        self._outputs = ImageBytesCache(self.worker_config.output_cache_bytes)
+        # 終了したジョブの段階ごとの所要時間の集計
+        self._metrics = JobMetrics()
+        # ジョブの進捗・完了を待っている呼び出し元（job_id -> コールバック）
+        self._watchers: dict[str, list[Callable[[], None]]] = {}
+        self._lock = threading.Lock()
+        self._submit_lock = threading.Lock()
+        # ワーカーからの開始・完了通知
+        self._event_queue: multiprocessing.Queue[dict[str, Any] | None] = _MP_CONTEXT.Queue()
+        # ワーカーもインデックスとジャーナルを開く（作成する）ので、新しく作るかどうかは起動前に調べる
+        index_created = not os.path.isfile(self.index_path)
+        journal_created = not os.path.isfile(self.journal_path)
+        # 停止中か（停止のために終了したワーカーを起動し直さない）
+        self._closing = False
         # ワーカープロセス起動
-        self._job_queue: multiprocessing.Queue[str] = multiprocessing.Queue()
-        self._ready_event: Any = multiprocessing.Event()
-        logger.info("[ImageJobManager] ワーカープロセスを起動します")
-        self._worker_process: multiprocessing.Process = multiprocessing.Process(
+        num_workers = max(1, self.worker_config.num_workers)
+        logger.info(f"[ImageJobManager] ワーカープロセスを{num_workers}個起動します")
+        self._workers: list[_WorkerHandle] = [self._start_worker(worker_id) for worker_id in range(num_workers)]
+        # プロセスの起動だけを待つ。ウォームアップは起動後に進み、終わったワーカーからジョブを割り当てる
+        for worker in self._workers:
+            while not worker.ready_event.wait(0.1):
+                if not worker.process.is_alive():
+                    raise RuntimeError(f"ワーカープロセスの起動に失敗しました: worker_id={worker.worker_id} exitcode={worker.process.exitcode}")
+        # マネージャー側のインデックスとジャーナルはワーカーの起動を待ってから開く
+        self._index = JobIndex(self.index_path)
+        self._journal = JobJournal(self.journal_path)
+        orphaned = self._recover(journal_created, index_created)
+        self._event_thread = threading.Thread(target=self._event_loop, daemon=True)
+        self._event_thread.start()
+        self._requeue(orphaned)
+        # 保持ポリシーの適用
+        self._gc_stats = StorageStats(jobs=0, measured_jobs=0, total_bytes=0)
+        self._gc_lock = threading.Lock()
+        self._gc_stop = threading.Event()
+        self._gc_thread = threading.Thread(target=self._gc_loop, daemon=True)
+        self._gc_thread.start()
+        logger.info("[ImageJobManager] ワーカープロセス ready")
+
+    def _start_worker(self, worker_id: int) -> _WorkerHandle:
+        """
+        ワーカープロセスを起動する。起動を待たずに返す
+        """
+        job_queue: multiprocessing.Queue[str | None] = _MP_CONTEXT.Queue()
+        ready_event: Any = _MP_CONTEXT.Event()
+        process = _MP_CONTEXT.Process(
                 target=_worker_main,
-                args=(self._job_queue, self.jobs_dir, self._ready_event),
+                args=(job_queue, self.jobs_dir, ready_event, self.worker_config, worker_id, self._event_queue, self.index_path, self.results_dir, self.journal_path, dict(MODEL_IDS)),
                 daemon=True
             )
-        self._worker_process.start()
-        logger.info(f"[ImageJobManager] ワーカープロセスPID: {self._worker_process.pid}")
-        self._ready_event.wait()
-        logger.info("[ImageJobManager] ワーカープロセス ready")
+        process.start()
+        logger.info(f"[ImageJobManager] ワーカープロセスPID: {process.pid} worker_id={worker_id}")
+        return _WorkerHandle(worker_id, process, job_queue, ready_event, warming=bool(self.worker_config.preload_models))
+
+    def _check_workers(self) -> None:
+        """
+        異常終了したワーカープロセスを起動し直す。実行中だったジョブは失敗にし、
+        割り当て済みで実行前のジョブはディスパッチ待ちに戻す
+        """
+        failed: list[str] = []
+        with self._lock:
+            if self._closing:
+                return
+            for i, worker in enumerate(self._workers):
+                if worker.process.is_alive():
+                    continue
+                logger.error(f"[ImageJobManager] ワーカープロセスが異常終了しました: worker_id={worker.worker_id} exitcode={worker.process.exitcode}")
+                for job_id in worker.assigned:
+                    job = self._dispatched.pop(job_id, None)
+                    self._progress.pop(job_id, None)
+                    if job_id in worker.running:
+                        failed.append(job_id)
+                    elif job is not None:
+                        self._pending.append(job)
+                self._workers[i] = self._start_worker(worker.worker_id)
+        for job_id in failed:
+            self._fail_job(job_id, WORKER_DIED_MESSAGE)
+        if failed:
+            self._notify_watchers(failed)
+        self._dispatch()
+
+    def _fail_job(self, job_id: str, message: str) -> None:
+        """
+        実行待ち・実行中のジョブを失敗にする（キャンセル済み・終了済みのジョブはそのまま）
+        """
+        try:
+            job_info = self.get_job(job_id)
+        except KeyError:
+            return
+        with self._lock:
+            self._inflight = {key: inflight_id for key, inflight_id in self._inflight.items() if inflight_id != job_id}
+            self._attached.pop(job_id, None)
+        if job_info.status not in (JobStatus.not_start, JobStatus.running) or _is_canceled(self.jobs_dir, job_id):
+            return
+        job_info.set_failed(message)
+        _save_job(self.jobs_dir, job_info, self._index, self._journal)
+        self._metrics.observe(job_info.status.value)
+        logger.warning(f"[ImageJobManager] ジョブを失敗にしました: {job_id} {message}")
+
+    def shutdown(self, timeout: float = 10.0) -> None:
+        """
+        ワーカープロセスを停止する。実行中・割り当て済みのジョブは処理してから終了する
+        """
+        with self._lock:
+            self._closing = True
+        for worker in self._workers:
+            worker.job_queue.put(None)
+        for worker in self._workers:
+            worker.process.join(timeout)
+        self._event_queue.put(None)
+        self._event_thread.join(timeout)
+        # 処理されずに残った通知の共有メモリを解放する
+        while True:
+            try:
+                event = self._event_queue.get_nowait()
+            except queue.Empty:
+                break
+            _discard_outputs(event)
+        self._gc_stop.set()
+        self._gc_thread.join(timeout)
+        self._index.close()
+        # すべてのワーカーが止まっていれば、job.jsonはジャーナルに追いついている
+        self._journal.close(clean=not any(worker.process.is_alive() for worker in self._workers))
+
+    def _recover(self, journal_created: bool, index_created: bool) -> list[ImageJobInfo]:
+        """
+        起動時に、ジャーナルから各ジョブの現在の状態を求めてjob.jsonとインデックスを追いつかせる。
+        前回が正常終了なら、それ以降に更新されたジョブだけを確認する。
+        前回の実行中のジョブは失敗にし、実行待ちのジョブは投入し直すために返す。
+        ジャーナルが無い（以前のバージョンで作った）ディレクトリでは、job.jsonからジャーナルを作る
+        :param journal_created: 起動時にジャーナルが無かったか
+        :param index_created: 起動時にインデックスが無かったか
+        :return: 投入し直す実行待ちのジョブ
+        """
+        if journal_created:
+            if any(os.scandir(self.jobs_dir)):
+                logger.info("[ImageJobManager] 既存のジョブからジャーナルを作成します")
+                if index_created:
+                    self._index.rebuild(self.jobs_dir)
+                self._journal.append_many([json.loads(data) for data in self._index.list_json()])
+                self._journal.compact(clean=True)
+            return []
+        t0 = time.perf_counter()
+        states, unclean = self._journal.replay()
+        if unclean:
+            logger.warning(f"[ImageJobManager] 前回は正常終了していないため、{len(unclean)}件のジョブの状態を確認します")
+            for job_id in unclean:
+                states[job_id] = self._repair_view(states[job_id])
+        if index_created:
+            logger.info("[ImageJobManager] ジャーナルからインデックスを作成します")
+            self._index.upsert_many(list(states.values()))
+        elif unclean:
+            self._index.upsert_many([states[job_id] for job_id in unclean])
+        # 前回のワーカーは残っていないので、実行中のジョブは中断された。実行待ちのジョブは投入し直す
+        orphaned: list[ImageJobInfo] = []
+        for data in states.values():
+            if data["status"] == JobStatus.running.value:
+                job_info = ImageJobInfo.model_validate(data)
+                job_info.set_failed(INTERRUPTED_MESSAGE)
+                os.makedirs(os.path.join(self.jobs_dir, job_info.job_id), exist_ok=True)
+                _save_job(self.jobs_dir, job_info, self._index, self._journal)
+                logger.warning(f"[ImageJobManager] 実行中に停止したジョブを失敗にします: {job_info.job_id}")
+            elif data["status"] == JobStatus.not_start.value:
+                orphaned.append(ImageJobInfo.model_validate(data))
+        if unclean or self._journal.records_read > 2 * len(states):
+            self._journal.compact(clean=True)
+        logger.info(f"[ImageJobManager] ジャーナルから{len(states)}件のジョブを復元しました ({time.perf_counter() - t0:.3f}秒)")
+        return orphaned
+
+    def _requeue(self, jobs: list[ImageJobInfo]) -> None:
+        """
+        前回の実行待ちのジョブをワーカーに投入し直す。投入できない（モデルが無い等）ジョブは失敗にする
+        """
+        for job_info in jobs:
+            try:
+                if job_info.request_key:
+                    with self._lock:
+                        self._inflight[job_info.request_key] = job_info.job_id
+                self._enqueue(job_info)
+                logger.info(f"[ImageJobManager] 実行待ちのジョブを投入し直します: {job_info.job_id}")
+            except Exception as e:
+                with self._lock:
+                    self._inflight.pop(job_info.request_key or "", None)
+                job_info.set_failed(f"{INTERRUPTED_MESSAGE}: {e}")
+                _save_job(self.jobs_dir, job_info, self._index, self._journal)
+
+    def _repair_view(self, data: dict[str, Any]) -> dict[str, Any]:
+        """
+        ジャーナルの最新の状態と異なる（壊れた・古い・無い）job.json/cancel.jsonを書き直す
+        :return: 確定したジョブの状態
+        """
+        job_id = data["job_id"]
+        json_path = self._get_json_path(job_id)
+        cancel_path = os.path.join(os.path.dirname(json_path), "cancel.json")
+        if data["status"] != JobStatus.canceled.value and os.path.isfile(cancel_path):
+            # キャンセルの途中で止まった
+            job_info = ImageJobInfo.model_validate(data)
+            job_info.set_cancel()
+            data = job_info.model_dump(mode="json")
+            self._journal.append(data)
+        view_path = cancel_path if data["status"] == JobStatus.canceled.value else json_path
+        try:
+            with open(view_path, "r", encoding="utf-8") as f:
+                current = json.load(f)
+        except Exception:
+            current = None
+        if current != data:
+            logger.info(f"[ImageJobManager] ジャーナルからジョブの状態を書き直します: {view_path}")
+            os.makedirs(os.path.dirname(view_path), exist_ok=True)
+            ImageJobInfo.model_validate(data).save(view_path)
+        if view_path == cancel_path and os.path.isfile(json_path):
+            os.remove(json_path)
+        return data
+
+    def rebuild_index(self) -> int:
+        """
+        ジョブディレクトリからジョブインデックスを再構築する
+        :return: 登録したジョブ数
+        """
+        return self._index.rebuild(self.jobs_dir)
+
+    def _event_loop(self) -> None:
+        checked = time.monotonic()
+        while True:
+            try:
+                event = self._event_queue.get(timeout=WORKER_CHECK_INTERVAL)
+            except queue.Empty:
+                event = {}
+            if event is None:
+                break
+            try:
+                if event:
+                    self._handle_event(event)
+                if time.monotonic() - checked >= WORKER_CHECK_INTERVAL:
+                    checked = time.monotonic()
+                    self._check_workers()
+            except Exception as e:
+                logger.error(f"[ImageJobManager] ワーカー通知の処理に失敗しました: {e}")
+                _discard_outputs(event)
+
+    def _handle_event(self, event: dict[str, Any]) -> None:
+        with self._lock:
+            worker = self._workers[event["worker_id"]]
+            worker.loaded_models = event["models"]
+            worker.pipeline_cache = event["pipeline_cache"]
+            worker.embedding_cache = event["embedding_cache"]
+            job_ids: list[str] = event["job_ids"]
+            if event["event"] == "warmup":
+                worker.warmup.append(event["warmup"])
+            elif event["event"] == "ready":
+                worker.warming = False
+            elif event["event"] == "progress":
+                for job_id in job_ids:
+                    self._progress.setdefault(job_id, _JobProgress()).update(event["step"], event["total"])
+            elif event["event"] == "preview":
+                for job_id in job_ids:
+                    self._progress.setdefault(job_id, _JobProgress()).preview_step = event["step"]
+            elif event["event"] == "start":
+                worker.running = list(job_ids)
+            elif event["event"] == "done":
+                worker.running = [job_id for job_id in worker.running if job_id not in job_ids]
+                worker.assigned = [job_id for job_id in worker.assigned if job_id not in job_ids]
+                if not worker.assigned:
+                    worker.batch_key = None
+                for job_id in job_ids:
+                    self._progress.pop(job_id, None)
+                for metrics in event.get("metrics", {}).values():
+                    self._metrics.observe(worker_id=event["worker_id"], **metrics)
+                for job_id, (name, size) in event.get("outputs", {}).items():
+                    try:
+                        self._outputs.put((job_id, "png", None), take_shared_bytes(name, size))
+                    except Exception as e:
+                        logger.warning(f"[ImageJobManager] 出力画像を共有メモリから読めませんでした: {job_id} {e}")
+                self._inflight = {key: job_id for key, job_id in self._inflight.items() if job_id not in job_ids}
+                for job_id in job_ids:
+                    self._attached.pop(job_id, None)
+                self._observe_run(job_ids, event.get("metrics", {}))
+        if event["event"] in ("progress", "done"):
+            self._notify_watchers(job_ids)
+        self._dispatch()
+        if event["event"] == "done":
+            # 完了したジョブの古い遷移が溜まったら、最新の状態だけに圧縮する
+            self._journal.maybe_compact()
+
+    def watch_job(self, job_id: str, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        ジョブの進捗・完了・キャンセルの通知を受け取るコールバックを登録する。
+        コールバックはワーカー通知を処理するスレッドから呼ばれるので、すぐに戻ること
+        :return: 登録を解除する関数
+        """
+        with self._lock:
+            self._watchers.setdefault(job_id, []).append(callback)
+
+        def unwatch() -> None:
+            with self._lock:
+                callbacks = self._watchers.get(job_id, [])
+                if callback in callbacks:
+                    callbacks.remove(callback)
+                if not callbacks:
+                    self._watchers.pop(job_id, None)
+        return unwatch
+
+    def _notify_watchers(self, job_ids: list[str]) -> None:
+        with self._lock:
+            callbacks = [callback for job_id in job_ids for callback in self._watchers.get(job_id, [])]
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"[ImageJobManager] ジョブの通知先でエラーが発生しました: {e}")
+
+    def wait_for_job(self, job_id: str, timeout: float | None = None) -> ImageJobInfo:
+        """
+        ジョブが終わる（またはtimeout秒経つ）まで待つ。ポーリングせず、ワーカーからの完了通知で起きる
+        :param timeout: 最大待ち時間（秒）。Noneなら終わるまで待つ
+        :return: 待ち終わった時点のジョブ詳細情報
+        """
+        changed = threading.Event()
+        unwatch = self.watch_job(job_id, changed.set)
+        try:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            job_info = self.get_job(job_id)
+            while job_info.status in (JobStatus.not_start, JobStatus.running):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                changed.wait(remaining)
+                changed.clear()
+                job_info = self.get_job(job_id)
+            return job_info
+        finally:
+            unwatch()
+
+    def _observe_run(self, job_ids: list[str], metrics: dict[str, dict[str, Any]]) -> None:
+        """
+        完了したジョブの実行時間から、スケジューラーの1単位あたりの秒数を更新する（self._lockを取った状態で呼ぶ）
+        """
+        done = [self._dispatched.pop(job_id) for job_id in job_ids if job_id in self._dispatched]
+        finished = [job for job in done if metrics.get(job.job_id, {}).get("status") == JobStatus.finished.value]
+        runs = [metrics[job.job_id]["timings"].get("run") for job in finished if metrics[job.job_id].get("timings")]
+        runs = [run for run in runs if run]
+        if not runs:
+            return
+        # バッチで生成したジョブは同じ実行時間、1件ずつ再実行したジョブはそれぞれの実行時間になる
+        seconds = runs[0] if len(set(runs)) == 1 else sum(runs)
+        self._scheduler.observe(sum(job.cost for job in finished), seconds)
+
+    def _enqueue(self, job_info: ImageJobInfo) -> None:
+        batch_key = _batch_key(job_info)
+        job = _QueuedJob(job_info.job_id, batch_key[0], batch_key, _batch_limit(job_info, self.worker_config),
+                         cost=_job_cost(job_info), priority=job_info.priority, client_id=job_info.client_id)
+        with self._lock:
+            self._pending.append(job)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """
+        ディスパッチ待ちのジョブを、スケジューラーの順（見積もりの所要時間が短い順。待った時間と優先度で順位を上げる）にワーカーへ割り当てる。
+        クライアントごとの上限に達しているジョブは飛ばす。
+        割り当て先は (1) 同じ条件のバッチが開始前のワーカー、(2) ジョブのモデルをロード済みのアイドルワーカー、
+        (3) その他のアイドルワーカー（ロード済みモデルが少ない順）の優先順で選ぶ。
+        """
+        quota = self.worker_config.scheduling.max_jobs_per_client
+        with self._lock:
+            for job in self._scheduler.order(self._pending, time.monotonic()):
+                if quota is not None and job.client_id is not None:
+                    if sum(1 for other in self._dispatched.values() if other.client_id == job.client_id) >= quota:
+                        continue
+                worker = self._select_worker(job)
+                if worker is None:
+                    continue
+                self._pending.remove(job)
+                self._dispatched[job.job_id] = job
+                if not worker.assigned:
+                    worker.batch_key = job.batch_key
+                worker.assigned.append(job.job_id)
+                worker.job_queue.put(job.job_id)
+
+    def _queue_estimates(self) -> dict[str, tuple[int, float | None]]:
+        """
+        実行待ちのジョブの待ち順（1から）と、開始までの秒数の見積もり（動いているワーカーが無ければNone）
+        ワーカーに割り当て済みのジョブはそのワーカーの実行中のバッチの後、ディスパッチ待ちのジョブはスケジューラーの順に最も早く空くワーカーで始まるものとする
+        :return: job_id -> (待ち順, 開始までの秒数)
+        """
+        with self._lock:
+            worker_busy: list[float] = []
+            assigned: list[tuple[str, float]] = []
+            for worker in self._workers:
+                if not worker.process.is_alive():
+                    continue
+                etas = [self._progress[job_id].eta() for job_id in worker.running if job_id in self._progress]
+                if etas and None not in etas:
+                    busy = max(etas)  # type: ignore[type-var]
+                else:
+                    busy = self._scheduler.estimated_seconds(sum(self._dispatched[job_id].cost for job_id in worker.running if job_id in self._dispatched))
+                waiting = [job_id for job_id in worker.assigned if job_id not in worker.running]
+                assigned += [(job_id, busy) for job_id in waiting]
+                busy += self._scheduler.estimated_seconds(sum(self._dispatched[job_id].cost for job_id in waiting if job_id in self._dispatched))
+                worker_busy.append(busy)
+            pending = [(job.job_id, job.cost) for job in self._scheduler.order(self._pending, time.monotonic())]
+            starts = self._scheduler.estimate_starts(worker_busy, pending)
+        estimates: dict[str, tuple[int, float | None]] = {}
+        for position, (job_id, busy) in enumerate(sorted(assigned, key=lambda item: item[1]), start=1):
+            estimates[job_id] = (position, busy)
+        for position, (job_id, _) in enumerate(pending, start=len(assigned) + 1):
+            estimates[job_id] = (position, starts.get(job_id))
+        return estimates
+
+    def _select_worker(self, job: _QueuedJob) -> _WorkerHandle | None:
+        for worker in self._workers:
+            if (worker.batch_key == job.batch_key and not worker.running
+                    and len(worker.assigned) < (job.batch_limit or self.worker_config.max_batch_size) and worker.process.is_alive()):
+                return worker
+        idle = [worker for worker in self._workers if worker.idle]
+        if not idle:
+            return None
+        for worker in idle:
+            if job.model_key in worker.loaded_models:
+                return worker
+        return min(idle, key=lambda w: len(w.loaded_models))
+
+    def get_pool_status(self) -> WorkerPoolStatus:
+        """
+        ワーカープールの状態（待ちジョブ数、各ワーカーの稼働状況とロード済みモデル）を返す
+        """
+        torch_threads = self.worker_config.resolved_torch_threads()
+        with self._lock:
+            queue_depth = len(self._pending) + sum(
+                len([job_id for job_id in worker.assigned if job_id not in worker.running]) for worker in self._workers
+            )
+            workers = [
+                WorkerStatus(
+                    worker_id=worker.worker_id,
+                    pid=worker.process.pid,
+                    alive=worker.process.is_alive(),
+                    ready=not worker.warming,
+                    busy=bool(worker.assigned),
+                    job_ids=list(worker.assigned),
+                    loaded_models=list(worker.loaded_models),
+                    torch_threads=torch_threads,
+                    pipeline_cache=dict(worker.pipeline_cache),
+                    embedding_cache=dict(worker.embedding_cache),
+                )
+                for worker in self._workers
+            ]
+        return WorkerPoolStatus(queue_depth=queue_depth, workers=workers)
+
+    def get_health(self) -> HealthStatus:
+        """
+        起動時のウォームアップの状況（各ワーカーで準備できたモデルとかかった時間）を返す
+        """
+        with self._lock:
+            workers = [
+                WorkerHealth(
+                    worker_id=worker.worker_id,
+                    alive=worker.process.is_alive(),
+                    ready=not worker.warming,
+                    warm_models=[ModelWarmup(**warmup) for warmup in worker.warmup],
+                )
+                for worker in self._workers
+            ]
+        return HealthStatus(
+            ready=any(w.alive for w in workers) and all(w.ready for w in workers if w.alive),
+            preload_models=list(self.worker_config.preload_models),
+            workers=workers,
+        )
 
     def _get_json_path(self, job_id: str) -> str:
         return os.path.join(self.jobs_dir, job_id, "job.json")
@@ -221,7 +1534,10 @@ class ImageJobManager:
     def _get_image_path(self, job_id: str) -> str:
         return os.path.join(self.jobs_dir, job_id, "output.png")
 
-    def submit_image_job(self, prompt:str, width:int, height:int) -> ImageJobInfo:
+    def _get_preview_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, job_id, "preview.png")
+
+    def submit_image_job(self, prompt:str, width:int, height:int, model:str|None=None, seed:int|None=None, speed:SpeedTier="quality", priority:int=0, client_id:str|None=None) -> ImageJobInfo:
         """
         Submits an image generation job and returns the job ID.
 
@@ -229,6 +1545,11 @@ class ImageJobManager:
             prompt (str): The prompt or description for image generation.
             width (int): The width of the generated image.
             height (int): The height of the generated image.
+            model (str | None): The model key in MODEL_IDS. Uses the default model when None.
+            seed (int | None): The random seed. Uses DEFAULT_SEED when None.
+            speed (SpeedTier): The speed tier that selects the sampler and step count.
+            priority (int): The dispatch priority. Higher values start earlier.
+            client_id (str | None): The submitting client, used for the per-client job limit.
             output_path (str): The file path where the generated image will be saved.
 
         Returns:
@@ -241,63 +1562,201 @@ class ImageJobManager:
         Note:
             This method creates a unique job directory, saves job metadata as a JSON file,
             and enqueues the job for processing by a worker process.
+            An identical request that is still queued or running is returned instead of a new job,
+            and an identical request that already finished completes immediately with the stored image.
         """
 
         job_info = ImageJobInfo.new_image(
             prompt=prompt,
             width=width,
             height=height,
+            model=model,
+            seed=seed,
+            speed=speed,
+            priority=priority,
+            client_id=client_id,
         )
+        self._admit(job_info)
+        return self._submit(job_info)
 
-        job_dir = os.path.join(self.jobs_dir, job_info.job_id)
-        os.makedirs(job_dir, exist_ok=True)
-
-        job_json_path = os.path.join(job_dir, "job.json")
-        job_info.save(job_json_path)
-
-        # ワーカープロセスにジョブを投入
-        self._job_queue.put(job_info.job_id)
-        return job_info
+    def _admit(self, job_info: ImageJobInfo) -> None:
+        """
+        メモリの上限（WorkerConfig.memory_budget_bytes）を指定した場合、生成時のメモリを見積もって受け付けるか決める。
+        上限を超える要求は、memory_policyが"downgrade"なら上限に収まる生成サイズに縮め、それ以外は断る
+        :raises ValueError: 上限に収まらない場合
+        """
+        budget = self.worker_config.memory_budget_bytes
+        if budget is None:
+            return
+        model_info = MODEL_IDS[resolve_model_key(job_info.model)]
+        width, height = job_info.image_width or 512, job_info.image_height or 512
+        estimate = plan_memory(model_info, width, height).peak_bytes
+        if estimate <= budget:
+            job_info.memory_estimate_bytes = estimate
+            return
+        fitted = fit_to_budget(model_info, width, height, budget) if self.worker_config.memory_policy == "downgrade" else None
+        if fitted is None:
+            raise ValueError(f"{width}x{height}の生成には約{estimate >> 20}MBのメモリが必要で、上限の{budget >> 20}MBを超えます。小さいサイズを指定してください。")
+        job_info.generation_width, job_info.generation_height = fitted
+        job_info.memory_estimate_bytes = plan_memory(model_info, *fitted).peak_bytes
+        logger.warning(f"[ImageJobManager] メモリの上限に収めるため{fitted[0]}x{fitted[1]}で生成して{width}x{height}に拡大します: {job_info.job_id}")
 
-    def submit_pixelart_job(self, prompt:str, pixel_art_size:Literal[32, 48, 64, 128]) -> ImageJobInfo:
+    def submit_pixelart_job(self, prompt:str, pixel_art_size:Literal[32, 48, 64, 128], model:str|None=None, seed:int|None=None, speed:SpeedTier="quality", priority:int=0, client_id:str|None=None) -> ImageJobInfo:
         """
         ピクセルアート生成ジョブを投入し、ジョブIDを返す。
+        同じ条件の要求が実行待ち・実行中ならそのジョブを返し、生成済みなら保存済みの画像ですぐに完了する。
         :param params: 生成パラメータ
+        :param seed: 乱数シード（NoneならDEFAULT_SEED）
+        :param speed: 速度の段階（サンプラーとステップ数を決める）
+        :param priority: ディスパッチの優先度（大きいほど先に始まる）
+        :param client_id: 投入したクライアント（クライアントごとの同時実行数の上限に使う）
         :return: ジョブID
         """
 
         job_info = ImageJobInfo.new_pixelart(
             prompt=prompt,
             pixel_art_size=pixel_art_size,
+            model=model,
+            seed=seed,
+            speed=speed,
+            priority=priority,
+            client_id=client_id,
         )
-        job_dir = os.path.join(self.jobs_dir, job_info.job_id)
-        os.makedirs(job_dir, exist_ok=True)
+        return self._submit(job_info)
 
-        job_json_path = os.path.join(job_dir, "job.json")
-        job_info.save(job_json_path)
+    def submit_variants_job(self, prompt:str, pixel_art_size:Literal[32, 48, 64, 128], count:int=4, seeds:list[int]|None=None, model:str|None=None, speed:SpeedTier="quality", priority:int=0, client_id:str|None=None) -> ImageJobInfo:
+        """
+        同じプロンプトをシードを変えて生成し、スプライトシート（output.png）とアトラス（atlas.json）・フレーム（frames/）にまとめるジョブを投入する。
+        全フレームを1回のパイプライン呼び出しで生成する。同じ条件の要求は生成済みのスプライトシートを再利用する。
+        :param count: フレーム数（seedsを指定した場合はseedsの数）
+        :param seeds: フレームごとの乱数シード（NoneならDEFAULT_SEEDから連番）
+        :param speed: 速度の段階（サンプラーとステップ数を決める）
+        :param priority: ディスパッチの優先度（大きいほど先に始まる）
+        :param client_id: 投入したクライアント（クライアントごとの同時実行数の上限に使う）
+        :raises ValueError: フレーム数が1〜MAX_VARIANTSでない場合
+        """
+        if seeds is None:
+            seeds = [DEFAULT_SEED + i for i in range(count)]
+        if not 1 <= len(seeds) <= MAX_VARIANTS:
+            raise ValueError(f"フレーム数は1〜{MAX_VARIANTS}で指定してください: {len(seeds)}")
+        job_info = ImageJobInfo.new_variants(
+            prompt=prompt,
+            pixel_art_size=pixel_art_size,
+            seeds=seeds,
+            model=model,
+            speed=speed,
+            priority=priority,
+            client_id=client_id,
+        )
+        self._admit_variants(job_info)
+        return self._submit(job_info)
+
+    def _admit_variants(self, job_info: ImageJobInfo) -> None:
+        """
+        メモリの上限（WorkerConfig.memory_budget_bytes）を指定した場合、全フレームを1回で生成したときのメモリを見積もり、
+        上限を超えるなら上限に収まる枚数ずつに分けて生成する。1枚でも収まらなければ断る
+        :raises ValueError: 1枚でも上限に収まらない場合
+        """
+        budget = self.worker_config.memory_budget_bytes
+        if budget is None:
+            return
+        model_info = MODEL_IDS[resolve_model_key(job_info.model, job_info.pixel_art_size)]
+        width, height = _generation_size(job_info)
+        count = len(job_info.variant_seeds or [])
+        single = plan_memory(model_info, width, height).peak_bytes
+        if single > budget:
+            raise ValueError(f"{width}x{height}の生成には約{single >> 20}MBのメモリが必要で、上限の{budget >> 20}MBを超えます。小さいサイズを指定してください。")
+        frames = max_batch_size(model_info, width, height, budget, count)
+        if frames < count:
+            job_info.frames_per_call = frames
+            logger.info(f"[ImageJobManager] メモリの上限に収めるため{count}枚を{frames}枚ずつ生成します: {job_info.job_id}")
+        job_info.memory_estimate_bytes = plan_memory(model_info, width, height, frames).peak_bytes
+
+    def _submit(self, job_info: ImageJobInfo) -> ImageJobInfo:
+        """
+        ジョブを登録してワーカーに投入する。同じ条件の要求は実行中のジョブや生成済みの結果を再利用する
+        """
+        request_key = _request_key(job_info)
+        job_info.request_key = request_key
+        with self._submit_lock:
+            with self._lock:
+                inflight_id = self._inflight.get(request_key)
+            if inflight_id is not None:
+                try:
+                    inflight = self.get_job(inflight_id)
+                    if inflight.status in (JobStatus.not_start, JobStatus.running):
+                        logger.info(f"[ImageJobManager] 同じ条件のジョブが実行中のため相乗りします: {inflight_id}")
+                        with self._lock:
+                            self._attached[inflight_id] = self._attached.get(inflight_id, 1) + 1
+                        return inflight
+                except KeyError:
+                    pass
+
+            job_dir = os.path.join(self.jobs_dir, job_info.job_id)
+            os.makedirs(job_dir, exist_ok=True)
+            if self._results.link_to(request_key, self._get_image_path(job_info.job_id)):
+                logger.info(f"[ImageJobManager] 生成済みの結果を再利用します: {job_info.job_id}")
+                if job_info.variant_seeds:
+                    job_info.atlas = split_sprite_sheet(job_dir, job_info.variant_seeds)
+                job_info.cached = True
+                job_info.set_start()
+                job_info.set_finished()
+                _save_job(self.jobs_dir, job_info, self._index, self._journal)
+                self._metrics.observe(job_info.status.value, cached=True)
+                return job_info
+
+            _save_job(self.jobs_dir, job_info, self._index, self._journal)
+            with self._lock:
+                self._inflight[request_key] = job_info.job_id
 
         # ワーカープロセスにジョブを投入
-        self._job_queue.put(job_info.job_id)
+        self._enqueue(job_info)
         return job_info
 
     def list_jobs(self) -> list[ImageJobInfo]:
         """
         ジョブ一覧を取得する。
-        :return: 各ジョブのjob_id, status, 時刻, params等を含むリスト
+        :return: 各ジョブのjob_id, status, 時刻, params等を含むリスト（start_time降順）
         """
-        jobs: list[ImageJobInfo] = []
-        jobs_path = Path(self.jobs_dir)
-        for job_json_path in jobs_path.glob("*/job.json"):
-            try:
-                job_info = ImageJobInfo.load(str(job_json_path))
-                if job_info:
-                    jobs.append(job_info)
-            except Exception:
-                # job.jsonが壊れている場合はスキップ
-                continue
-        # start_time降順でソート
-        jobs.sort(key=lambda x: x.start_time or "", reverse=True)
-        return jobs
+        return [ImageJobInfo.model_validate_json(data) for data in self._index.list_json()]
+
+    MAX_PAGE_SIZE: ClassVar[int] = 200
+
+    def query_jobs(
+        self,
+        status: list[JobStatus] | None = None,
+        since: str | None = None,
+        until: str | None = None,
+        prompt_contains: str | None = None,
+        cursor: str | None = None,
+        limit: int = 20,
+    ) -> JobListPage:
+        """
+        ジョブ一覧の要約を、条件で絞り込んでstart_time降順に1ページ分取得する。
+        :param status: ステータスの絞り込み（Noneなら全て）
+        :param since: この時刻以降に開始したジョブ（ISO 8601）
+        :param until: この時刻より前に開始したジョブ（ISO 8601）
+        :param prompt_contains: プロンプトに含まれる文字列
+        :param cursor: 前のページで返されたnext_cursor
+        :param limit: 1ページの件数（最大MAX_PAGE_SIZE）
+        :return: 要約のリストと次ページのカーソル
+        """
+        limit = max(1, min(int(limit), self.MAX_PAGE_SIZE))
+        rows, next_cursor = self._index.query(
+            statuses=[JobStatus(s).value for s in status] if status else None,
+            since=_normalize_time(since),
+            until=_normalize_time(until),
+            prompt_contains=prompt_contains,
+            cursor=cursor,
+            limit=limit,
+        )
+        jobs = [ImageJobSummary.from_row(row) for row in rows]
+        if any(job.status == JobStatus.not_start for job in jobs):
+            estimates = self._queue_estimates()
+            for job in jobs:
+                if job.job_id in estimates:
+                    job.queue_position, job.estimated_start_time = _queue_fields(estimates[job.job_id])
+        return JobListPage(jobs=jobs, next_cursor=next_cursor)
 
     def get_job(self, job_id: str) -> ImageJobInfo:
         """
@@ -305,28 +1764,69 @@ class ImageJobManager:
         :param job_id: ジョブID
         :return: ジョブ詳細情報（job.json内容＋ログ等）
         """
+        data = self._index.get_json(job_id)
+        if data is not None:
+            return self._with_progress(ImageJobInfo.model_validate_json(data))
+        # インデックス作成前のジョブ
         job_json_path = self._get_json_path(job_id)
         if not os.path.isfile(job_json_path):
             raise KeyError(f"job_id not found: {job_id}")
         job_info = ImageJobInfo.load(job_json_path)
+        self._index.upsert(job_info)
+        return job_info
+
+    def _with_progress(self, job_info: ImageJobInfo) -> ImageJobInfo:
+        """
+        実行中のジョブに、ワーカーから通知された進捗（ステップ数・ETA）を設定する。
+        実行待ちのジョブには待ち順と開始時刻の見積もりを設定する
+        """
+        if job_info.status == JobStatus.not_start:
+            estimate = self._queue_estimates().get(job_info.job_id)
+            if estimate is not None:
+                job_info.queue_position, job_info.estimated_start_time = _queue_fields(estimate)
+            return job_info
+        if job_info.status != JobStatus.running:
+            return job_info
+        with self._lock:
+            progress = self._progress.get(job_info.job_id)
+            if progress is not None:
+                job_info.current_step = progress.step
+                job_info.total_steps = progress.total
+                job_info.eta_seconds = progress.eta()
+                if progress.preview_step is not None:
+                    job_info.preview_step = progress.preview_step
+                    job_info.preview_path = self._get_preview_path(job_info.job_id)
         return job_info
 
     def cancel_job(self, job_id: str) -> str:
         """
         実行中ジョブをキャンセルする。
+        同じ条件の要求が相乗りしているジョブは、要求1件分の取り下げとして数え、最後の要求が取り下げられたときにキャンセルする
         :param job_id: ジョブID
         :return: ジョブ詳細情報
         """
         job_json_path = self._get_json_path(job_id)
         if not os.path.isfile(job_json_path):
             return "ジョブのキャンセルに失敗しました。"
+        with self._lock:
+            attached = self._attached.get(job_id, 1)
+            if attached > 1:
+                self._attached[job_id] = attached - 1
+        if attached > 1:
+            return f"ジョブ {job_id} は同じ条件の他の要求（{attached - 1}件）と共有しているため、キャンセルせずに要求を1件取り下げました。"
         cancel_json_path = os.path.join(os.path.dirname(job_json_path), "cancel.json")
         os.rename(job_json_path, cancel_json_path)
-        if os.path.isfile(job_json_path) or not os.path.islink(cancel_json_path):
+        if os.path.isfile(job_json_path) or not os.path.isfile(cancel_json_path):
             return "ジョブのキャンセルに失敗しました。"
         job_info = ImageJobInfo.load(cancel_json_path)
         job_info.set_cancel()
-        job_info.save(cancel_json_path)
+        _save_job(self.jobs_dir, job_info, self._index, self._journal, view="cancel.json")
+        with self._lock:
+            self._inflight = {key: inflight_id for key, inflight_id in self._inflight.items() if inflight_id != job_id}
+            self._attached.pop(job_id, None)
+            # ディスパッチ前のジョブはワーカーに渡さない。実行中のジョブはワーカーが次のステップで中断する
+            self._pending = [job for job in self._pending if job.job_id != job_id]
+        self._notify_watchers([job_id])
 
         return f"ジョブ {job_id} をキャンセルしました。"
 
@@ -338,11 +1838,180 @@ class ImageJobManager:
         image_path = self._get_image_path(job_id)
         if os.path.isfile(image_path):
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            if os.path.isfile(os.path.join(self.jobs_dir, job_id, ATLAS_FILE)):
+                # バリエーションのジョブはアトラスとフレームも書き出す
+                written = export_sprite_sheet(os.path.join(self.jobs_dir, job_id), output_path)
+                return "success, copy sprite sheet to " + ", ".join(written)
             shutil.copy(image_path, output_path)
             return "success, copy image to " + output_path
         else:
             return "画像が見つかりません: " + image_path
 
+    def get_image_bytes(self, job_id: str, format: ImageFormat = "png", max_size: int | None = None) -> bytes:
+        """
+        生成された画像をエンコード済みのバイト列で返す。最近の出力はメモリ上のキャッシュから返す
+        :param job_id: ジョブID
+        :param format: 画像形式（png, webp, jpeg）
+        :param max_size: 長辺の最大ピクセル数（Noneなら元のサイズ）
+        :raises KeyError: 画像が見つからない場合
+        """
+        key = (job_id, format, max_size)
+        original_key = (job_id, "png", None)
+        with self._lock:
+            data = self._outputs.get(key)
+            original = self._outputs.get(original_key) if data is None and key != original_key else None
+        if data is not None:
+            return data
+        if original is None:
+            image_path = self._get_image_path(job_id)
+            if not os.path.isfile(image_path):
+                raise KeyError(f"画像が見つかりません: {job_id}")
+            with open(image_path, "rb") as f:
+                original = f.read()
+            with self._lock:
+                self._outputs.put(original_key, original)
+        if key == original_key:
+            return original
+        pixel_art = self.get_job(job_id).pixel_art_size is not None
+        data = convert_image(original, format, max_size, pixel_art=pixel_art)
+        with self._lock:
+            self._outputs.put(key, data)
+        return data
+
+    def get_preview_bytes(self, job_id: str, format: ImageFormat = "png", max_size: int | None = None) -> bytes:
+        """
+        実行中のジョブの最新のプレビュー画像を返す。プレビューは毎回書き換わるのでキャッシュしない
+        :raises KeyError: プレビューが見つからない場合
+        """
+        try:
+            with open(self._get_preview_path(job_id), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            raise KeyError(f"プレビューが見つかりません: {job_id}")
+        if format == "png" and max_size is None:
+            return data
+        return convert_image(data, format, max_size, pixel_art=False)
+
+    def _gc_loop(self) -> None:
+        """
+        保持ポリシーを定期的に適用する。生成を邪魔しないよう、このスレッドの優先度を下げる
+        """
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except Exception:
+            # Linux以外ではスレッド単位で優先度を変えられない
+            pass
+        while not self._gc_stop.is_set():
+            try:
+                self.run_retention()
+            except Exception as e:
+                logger.error(f"[ImageJobManager] 保持ポリシーの適用に失敗しました: {e}")
+            self._gc_stop.wait(self.worker_config.retention.interval)
+
+    def run_retention(self, dry_run: bool = False) -> PurgeResult:
+        """
+        終了したジョブのディスク使用量を台帳に記録し、保持ポリシーを超えたジョブを削除する
+        :param dry_run: Trueなら削除せず、削除対象だけを返す
+        """
+        with self._gc_lock:
+            while not self._gc_stop.is_set() and measure_unmeasured(self._index, self.jobs_dir, results=self._results):
+                pass
+            remeasure_shared(self._index, self.jobs_dir, results=self._results)
+            policy = self.worker_config.retention
+            victims = select_expired(self._index, policy) if policy.enabled else {}
+            result = self._delete_jobs(victims, dry_run)
+            self._gc_stats.last_gc_time = datetime.now().astimezone().isoformat()
+        if result.deleted_jobs:
+            logger.info(f"[ImageJobManager] 保持ポリシーにより{result.deleted_jobs}件のジョブを削除しました ({result.reclaimed_bytes}バイト)")
+        return result
+
+    MAX_PURGE_JOBS: ClassVar[int] = 1000
+
+    def purge_jobs(
+        self,
+        status: list[JobStatus] | None = None,
+        older_than_days: float | None = None,
+        job_ids: list[str] | None = None,
+        dry_run: bool = False,
+    ) -> PurgeResult:
+        """
+        条件に合う終了済みのジョブを削除する。条件を指定しなければ保持ポリシーを今すぐ適用する
+        :param status: 削除するステータス（Noneなら終了済みのすべて。実行待ち・実行中は削除しない）
+        :param older_than_days: この日数より前に開始したジョブに限る
+        :param job_ids: 削除するジョブID
+        :param dry_run: Trueなら削除せず、削除対象だけを返す
+        :return: 削除したジョブ数と空いたバイト数（1回に最大MAX_PURGE_JOBS件）
+        """
+        if status is None and older_than_days is None and job_ids is None:
+            return self.run_retention(dry_run)
+        statuses = [JobStatus(s).value for s in status] if status else list(FINISHED_STATUSES)
+        statuses = [s for s in statuses if s in FINISHED_STATUSES]
+        before = None
+        if older_than_days is not None:
+            before = (datetime.now().astimezone() - timedelta(days=older_than_days)).isoformat()
+        with self._gc_lock:
+            victims: dict[str, int] = {}
+            if job_ids is not None:
+                for job_id in job_ids[:self.MAX_PURGE_JOBS]:
+                    data = self._index.get_json(job_id)
+                    if data is None:
+                        continue
+                    job = json.loads(data)
+                    if job["status"] in statuses and (before is None or job["start_time"] < before):
+                        victims[job_id] = 0
+            elif statuses:
+                victims = dict(self._index.oldest(statuses, before=before, limit=self.MAX_PURGE_JOBS))
+            return self._delete_jobs(victims, dry_run)
+
+    def _delete_jobs(self, victims: dict[str, int], dry_run: bool) -> PurgeResult:
+        """
+        ジョブを削除する。ジャーナルに削除を記録してから、インデックスとジョブディレクトリを消す
+        :param victims: job_id -> 台帳のディスク使用量（未記録なら0）
+        """
+        with self._lock:
+            # ワーカーに割り当て済みのジョブは、キャンセル済みでも中断を待ってから消す
+            busy = {job_id for worker in self._workers for job_id in worker.assigned} | set(self._progress)
+        job_ids = [job_id for job_id in victims if job_id not in busy]
+        sizes = {job_id: victims[job_id] or measure_dir(os.path.join(self.jobs_dir, job_id)) for job_id in job_ids}
+        result = PurgeResult(deleted_jobs=len(job_ids), reclaimed_bytes=sum(sizes.values()), dry_run=dry_run, job_ids=job_ids)
+        if dry_run or not job_ids:
+            return result
+        self._journal.append_many([{"job_id": job_id, "deleted": True} for job_id in job_ids])
+        self._index.delete(job_ids)
+        for job_id in job_ids:
+            shutil.rmtree(os.path.join(self.jobs_dir, job_id), ignore_errors=True)
+        with self._lock:
+            for job_id in job_ids:
+                self._outputs.discard(job_id)
+            self._gc_stats.deleted_jobs += len(job_ids)
+            self._gc_stats.reclaimed_bytes += result.reclaimed_bytes
+        return result
+
+    def get_storage_stats(self) -> StorageStats:
+        """
+        ジョブディレクトリのディスク使用量と、保持ポリシーで削除した量
+        """
+        measured_jobs, total_bytes = self._index.size_totals()
+        with self._lock:
+            return self._gc_stats.model_copy(update={"jobs": self._index.count(), "measured_jobs": measured_jobs, "total_bytes": total_bytes})
+
+    def get_output_cache_stats(self) -> dict[str, int]:
+        """出力画像キャッシュのヒット・ミス数と保持状況"""
+        with self._lock:
+            return self._outputs.stats()
+
+    def get_metrics(self) -> MetricsSnapshot:
+        """
+        起動してから終了したジョブの段階ごとの所要時間のヒストグラムとワーカーのメモリ使用量
+        """
+        return self._metrics.snapshot()
+
+    def get_metrics_text(self) -> str:
+        """
+        get_metricsの内容をPrometheusのテキスト形式で返す
+        """
+        return self._metrics.to_prometheus()
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
     logger.info("[ImageJobManager] このファイルは直接実行できません。")
@@ -1,92 +1,337 @@
 if __name__ == "__main__":
     import sys,os
     sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from mcp.server.fastmcp import FastMCP
-from typing import Any, Literal, Annotated
+import asyncio
+import functools
+from mcp.server.fastmcp import Context, FastMCP, Image
+from typing import Any, Callable, Literal, Annotated, TypeVar
+
+import anyio.to_thread
 
 import logging
 logger = logging.getLogger(__name__)
 
 
 from pydantic import BaseModel
-from pixelart_mcp.image_jobs import ImageJobManager, ImageJobInfo
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+from pixelart_mcp.image_jobs import HealthStatus, ImageJobManager, ImageJobInfo, JobListPage, JobStatus, WorkerConfig, WorkerPoolStatus
+from pixelart_mcp.image_output import ImageFormat
+from pixelart_mcp.job_scheduler import SchedulingPolicy
+from pixelart_mcp.retention import PurgeResult, RetentionPolicy, StorageStats
+from pixelart_mcp.samplers import SpeedTier
 
 class aaa(BaseModel):
     job_id: str
 
 
-def create_mcp():
+T = TypeVar("T")
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    ファイルやSQLiteを触るブロッキングな処理をスレッドプールで実行し、イベントループを止めないようにする
+    """
+    return await anyio.to_thread.run_sync(functools.partial(func, *args, **kwargs))
+
+
+async def wait_for_job(job_manager: ImageJobManager, job_id: str, timeout: float, ctx: Context | None = None) -> ImageJobInfo:
+    """
+    ジョブが終わる（またはtimeout秒経つ）まで待つ。ワーカーからの進捗・完了通知で起きるので、ポーリングしない
+    :param ctx: 指定するとステップの進捗をprogress通知で送る
+    :return: 待ち終わった時点のジョブ詳細情報
+    """
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+    # 通知はワーカー通知を処理するスレッドから来る
+    unwatch = job_manager.watch_job(job_id, lambda: loop.call_soon_threadsafe(changed.set))
+    try:
+        deadline = loop.time() + timeout
+        reported: tuple[int | None, int | None] = (None, None)
+        job_info = await run_blocking(job_manager.get_job, job_id)
+        while job_info.status in (JobStatus.not_start, JobStatus.running):
+            current = (job_info.current_step, job_info.total_steps)
+            if ctx is not None and job_info.current_step is not None and current != reported:
+                reported = current
+                message = f"eta {job_info.eta_seconds:.1f}s" if job_info.eta_seconds is not None else None
+                await ctx.report_progress(job_info.current_step, job_info.total_steps, message)
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+            changed.clear()
+            job_info = await run_blocking(job_manager.get_job, job_id)
+        return job_info
+    finally:
+        unwatch()
+
+
+def client_key(ctx: Context) -> str | None:
+    """
+    クライアントごとの同時実行数の上限に使う、要求元のクライアントのキー。
+    クライアントIDが無ければセッションごとに分ける（セッションも無ければNone）
+    """
+    try:
+        if ctx.client_id:
+            return ctx.client_id
+        return f"session-{id(ctx.session)}"
+    except (ValueError, AttributeError):
+        return None
+
+
+def create_mcp(worker_config: WorkerConfig | None = None, image_dir: str | None = None):
     mcp = FastMCP("PixelArt Image MCP")
-    job_manager = ImageJobManager()
+    job_manager = ImageJobManager(image_dir=image_dir, worker_config=worker_config)
 
     @mcp.tool(
         title="プロンプト(英文)から画像を生成します。",
-        description="Stable Diffusion等のモデルを用いて、指定したプロンプト(英文)から画像を生成します。"
+        description=(
+            "Stable Diffusion等のモデルを用いて、指定したプロンプト(英文)から画像を生成します。"
+            "同じプロンプト・サイズ・seedの要求は生成済みの画像を再利用します。別の画像が欲しい場合はseedを変えてください。"
+            "speedで速度と画質の釣り合いを選べます(quality: 既定のステップ数 / fast: DPM-Solver++で約20ステップ / turbo: LCM-LoRAで6ステップ)。"
+            "メモリの上限を超える大きさは、小さく生成して拡大するか、エラーになります(サーバーの設定による)。"
+            "実行待ちのジョブは小さく速いものから始まります。priorityを大きくすると先に始まります。"
+        )
     )
-    def generate_image_tool(
+    async def generate_image_tool(
         prompt: str,
+        ctx: Context,
         width: int = 512,
         height: int = 512,
+        seed: int | None = None,
+        speed: SpeedTier = "quality",
+        priority: int = 0,
     ) -> dict[str, Any]:
         """
         画像生成ジョブを投入し、ジョブIDを返す
         """
-        job_id = job_manager.submit_image_job(prompt, width, height)
+        job_id = await run_blocking(job_manager.submit_image_job, prompt, width, height, seed=seed, speed=speed,
+                                    priority=priority, client_id=client_key(ctx))
         return {"job_id": job_id}
 
     @mcp.tool(
         title="プロンプト(英文)からピクセルアート画像を生成します。",
-        description="指定したプロンプト(英文)からピクセルアート画像を生成します。"
+        description=(
+            "指定したプロンプト(英文)からピクセルアート画像を生成します。"
+            "同じプロンプト・サイズ・seedの要求は生成済みの画像を再利用します。別の画像が欲しい場合はseedを変えてください。"
+            "speedで速度と画質の釣り合いを選べます(quality: 既定のステップ数 / fast: DPM-Solver++で約20ステップ / turbo: LCM-LoRAで6ステップ)。"
+            "実行待ちのジョブは小さく速いものから始まります。priorityを大きくすると先に始まります。"
+        )
     )
-    def generate_pixelart_tool(
+    async def generate_pixelart_tool(
         prompt: str,
+        ctx: Context,
         pixel_art_mode: Literal[32, 48, 64, 128] = 64,
+        seed: int | None = None,
+        speed: SpeedTier = "quality",
+        priority: int = 0,
     ) -> dict[str, Any]:
         """
         ピクセルアート生成ジョブを投入し、ジョブIDを返す
         """
-        job_id = job_manager.submit_pixelart_job(prompt,pixel_art_mode)
+        job_id = await run_blocking(job_manager.submit_pixelart_job, prompt, pixel_art_mode, seed=seed, speed=speed,
+                                    priority=priority, client_id=client_key(ctx))
+        return {"job_id": job_id}
+
+    @mcp.tool(
+        title="同じプロンプト(英文)のピクセルアートのバリエーションをスプライトシートにまとめて生成します。",
+        description=(
+            "指定したプロンプト(英文)のピクセルアートを、seedを変えてcount枚(seedsを指定した場合はその数。最大16枚)まとめて1回で生成し、"
+            "1枚のスプライトシートとJSONのアトラス(TexturePackerのJSON Array形式。フレームごとの位置とseed)を作ります。"
+            "generate_pixelart_toolを繰り返し呼ぶより速く終わります。"
+            "get_image_toolはスプライトシートを返し、output_pathを指定するとアトラス(同じ名前の.json)と各フレーム(<名前>_frames/)も書き出します。"
+            "get_job_toolのatlasでもアトラスを確認できます。"
+        )
+    )
+    async def generate_variants_tool(
+        prompt: str,
+        ctx: Context,
+        count: int = 4,
+        seeds: list[int] | None = None,
+        pixel_art_mode: Literal[32, 48, 64, 128] = 64,
+        speed: SpeedTier = "quality",
+        priority: int = 0,
+    ) -> dict[str, Any]:
+        """
+        バリエーションのジョブを投入し、ジョブIDを返す
+        """
+        job_id = await run_blocking(job_manager.submit_variants_job, prompt, pixel_art_mode, count, seeds=seeds, speed=speed,
+                                    priority=priority, client_id=client_key(ctx))
         return {"job_id": job_id}
 
     @mcp.tool(
         title="ジョブ一覧を取得します。",
-        description="完了・キャンセル・実行中のジョブの一覧を返します。"
+        description=(
+            "ジョブの要約(job_id, status, start_time, elapsed, prompt)を新しい順に1ページ分返します。"
+            "status・開始時刻の範囲(ISO 8601)・プロンプトの部分文字列で絞り込めます。"
+            "next_cursorをcursorに渡すと次のページを取得します。詳細はget_job_toolで取得してください。"
+            "実行待ちのジョブにはqueue_position(1なら次に始まる)とestimated_start_time(開始時刻の見積もり)が入ります。"
+        )
     )
-    def list_jobs_tool() -> list[ImageJobInfo]:
+    async def list_jobs_tool(
+        status: list[JobStatus] | None = None,
+        since: str | None = None,
+        until: str | None = None,
+        prompt_contains: str | None = None,
+        cursor: str | None = None,
+        limit: int = 20,
+    ) -> JobListPage:
         """
         ジョブ一覧を取得する
         """
-        return job_manager.list_jobs()
+        return await run_blocking(
+            job_manager.query_jobs,
+            status=status,
+            since=since,
+            until=until,
+            prompt_contains=prompt_contains,
+            cursor=cursor,
+            limit=limit,
+        )
 
     @mcp.tool(
         title="ジョブ詳細を取得します。",
-        description="指定したジョブIDの詳細情報とログを返します。"
+        description=(
+            "指定したジョブIDの詳細情報とログを返します。実行中はcurrent_step/total_steps/eta_secondsに進捗が入ります。"
+            "プレビューが有効なサーバーでは、途中経過の画像があるとpreview_stepに入ります(get_image_toolのpreview=trueで取得)。"
+            "wait=trueを指定すると、ジョブが終わる(またはtimeout秒経つ)まで待ってから返し、その間の進捗をprogress通知で送ります。"
+        )
     )
-    def get_job_tool(job_id: str) -> ImageJobInfo:
+    async def get_job_tool(job_id: str, ctx: Context, wait: bool = False, timeout: float = 600.0) -> ImageJobInfo:
         """
-        ジョブ詳細を取得する
+        ジョブ詳細を取得する。waitなら完了まで進捗を通知しながら待つ
         """
-        return job_manager.get_job(job_id)
+        if not wait:
+            return await run_blocking(job_manager.get_job, job_id)
+        return await wait_for_job(job_manager, job_id, timeout, ctx)
+
+    @mcp.tool(
+        title="ジョブの完了を待ちます。",
+        description=(
+            "指定したジョブIDのジョブが終わる(またはtimeout秒経つ)まで待ってから、ジョブ詳細を返します。"
+            "get_job_toolを繰り返し呼んで状態を確認する代わりに使えます。待っている間の進捗はprogress通知で送ります。"
+        )
+    )
+    async def wait_for_job_tool(job_id: str, ctx: Context, timeout: float = 600.0) -> ImageJobInfo:
+        """
+        ジョブの完了を待つ
+        """
+        return await wait_for_job(job_manager, job_id, timeout, ctx)
 
     @mcp.tool(
         title="ジョブをキャンセルします。",
-        description="指定したジョブIDのジョブをキャンセルして停止させます。"
+        description=(
+            "指定したジョブIDのジョブをキャンセルして停止させます。"
+            "同じ条件の要求は1つのジョブ（同じジョブID）を共有するため、他の要求も待っているジョブはキャンセルせず、"
+            "その要求だけを取り下げます。共有しているすべての要求が取り下げられるとキャンセルします。"
+        )
     )
-    def cancel_job_tool(job_id: str) -> str:
+    async def cancel_job_tool(job_id: str) -> str:
         """
         ジョブをキャンセルする
         """
-        return job_manager.cancel_job(job_id)
+        return await run_blocking(job_manager.cancel_job, job_id)
 
     @mcp.tool(
         title="ジョブで生成された画像を取得します。",
-        description="指定したジョブIDのジョブで生成された画像を取得します。"
+        description=(
+            "指定したジョブIDのジョブで生成された画像を取得します。"
+            "output_pathを指定するとそのパスへコピーし、省略すると画像そのものを返します。"
+            "画像を返す場合はformat(png/webp/jpeg)と長辺の最大ピクセル数max_sizeを指定できます。"
+            "preview=trueを指定すると、実行中のジョブの途中経過のプレビュー(生成サイズの1/8)を返します。"
+        ),
+        structured_output=False,
     )
-    def get_image_tool(job_id: str, output_path:str) -> str:
+    async def get_image_tool(job_id: str, output_path: str | None = None, format: ImageFormat = "png", max_size: int | None = None, preview: bool = False) -> str | Image:
         """
         ジョブで生成された画像を取得する
         """
-        return job_manager.get_image(job_id, output_path)
+        if preview:
+            try:
+                return Image(data=await run_blocking(job_manager.get_preview_bytes, job_id, format, max_size), format=format)
+            except KeyError as e:
+                return str(e.args[0])
+        if output_path:
+            return await run_blocking(job_manager.get_image, job_id, output_path)
+        try:
+            return Image(data=await run_blocking(job_manager.get_image_bytes, job_id, format, max_size), format=format)
+        except KeyError as e:
+            return str(e.args[0])
+
+    @mcp.tool(
+        title="終了したジョブを削除します。",
+        description=(
+            "終了済み(finished/failed/canceled)のジョブのディレクトリと画像を削除し、削除した件数と空いたバイト数を返します。"
+            "status・開始からの日数older_than_days・job_idsで対象を絞り込めます。条件を省略するとサーバーの保持ポリシーを今すぐ適用します。"
+            "dry_run=trueなら削除せずに対象だけを返します。実行待ち・実行中のジョブは削除しません。"
+        )
+    )
+    async def purge_jobs_tool(
+        status: list[JobStatus] | None = None,
+        older_than_days: float | None = None,
+        job_ids: list[str] | None = None,
+        dry_run: bool = False,
+    ) -> PurgeResult:
+        """
+        終了したジョブを削除する
+        """
+        return await run_blocking(job_manager.purge_jobs, status=status, older_than_days=older_than_days, job_ids=job_ids, dry_run=dry_run)
+
+    @mcp.tool(
+        title="ジョブのディスク使用量を取得します。",
+        description="ジョブ数、終了済みのジョブのディスク使用量の合計、起動後に保持ポリシーやpurge_jobs_toolで削除した件数と空いたバイト数を返します。"
+    )
+    async def get_storage_stats_tool() -> StorageStats:
+        """
+        ディスク使用量を取得する
+        """
+        return await run_blocking(job_manager.get_storage_stats)
+
+    @mcp.tool(
+        title="ワーカープールの状態を取得します。",
+        description="待ちジョブ数と、各ワーカーの稼働状況(busy/idle)・ロード済みモデルを返します。"
+    )
+    async def get_pool_status_tool() -> WorkerPoolStatus:
+        """
+        ワーカープールの状態を取得する
+        """
+        return await run_blocking(job_manager.get_pool_status)
+
+    @mcp.tool(
+        title="サーバーの準備状況を取得します。",
+        description="各ワーカーがジョブを受け付けられるか(ready)と、起動時にウォームアップしたモデルとその所要時間を返します。"
+    )
+    async def get_health_tool() -> HealthStatus:
+        """
+        ウォームアップの状況を取得する
+        """
+        return await run_blocking(job_manager.get_health)
+
+    @mcp.tool(
+        title="ジョブの所要時間のメトリクスを取得します。",
+        description=(
+            "起動してから終了したジョブのステータスごとの件数と、段階ごと(queue_wait/load/encode/denoise/step/decode/resize/save/run)の"
+            "所要時間のヒストグラム、ワーカーの最大メモリ使用量を返します。format=prometheusでPrometheusのテキスト形式、jsonでJSONを返します。"
+        ),
+        structured_output=False,
+    )
+    async def get_metrics_tool(format: Literal["json", "prometheus"] = "json") -> str:
+        """
+        メトリクスを取得する
+        """
+        if format == "prometheus":
+            return job_manager.get_metrics_text()
+        return job_manager.get_metrics().model_dump_json(indent=2)
+
+    @mcp.custom_route("/metrics", methods=["GET"])
+    async def metrics_endpoint(request: Request) -> Response:
+        """
+        streamable-httpで起動したとき、Prometheusがスクレイプできるようメトリクスを返す
+        """
+        return PlainTextResponse(job_manager.get_metrics_text(), media_type="text/plain; version=0.0.4")
 
     return mcp
 
@@ -98,6 +343,19 @@ def run_mcp():
 
     parser = argparse.ArgumentParser()
     parser.add_argument("--log-file", type=str, default="tmp/test.log", help="ログファイルパス")
+    parser.add_argument("--preload", nargs="*", default=[], help="起動時にロード・ウォームアップするモデルキー (例: s2 p1)")
+    parser.add_argument("--torch-threads", type=int, default=None, help="ワーカー1つあたりのtorchのintra-opスレッド数")
+    parser.add_argument("--interop-threads", type=int, default=None, help="ワーカー1つあたりのtorchのinter-opスレッド数")
+    parser.add_argument("--preview-interval", type=int, default=0, help="何ステップごとにプレビュー画像を作るか（0なら作らない）")
+    parser.add_argument("--retention-max-bytes", type=int, default=None, help="終了したジョブのディスク使用量の上限（超えたら古いジョブから削除する）")
+    parser.add_argument("--retention-days", type=float, default=None, help="開始からこの日数を過ぎた終了済みのジョブを削除する")
+    parser.add_argument("--memory-budget", type=int, default=None, help="ワーカー1つあたりのメモリの上限（バイト。超えると見積もられる要求は--memory-policyに従う）")
+    parser.add_argument("--memory-policy", choices=["reject", "downgrade"], default="downgrade", help="メモリの上限を超える要求を断るか、小さく生成して拡大するか")
+    parser.add_argument("--scheduling", choices=["sjf", "fifo"], default="sjf", help="実行待ちのジョブの順序（sjf: 見積もりの所要時間が短い順 / fifo: 投入順）")
+    parser.add_argument("--max-jobs-per-client", type=int, default=None, help="クライアントごとに同時にワーカーへ割り当てるジョブ数の上限")
+    parser.add_argument("--transport", choices=["stdio", "streamable-http"], default="stdio", help="MCPのトランスポート")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="streamable-httpで待ち受けるホスト")
+    parser.add_argument("--port", type=int, default=8000, help="streamable-httpで待ち受けるポート")
     args = parser.parse_args()
 
     logging.basicConfig(
@@ -108,9 +366,21 @@ def run_mcp():
     )
 
     logger.info("run_mcp: start")
-    mcp = create_mcp()
+    retention = RetentionPolicy(max_bytes=args.retention_max_bytes, max_age_days=args.retention_days)
+    mcp = create_mcp(WorkerConfig(
+        preload_models=args.preload,
+        torch_threads=args.torch_threads,
+        interop_threads=args.interop_threads,
+        preview_interval=args.preview_interval,
+        retention=retention,
+        memory_budget_bytes=args.memory_budget,
+        memory_policy=args.memory_policy,
+        scheduling=SchedulingPolicy(order=args.scheduling, max_jobs_per_client=args.max_jobs_per_client),
+    ))
+    mcp.settings.host = args.host
+    mcp.settings.port = args.port
     logger.info("run_mcp: before mcp.run()")
-    mcp.run()
+    mcp.run(transport=args.transport)
     logger.info("run_mcp: after mcp.run()")
 
 if __name__ == "__main__":
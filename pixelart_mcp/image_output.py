@@ -0,0 +1,138 @@
+"""
+生成した画像をメモリ上で受け渡す仕組み。
+ワーカーはエンコード済みの画像を共有メモリに置いて名前だけを通知し、マネージャーはそれを読み取って
+最近の出力をメモリ上のLRUキャッシュに保持する。MCPクライアントへはファイルを経由せずに返す。
+"""
+from __future__ import annotations
+
+import io
+import os
+from collections import OrderedDict
+from multiprocessing import resource_tracker, shared_memory
+from typing import Literal
+
+from PIL import Image
+
+import logging
+logger = logging.getLogger(__name__)
+
+ImageFormat = Literal["png", "webp", "jpeg"]
+
+# (job_id, 形式, 最大辺)
+OutputKey = tuple[str, str, int | None]
+
+
+def share_bytes(data: bytes) -> tuple[str, int]:
+    """
+    バイト列を新しい共有メモリに置く。受け取った側がtake_shared_bytesで解放する
+    :return: (共有メモリ名, バイト数)
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    try:
+        shm.buf[:len(data)] = data
+        # 解放は受け取った側が行う。作成側のresource_trackerが終了時に解放済みの領域を消そうとしないよう登録を外す
+        resource_tracker.unregister(shm._name, "shared_memory")  # type: ignore[attr-defined]
+        return shm.name, len(data)
+    finally:
+        shm.close()
+
+
+def take_shared_bytes(name: str, size: int) -> bytes:
+    """
+    share_bytesで置いたバイト列を読み取り、共有メモリを解放する
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return bytes(shm.buf[:size])
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def discard_shared_bytes(name: str) -> None:
+    """
+    受け取られなかった共有メモリを解放する（受け取り済みなら何もしない）
+    """
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+def save_image(image: Image.Image, path: str) -> bytes:
+    """
+    画像を拡張子の形式でエンコードしてファイルに書き、書いたバイト列を返す（ファイルを読み直さずに使えるように）
+    """
+    buf = io.BytesIO()
+    image.save(buf, format=Image.registered_extensions().get(os.path.splitext(path)[1].lower(), "PNG"))
+    data = buf.getvalue()
+    with open(path, "wb") as f:
+        f.write(data)
+    return data
+
+
+def convert_image(data: bytes, format: ImageFormat = "png", max_size: int | None = None, pixel_art: bool = False) -> bytes:
+    """
+    エンコード済みの画像を、指定の形式・最大辺に変換する
+    :param data: 元の画像（PNG等）
+    :param max_size: 長辺の最大ピクセル数（Noneなら縮小しない）
+    :param pixel_art: ピクセルアートならドットがつぶれないよう最近傍法で縮小する
+    """
+    image = Image.open(io.BytesIO(data))
+    if max_size is not None and max(image.size) > max_size:
+        image.thumbnail((max_size, max_size), resample=Image.NEAREST if pixel_art else Image.LANCZOS)
+    if format == "jpeg" and image.mode != "RGB":
+        image = image.convert("RGB")
+    out = io.BytesIO()
+    image.save(out, format=format.upper())
+    return out.getvalue()
+
+
+class ImageBytesCache:
+    """
+    エンコード済み画像のLRUキャッシュ。キーは (job_id, 形式, 最大辺)。合計バイト数で上限を設ける
+    """
+
+    def __init__(self, max_bytes: int = 64 << 20) -> None:
+        """
+        :param max_bytes: 保持する画像の合計バイト数の上限（0以下なら保持しない）
+        """
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[OutputKey, bytes] = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key: OutputKey) -> bool:
+        return key in self._entries
+
+    def get(self, key: OutputKey) -> bytes | None:
+        data = self._entries.get(key)
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return data
+
+    def put(self, key: OutputKey, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._total_bytes -= len(old)
+        self._entries[key] = data
+        self._total_bytes += len(data)
+        while self._total_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._total_bytes -= len(evicted)
+
+    def discard(self, job_id: str) -> None:
+        """job_idの画像をすべての形式・サイズについて破棄する"""
+        for key in [key for key in self._entries if key[0] == job_id]:
+            self._total_bytes -= len(self._entries.pop(key))
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "bytes": self._total_bytes}
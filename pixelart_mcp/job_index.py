@@ -0,0 +1,360 @@
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import logging
+logger = logging.getLogger(__name__)
+
+if TYPE_CHECKING:
+    from .image_jobs import ImageJobInfo
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    start_time TEXT NOT NULL,
+    end_time TEXT,
+    elapsed REAL,
+    prompt TEXT NOT NULL,
+    image_width INTEGER,
+    image_height INTEGER,
+    pixel_art_size INTEGER,
+    model TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_start_time ON jobs (start_time DESC, job_id DESC);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, start_time DESC);
+CREATE TABLE IF NOT EXISTS job_sizes (
+    job_id TEXT PRIMARY KEY,
+    bytes INTEGER NOT NULL
+);
+"""
+
+# 以前のバージョンで作ったインデックスに追加する列
+# shared: ほかにもリンクがあるファイル（結果ストア・再利用したジョブと共有するoutput.png）を持つか。
+# リンク先が消えると使用量が変わるので、保持ポリシーの適用のたびに測り直す
+_MIGRATIONS = {
+    "job_sizes": {"shared": "INTEGER NOT NULL DEFAULT 0"},
+}
+
+_COLUMNS = ("job_id", "status", "start_time", "end_time", "elapsed", "prompt", "image_width", "image_height", "pixel_art_size", "model", "data")
+
+
+def _row_from_dict(data: dict[str, Any]) -> tuple[Any, ...]:
+    status = data["status"]
+    return (
+        data["job_id"],
+        getattr(status, "value", status),
+        data["start_time"],
+        data.get("end_time"),
+        data.get("elapsed"),
+        data["prompt"],
+        data.get("image_width"),
+        data.get("image_height"),
+        data.get("pixel_art_size"),
+        data.get("model"),
+        json.dumps(data, ensure_ascii=False),
+    )
+
+
+def encode_cursor(start_time: str, job_id: str) -> str:
+    """
+    ページングカーソル（最後に返したジョブの位置）を不透明な文字列にする
+    """
+    raw = json.dumps([start_time, job_id], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    """
+    encode_cursorで作ったカーソルを (start_time, job_id) に戻す
+    :raises ValueError: カーソルが不正な場合
+    """
+    try:
+        start_time, job_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(start_time), str(job_id)
+    except Exception:
+        raise ValueError(f"不正なカーソルです: {cursor}")
+
+
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class JobIndex:
+    """
+    ジョブ情報のSQLiteインデックス。
+    job.jsonの内容をそのまま保持し、ステータス・時刻・プロンプト等の列で検索できるようにする。
+    WALモードで開くため、マネージャーとワーカーの複数プロセスから同時に更新できる。
+    """
+
+    FILE_NAME = "jobs.sqlite3"
+
+    def __init__(self, db_path: str) -> None:
+        """
+        :param db_path: SQLiteファイルのパス
+        """
+        self.db_path = db_path
+        self.created = not os.path.isfile(db_path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        for table, columns in _MIGRATIONS.items():
+            existing = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+            for column, definition in columns.items():
+                if column not in existing:
+                    try:
+                        self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                    except sqlite3.OperationalError:
+                        # 同時に開いた他のプロセスが追加した
+                        pass
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def upsert(self, job_info: ImageJobInfo) -> None:
+        """
+        ジョブ情報を登録・更新する
+        """
+        self.upsert_dict(job_info.model_dump(mode="json"))
+
+    def upsert_dict(self, data: dict[str, Any]) -> None:
+        """
+        job.json形式のdictを登録・更新する
+        """
+        self.upsert_many([data])
+
+    def upsert_many(self, items: list[dict[str, Any]]) -> None:
+        """
+        job.json形式のdictをまとめて1トランザクションで登録・更新する
+        """
+        placeholders = ", ".join("?" for _ in _COLUMNS)
+        rows = [_row_from_dict(data) for data in items]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(f"INSERT OR REPLACE INTO jobs ({', '.join(_COLUMNS)}) VALUES ({placeholders})", rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get_json(self, job_id: str) -> str | None:
+        """
+        job_idのジョブ情報（JSON文字列）を返す。無ければNone
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def list_json(self) -> list[str]:
+        """
+        全ジョブの情報（JSON文字列）をstart_time降順で返す
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT data FROM jobs ORDER BY start_time DESC, job_id DESC").fetchall()
+        return [row[0] for row in rows]
+
+    def query(
+        self,
+        statuses: list[str] | None = None,
+        since: str | None = None,
+        until: str | None = None,
+        prompt_contains: str | None = None,
+        cursor: str | None = None,
+        limit: int = 20,
+    ) -> tuple[list[dict[str, Any]], str | None]:
+        """
+        条件に合うジョブをstart_time降順で最大limit件返す。JSON本体は読まず列だけを返す
+        :param statuses: ステータスの絞り込み（Noneなら全て）
+        :param since: この時刻以降に開始したジョブ（ISO 8601）
+        :param until: この時刻より前に開始したジョブ（ISO 8601）
+        :param prompt_contains: プロンプトに含まれる文字列（大文字小文字を区別しない）
+        :param cursor: 前のページで返されたnext_cursor
+        :param limit: 最大件数
+        :return: (各ジョブの列のdictリスト, 次ページのカーソル（最終ページならNone）)
+        """
+        where: list[str] = []
+        params: list[Any] = []
+        if statuses:
+            where.append(f"status IN ({', '.join('?' for _ in statuses)})")
+            params.extend(statuses)
+        if since:
+            where.append("start_time >= ?")
+            params.append(since)
+        if until:
+            where.append("start_time < ?")
+            params.append(until)
+        if prompt_contains:
+            where.append("prompt LIKE ? ESCAPE '\\'")
+            params.append(f"%{_escape_like(prompt_contains)}%")
+        if cursor:
+            where.append("(start_time, job_id) < (?, ?)")
+            params.extend(decode_cursor(cursor))
+        sql = f"SELECT {', '.join(_COLUMNS[:-1])} FROM jobs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY start_time DESC, job_id DESC LIMIT ?"
+        params.append(limit + 1)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        items = [dict(zip(_COLUMNS[:-1], row)) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit and items:
+            next_cursor = encode_cursor(items[-1]["start_time"], items[-1]["job_id"])
+        return items, next_cursor
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    def delete(self, job_ids: list[str]) -> None:
+        """
+        ジョブとそのディスク使用量の記録を削除する
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany("DELETE FROM jobs WHERE job_id = ?", [(job_id,) for job_id in job_ids])
+                self._conn.executemany("DELETE FROM job_sizes WHERE job_id = ?", [(job_id,) for job_id in job_ids])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # ---- ディスク使用量の台帳 ----
+    # 終了したジョブのディレクトリは以後変わらないので、1回だけ測って記録する
+
+    def unmeasured(self, statuses: list[str], limit: int) -> list[str]:
+        """
+        指定ステータスのジョブのうち、ディスク使用量をまだ記録していないものを古い順に返す
+        """
+        sql = (
+            "SELECT jobs.job_id FROM jobs LEFT JOIN job_sizes ON jobs.job_id = job_sizes.job_id"
+            f" WHERE job_sizes.job_id IS NULL AND jobs.status IN ({', '.join('?' for _ in statuses)})"
+            " ORDER BY jobs.start_time, jobs.job_id LIMIT ?"
+        )
+        with self._lock:
+            return [row[0] for row in self._conn.execute(sql, [*statuses, limit]).fetchall()]
+
+    def set_sizes(self, sizes: dict[str, int], shared: set[str] | None = None) -> None:
+        """
+        ジョブごとのディスク使用量（バイト数）を記録する
+        :param shared: ほかにもリンクがあるファイルを持つジョブ（shared_sizedで測り直す対象になる）
+        """
+        shared = shared or set()
+        rows = [(job_id, size, int(job_id in shared)) for job_id, size in sizes.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO job_sizes (job_id, bytes, shared) VALUES (?, ?, ?)", rows)
+
+    def shared_sized(self, after: str = "", limit: int = 500) -> list[str]:
+        """
+        ほかにもリンクがあるファイルを持つとして記録したジョブを、job_id順にafterより後から返す
+        """
+        sql = "SELECT job_id FROM job_sizes WHERE shared = 1 AND job_id > ? ORDER BY job_id LIMIT ?"
+        with self._lock:
+            return [row[0] for row in self._conn.execute(sql, (after, limit)).fetchall()]
+
+    def size_totals(self) -> tuple[int, int]:
+        """
+        :return: (ディスク使用量を記録したジョブ数, その合計バイト数)
+        """
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM job_sizes").fetchone()
+        return count, total
+
+    def oldest(self, statuses: list[str], before: str | None = None, limit: int = 1000) -> list[tuple[str, int]]:
+        """
+        指定ステータスのジョブを開始時刻の古い順に返す
+        :param before: この時刻より前に開始したジョブに限る（ISO 8601）
+        :return: (job_id, 記録済みのディスク使用量（未記録なら0）) のリスト
+        """
+        sql = (
+            "SELECT jobs.job_id, COALESCE(job_sizes.bytes, 0) FROM jobs LEFT JOIN job_sizes ON jobs.job_id = job_sizes.job_id"
+            f" WHERE jobs.status IN ({', '.join('?' for _ in statuses)})"
+        )
+        params: list[Any] = list(statuses)
+        if before:
+            sql += " AND jobs.start_time < ?"
+            params.append(before)
+        sql += " ORDER BY jobs.start_time, jobs.job_id LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return [(row[0], row[1]) for row in self._conn.execute(sql, params).fetchall()]
+
+    def beyond_newest(self, status: str, keep: int, limit: int = 1000) -> list[tuple[str, int]]:
+        """
+        指定ステータスのジョブのうち、新しい方からkeep件より後のものを古い順に返す
+        :return: (job_id, 記録済みのディスク使用量（未記録なら0）) のリスト
+        """
+        sql = (
+            "SELECT old.job_id, COALESCE(job_sizes.bytes, 0) FROM (SELECT job_id, start_time FROM jobs WHERE status = ?"
+            " ORDER BY start_time DESC, job_id DESC LIMIT -1 OFFSET ?) AS old LEFT JOIN job_sizes ON old.job_id = job_sizes.job_id"
+            " ORDER BY old.start_time, old.job_id LIMIT ?"
+        )
+        with self._lock:
+            return [(row[0], row[1]) for row in self._conn.execute(sql, (status, keep, limit)).fetchall()]
+
+    def rebuild(self, jobs_dir: str) -> int:
+        """
+        ジョブディレクトリのjob.json（無ければcancel.json）からインデックスを作り直す。
+        壊れたファイルはスキップする。
+        :param jobs_dir: ジョブディレクトリの親（{image_dir}/jobs）
+        :return: 登録したジョブ数
+        """
+        rows: list[tuple[Any, ...]] = []
+        for job_dir in Path(jobs_dir).iterdir() if os.path.isdir(jobs_dir) else []:
+            for name in ("job.json", "cancel.json"):
+                path = job_dir / name
+                if not path.is_file():
+                    continue
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        rows.append(_row_from_dict(json.load(f)))
+                except Exception as e:
+                    logger.warning(f"[JobIndex] 読み込めないためスキップします: {path} {e}")
+                break
+        placeholders = ", ".join("?" for _ in _COLUMNS)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM jobs")
+                self._conn.executemany(f"INSERT OR REPLACE INTO jobs ({', '.join(_COLUMNS)}) VALUES ({placeholders})", rows)
+                self._conn.execute("DELETE FROM job_sizes WHERE job_id NOT IN (SELECT job_id FROM jobs)")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        logger.info(f"[JobIndex] インデックスを再構築しました: {len(rows)}件")
+        return len(rows)
+
+
+def main() -> None:
+    from .image_jobs import ImageJobManager
+
+    parser = argparse.ArgumentParser(description="ジョブインデックスの管理")
+    parser.add_argument("command", choices=["rebuild"], help="rebuild: ジョブディレクトリからインデックスを再構築する")
+    parser.add_argument("--image-dir", default=ImageJobManager.DEFAULT_IMAGE_DIR, help=f"ジョブ保存ディレクトリ (デフォルト: {ImageJobManager.DEFAULT_IMAGE_DIR})")
+    args = parser.parse_args()
+
+    index = JobIndex(os.path.join(args.image_dir, JobIndex.FILE_NAME))
+    try:
+        if args.command == "rebuild":
+            count = index.rebuild(os.path.join(args.image_dir, "jobs"))
+            print(f"{count}件のジョブをインデックスに登録しました。")
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class JobJournal:
+    """
+    ジョブの状態遷移の追記専用ジャーナル。1行に1レコード（遷移後のjob.json形式のdict）をJSONで書く。
+    job.jsonとジョブインデックスは、このジャーナルから作り直せる実体化ビューとして扱う。
+    追記は1回のwriteで行い、fsyncはバックグラウンドのスレッドがsync_intervalごとにまとめて行う。
+    マネージャーとワーカーの複数プロセスから追記でき、compactで各ジョブの最新の状態だけを残したファイルに置き換える。
+    """
+
+    FILE_NAME = "jobs.journal"
+    # 正常終了時に書く区切り。これより後のレコードが無ければ、起動時にビューを確認し直さなくてよい
+    CLEAN_SHUTDOWN: dict[str, Any] = {"clean_shutdown": True}
+
+    def __init__(self, path: str, sync_interval: float = 0.05, compact_min_bytes: int = 8 << 20) -> None:
+        """
+        :param path: ジャーナルファイルのパス
+        :param sync_interval: fsyncをまとめる間隔（秒）。0以下なら追記のたびにfsyncする
+        :param compact_min_bytes: maybe_compactで圧縮するファイルサイズの下限
+        """
+        self.path = path
+        self.created = not os.path.isfile(path)
+        self.sync_interval = sync_interval
+        self.compact_min_bytes = compact_min_bytes
+        # 最後に読んだ（replay・compact）ときのレコード数
+        self.records_read = 0
+        self._lock = threading.Lock()
+        # プロセス間の排他用。ジャーナル本体はcompactで置き換わるので別ファイルにする
+        self._lock_fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._dirty = False
+        self._closed = False
+        self._compacted_size = self.size()
+        self._wakeup = threading.Event()
+        self._sync_thread: threading.Thread | None = None
+        if sync_interval > 0:
+            self._sync_thread = threading.Thread(target=self._sync_loop, daemon=True)
+            self._sync_thread.start()
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with self._lock:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _reopen_if_replaced(self) -> None:
+        """
+        他のプロセスがcompactでファイルを置き換えていたら開き直す
+        """
+        try:
+            replaced = os.stat(self.path).st_ino != os.fstat(self._fd).st_ino
+        except FileNotFoundError:
+            replaced = True
+        if replaced:
+            os.close(self._fd)
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def append(self, record: dict[str, Any]) -> None:
+        """
+        レコードを1件追記する。sync_interval以内にfsyncされる
+        """
+        self.append_many([record])
+
+    def append_many(self, records: list[dict[str, Any]]) -> None:
+        """
+        レコードをまとめて追記する
+        """
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+        with self._locked():
+            self._reopen_if_replaced()
+            view = memoryview(data)
+            while view:
+                view = view[os.write(self._fd, view):]
+            self._dirty = True
+        if self._sync_thread is None:
+            self.sync()
+
+    def sync(self) -> None:
+        """
+        追記済みのレコードをディスクへ書き出す
+        """
+        with self._lock:
+            if self._dirty and not self._closed:
+                os.fsync(self._fd)
+                self._dirty = False
+
+    def _sync_loop(self) -> None:
+        while not self._closed:
+            self._wakeup.wait(self.sync_interval)
+            try:
+                self.sync()
+            except Exception as e:
+                logger.error(f"[JobJournal] fsyncに失敗しました: {e}")
+
+    def close(self, clean: bool = False) -> None:
+        """
+        未書き出しのレコードを書き出して閉じる
+        :param clean: 正常終了の区切りを書く（ビューがすべてジャーナルに追いついている場合のみ指定する）
+        """
+        if self._closed:
+            return
+        if clean:
+            self.append(self.CLEAN_SHUTDOWN)
+        self.sync()
+        self._closed = True
+        self._wakeup.set()
+        if self._sync_thread is not None:
+            self._sync_thread.join()
+        with self._lock:
+            os.close(self._fd)
+            os.close(self._lock_fd)
+
+    def _read_states(self) -> tuple[dict[str, dict[str, Any]], set[str]]:
+        states: dict[str, dict[str, Any]] = {}
+        unclean: set[str] = set()
+        self.records_read = 0
+        if not os.path.isfile(self.path):
+            return states, unclean
+        with open(self.path, "rb") as f:
+            for line_no, line in enumerate(f, start=1):
+                self.records_read += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 書き込み途中で止まった末尾の行
+                    logger.warning(f"[JobJournal] 読み込めない行をスキップします: {self.path}:{line_no}")
+                    continue
+                if record.get("clean_shutdown"):
+                    unclean.clear()
+                    continue
+                job_id = record.get("job_id")
+                if not job_id:
+                    continue
+                if record.get("deleted"):
+                    states.pop(job_id, None)
+                    unclean.discard(job_id)
+                    continue
+                # 更新順に並ぶよう入れ直す
+                states.pop(job_id, None)
+                states[job_id] = record
+                unclean.add(job_id)
+        return states, unclean
+
+    def replay(self) -> tuple[dict[str, dict[str, Any]], set[str]]:
+        """
+        ジャーナルを先頭から読み、各ジョブの最新の状態を求める
+        :return: (job_id -> 最新のレコード（最後に更新された順）, 最後の正常終了より後に更新されたjob_id)
+        """
+        with self._locked():
+            return self._read_states()
+
+    def compact(self, clean: bool = False) -> int:
+        """
+        各ジョブの最新の状態だけを残したファイルに置き換える。削除済みのジョブは残さない
+        :param clean: 末尾に正常終了の区切りを書く（ビューがすべてジャーナルに追いついている場合のみ指定する）
+        :return: 残したジョブ数
+        """
+        with self._locked():
+            states, _ = self._read_states()
+            records = list(states.values())
+            if clean:
+                records.append(self.CLEAN_SHUTDOWN)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            dir_fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+            self._reopen_if_replaced()
+            self._dirty = False
+            self._compacted_size = self.size()
+        logger.info(f"[JobJournal] ジャーナルを圧縮しました: {len(states)}件")
+        return len(states)
+
+    def maybe_compact(self) -> bool:
+        """
+        前回の圧縮から2倍以上に（かつcompact_min_bytes以上に）なっていれば圧縮する
+        :return: 圧縮したか
+        """
+        if self.size() < max(self.compact_min_bytes, 2 * self._compacted_size):
+            return False
+        self.compact()
+        return True
+
+    def size(self) -> int:
+        """ジャーナルファイルのバイト数"""
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
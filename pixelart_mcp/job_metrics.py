@@ -0,0 +1,145 @@
+"""
+ジョブの段階ごとの所要時間とメモリ使用量の集計。
+ワーカーが完了したジョブに記録した値をマネージャーがヒストグラムにまとめ、JSONまたはPrometheusのテキスト形式で返す。
+"""
+from __future__ import annotations
+
+import resource
+import sys
+import threading
+from typing import Any
+
+from pydantic import BaseModel
+
+# ヒストグラムの区切り（秒）。+Infは常に付け加える
+STAGE_BUCKETS: tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+# ジョブに記録する段階（generate_imagesのtimingsのキーに、キュー待ちとワーカーでの実行時間を加えたもの）
+JOB_STAGES: tuple[str, ...] = ("queue_wait", "load", "encode", "denoise", "step", "decode", "resize", "save", "run")
+
+
+def peak_rss_bytes() -> int:
+    """
+    このプロセスの最大常駐メモリ（バイト）。Linuxのru_maxrssはKB、macOSはバイト
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return int(peak) if sys.platform == "darwin" else int(peak) * 1024
+
+
+def stage_timings(timings: dict[str, Any]) -> dict[str, float]:
+    """
+    generate_imagesのtimingsを、ジョブに記録する段階ごとの秒数にまとめる（ステップごとの秒数は平均にする）
+    """
+    result = {stage: float(timings[stage]) for stage in JOB_STAGES if isinstance(timings.get(stage), (int, float))}
+    step_seconds = timings.get("step_seconds")
+    if step_seconds:
+        result["step"] = sum(step_seconds) / len(step_seconds)
+    return result
+
+
+class Histogram(BaseModel):
+    # 観測数と合計
+    count: int = 0
+    sum: float = 0.0
+    # 区切りごとの累積の観測数（キーは区切りの値、最後は"+Inf"）
+    buckets: dict[str, int] = {}
+
+
+class MetricsSnapshot(BaseModel):
+    # 終了したジョブ数（ステータスごと。生成済みの結果を再利用したジョブは"cached"にも数える）
+    jobs: dict[str, int] = {}
+    # 段階ごとの所要時間のヒストグラム
+    stages: dict[str, Histogram] = {}
+    # ワーカーごとの最大常駐メモリとデバイスメモリの最大使用量（バイト）
+    worker_peak_rss_bytes: dict[int, int] = {}
+    worker_device_peak_bytes: dict[int, int] = {}
+
+
+class JobMetrics:
+    """
+    終了したジョブの段階ごとの所要時間をヒストグラムに集計する（プロセス内のみ。再起動で0に戻る）
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = STAGE_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._jobs: dict[str, int] = {}
+        # 段階 -> (区切りごとの観測数（累積でない。最後は+Inf）, 観測数, 合計)
+        self._stages: dict[str, tuple[list[int], int, float]] = {}
+        self._peak_rss: dict[int, int] = {}
+        self._device_peak: dict[int, int] = {}
+
+    def observe(
+        self,
+        status: str,
+        timings: dict[str, float] | None = None,
+        worker_id: int | None = None,
+        peak_rss_bytes: int | None = None,
+        device_peak_bytes: int | None = None,
+        cached: bool = False,
+    ) -> None:
+        """
+        終了したジョブ1件の値を集計に加える
+        :param status: ジョブの終了時のステータス
+        :param timings: 段階 -> 秒数
+        """
+        with self._lock:
+            self._jobs[status] = self._jobs.get(status, 0) + 1
+            if cached:
+                self._jobs["cached"] = self._jobs.get("cached", 0) + 1
+            for stage, seconds in (timings or {}).items():
+                counts, count, total = self._stages.get(stage) or ([0] * (len(self.buckets) + 1), 0, 0.0)
+                index = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+                counts[index] += 1
+                self._stages[stage] = (counts, count + 1, total + seconds)
+            if worker_id is not None:
+                if peak_rss_bytes is not None:
+                    self._peak_rss[worker_id] = max(self._peak_rss.get(worker_id, 0), peak_rss_bytes)
+                if device_peak_bytes is not None:
+                    self._device_peak[worker_id] = max(self._device_peak.get(worker_id, 0), device_peak_bytes)
+
+    def snapshot(self) -> MetricsSnapshot:
+        """
+        現在の集計をJSONで返せる形にする
+        """
+        with self._lock:
+            stages: dict[str, Histogram] = {}
+            for stage, (counts, count, total) in self._stages.items():
+                buckets: dict[str, int] = {}
+                cumulative = 0
+                for bound, n in zip([*map(repr, self.buckets), "+Inf"], counts):
+                    cumulative += n
+                    buckets[bound] = cumulative
+                stages[stage] = Histogram(count=count, sum=total, buckets=buckets)
+            return MetricsSnapshot(
+                jobs=dict(self._jobs),
+                stages=stages,
+                worker_peak_rss_bytes=dict(self._peak_rss),
+                worker_device_peak_bytes=dict(self._device_peak),
+            )
+
+    def to_prometheus(self, prefix: str = "pixelart") -> str:
+        """
+        現在の集計をPrometheusのテキスト形式で返す
+        """
+        snapshot = self.snapshot()
+        lines = [f"# HELP {prefix}_jobs_total Finished jobs by status.", f"# TYPE {prefix}_jobs_total counter"]
+        for status, count in sorted(snapshot.jobs.items()):
+            lines.append(f'{prefix}_jobs_total{{status="{status}"}} {count}')
+        name = f"{prefix}_job_stage_seconds"
+        lines += [f"# HELP {name} Time spent in each stage of a job.", f"# TYPE {name} histogram"]
+        for stage, histogram in sorted(snapshot.stages.items()):
+            for bound, count in histogram.buckets.items():
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum!r}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+        for metric, values, help_text in (
+            ("worker_peak_rss_bytes", snapshot.worker_peak_rss_bytes, "Peak resident set size of each worker process."),
+            ("worker_device_peak_bytes", snapshot.worker_device_peak_bytes, "Peak device memory allocated by each worker."),
+        ):
+            if not values:
+                continue
+            lines += [f"# HELP {prefix}_{metric} {help_text}", f"# TYPE {prefix}_{metric} gauge"]
+            for worker_id, value in sorted(values.items()):
+                lines.append(f'{prefix}_{metric}{{worker="{worker_id}"}} {value}')
+        return "\n".join(lines) + "\n"
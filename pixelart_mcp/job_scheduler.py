@@ -0,0 +1,106 @@
+"""
+ディスパッチ待ちのジョブの順序づけと、待ち順・開始時刻の見積もり。
+ジョブの重さはステップ数と生成画素数から見積もり（512x512を1ステップ生成する重さを1単位とする）、
+見積もりの所要時間が短いジョブから割り当てる。待った時間だけ順位を上げる（エイジング）ので、重いジョブも待ち続けることはない。
+MCPサーバーやジョブ管理からも使うので、torch/diffusersは読み込まない。
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Literal, Protocol, Sequence, TypeVar
+
+# 1単位の画素数
+REFERENCE_PIXELS = 512 * 512
+# VAEのデコードなど、ステップ数によらない処理の重さ（ステップ数に換算）
+FIXED_STEPS = 2.0
+# 1単位あたりの秒数の初期値（完了したジョブの実行時間から更新する）
+DEFAULT_SECONDS_PER_UNIT = 1.0
+# 1単位あたりの秒数の指数移動平均の重み
+SECONDS_PER_UNIT_ALPHA = 0.3
+
+
+def job_cost(steps: int, width: int, height: int) -> float:
+    """
+    ジョブの重さの見積もり（512x512を1ステップ生成する重さを1とする）
+    """
+    return (steps + FIXED_STEPS) * width * height / REFERENCE_PIXELS
+
+
+@dataclass
+class SchedulingPolicy:
+    """
+    ディスパッチ待ちのジョブの順序と、クライアントごとの上限
+    """
+    # "sjf": 見積もりの所要時間が短い順（エイジングあり） / "fifo": 投入順
+    order: Literal["sjf", "fifo"] = "sjf"
+    # 1秒待つごとに、見積もりの所要時間から差し引く秒数（大きいほど投入順に近づく。
+    # 1だと混んでいるときにほぼ投入順になる。benchmarks/bench_scheduling.py で比べられる）
+    aging_rate: float = 0.2
+    # 優先度1あたりに見積もりの所要時間から差し引く秒数
+    priority_seconds: float = 60.0
+    # クライアントごとの割り当て済み（実行中・ワーカーでの実行待ち）のジョブ数の上限（Noneなら無制限）
+    max_jobs_per_client: int | None = None
+
+
+class Schedulable(Protocol):
+    cost: float
+    priority: int
+    enqueued_at: float
+
+
+_Job = TypeVar("_Job", bound=Schedulable)
+
+
+class JobScheduler:
+    """
+    ディスパッチ待ちのジョブの順序を決め、完了したジョブの実行時間から1単位あたりの秒数を学習する
+    """
+
+    def __init__(self, policy: SchedulingPolicy | None = None) -> None:
+        self.policy = policy or SchedulingPolicy()
+        self.seconds_per_unit = DEFAULT_SECONDS_PER_UNIT
+
+    def estimated_seconds(self, cost: float) -> float:
+        return cost * self.seconds_per_unit
+
+    def score(self, job: Schedulable, now: float) -> float:
+        """
+        小さいほど先に割り当てる。見積もりの所要時間から、待った時間と優先度の分を差し引く
+        """
+        waited = max(0.0, now - job.enqueued_at)
+        return (self.estimated_seconds(job.cost)
+                - self.policy.aging_rate * waited
+                - self.policy.priority_seconds * job.priority)
+
+    def order(self, jobs: Sequence[_Job], now: float) -> list[_Job]:
+        """
+        割り当てる順に並べる（同じ順位は投入順）
+        """
+        if self.policy.order == "fifo":
+            return sorted(jobs, key=lambda job: job.enqueued_at)
+        return sorted(jobs, key=lambda job: (self.score(job, now), job.enqueued_at))
+
+    def observe(self, cost: float, seconds: float) -> None:
+        """
+        完了したジョブ（バッチ）の重さと実行時間から、1単位あたりの秒数を更新する
+        """
+        if cost <= 0 or seconds <= 0:
+            return
+        self.seconds_per_unit += SECONDS_PER_UNIT_ALPHA * (seconds / cost - self.seconds_per_unit)
+
+    def estimate_starts(self, worker_busy: Sequence[float], queued: Sequence[tuple[str, float]]) -> dict[str, float]:
+        """
+        待っているジョブがそれぞれ何秒後に始まるかを見積もる。割り当てる順に、最も早く空くワーカーで実行するものとする
+        :param worker_busy: ワーカーごとの、今の仕事が終わるまでの秒数
+        :param queued: 割り当てる順の (job_id, 重さ)
+        :return: job_id -> 開始までの秒数（ワーカーが無ければ空）
+        """
+        if not worker_busy:
+            return {}
+        busy = list(worker_busy)
+        starts: dict[str, float] = {}
+        for job_id, cost in queued:
+            i = min(range(len(busy)), key=busy.__getitem__)
+            starts[job_id] = busy[i]
+            busy[i] += self.estimated_seconds(cost)
+        return starts
@@ -0,0 +1,47 @@
+"""
+デノイズ途中の潜在表現から、VAEでデコードせずに低コストなプレビュー画像を作る。
+潜在表現の各チャンネルをRGBへ線形に写すだけなので、解像度は生成サイズの1/8になる。
+"""
+from __future__ import annotations
+
+import torch
+from PIL import Image
+
+# SD1.5系VAEの潜在表現(4ch) -> RGB の近似係数（行: 潜在チャンネル、列: R,G,B）
+LATENT_RGB_FACTORS_SD15: list[list[float]] = [
+    [0.3512, 0.2297, 0.3227],
+    [0.3250, 0.4974, 0.2350],
+    [-0.2829, 0.1762, 0.2721],
+    [-0.2120, -0.2616, -0.7177],
+]
+
+_factors_cache: dict[tuple[torch.dtype, torch.device], torch.Tensor] = {}
+
+
+def _factors(dtype: torch.dtype, device: torch.device) -> torch.Tensor:
+    factors = _factors_cache.get((dtype, device))
+    if factors is None:
+        factors = torch.tensor(LATENT_RGB_FACTORS_SD15, dtype=dtype, device=device)
+        _factors_cache[(dtype, device)] = factors
+    return factors
+
+
+def supports_preview(latents: torch.Tensor) -> bool:
+    """
+    プレビューを作れる潜在表現か（4チャンネルのSD1.5系のみ対応）
+    """
+    return latents.ndim == 4 and latents.shape[1] == len(LATENT_RGB_FACTORS_SD15)
+
+
+def latents_to_images(latents: torch.Tensor) -> list[Image.Image]:
+    """
+    潜在表現 (B, 4, H/8, W/8) をプレビュー画像に変換する
+    :return: バッチの画像ごとのプレビュー（サイズは W/8 x H/8）
+    :raises ValueError: 対応していない潜在表現の場合
+    """
+    if not supports_preview(latents):
+        raise ValueError(f"プレビューに対応していない潜在表現です: shape={tuple(latents.shape)}")
+    with torch.no_grad():
+        rgb = torch.einsum("bchw,cr->bhwr", latents, _factors(latents.dtype, latents.device))
+        rgb = ((rgb + 1.0) * 127.5).clamp(0, 255).to(dtype=torch.uint8, device="cpu").numpy()
+    return [Image.fromarray(image) for image in rgb]
@@ -0,0 +1,102 @@
+"""
+生成に必要なメモリの見積もり。ワーカーでの省メモリ設定の選択と、投入時の受け付け判定に使う。
+MCPサーバーやジョブ管理からも使うので、torch/diffusersは読み込まない。
+係数はSD1.5と同じ構造のUNet/VAE（ランダム重み）をCPUで実行したときの最大常駐メモリの増分から求めた目安。
+benchmarks/bench_memory.py で実測と比べられる。
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+from .models import ModelInfo
+
+DTYPE_BYTES: dict[str, int] = {"float32": 4, "float16": 2, "bfloat16": 2}
+
+# VAEの縮小率
+LATENT_FACTOR = 8
+# SD1.5のパラメータ数（UNet 860M・VAE 84M・テキストエンコーダー 123M）
+MODEL_PARAMS = 1_066_000_000
+# torchとパイプラインの実行に必要な、生成サイズによらないメモリ
+RUNTIME_BYTES = 768 << 20
+# UNetの1回の呼び出しで、潜在表現の1要素（1枚分）あたりに同時に保持する活性の要素数
+UNET_ELEMENTS_PER_TOKEN = 11_500
+# VAEのデコードで、出力の1画素あたりに同時に保持する活性の要素数
+VAE_ELEMENTS_PER_PIXEL = 1_050
+# diffusersがVAEをタイルに分けるときのタイルの辺（SD1.5のVAEのsample_size）
+VAE_TILE_SIZE = 512
+
+
+@dataclass(frozen=True)
+class MemoryPlan:
+    """
+    1回の生成に使う省メモリ設定と、最大メモリ使用量の見積もり
+    """
+    width: int
+    height: int
+    batch_size: int
+    vae_slicing: bool
+    vae_tiling: bool
+    # UNetを分ける領域の辺（画素。Noneなら分けない）
+    unet_tile: int | None
+    peak_bytes: int
+
+
+def estimate_model_bytes(dtype: str) -> int:
+    """
+    ロードしたパイプラインの重みのバイト数の見積もり（パイプラインキャッシュがロード前に空ける量）
+    :param dtype: torchのdtype名
+    """
+    return MODEL_PARAMS * DTYPE_BYTES.get(dtype, 4)
+
+
+def plan_memory(model_info: ModelInfo, width: int, height: int, batch_size: int = 1) -> MemoryPlan:
+    """
+    生成サイズとバッチの枚数から、省メモリ設定（ModelInfo.performance）と最大メモリ使用量を決める。
+    CPUで実行する前提で、dtypeは performance.cpu_dtype を使う
+    """
+    options = model_info.performance
+    element = DTYPE_BYTES.get(options.cpu_dtype, 4)
+    vae_slicing = options.vae_slicing and batch_size > 1
+    vae_tiling = options.vae_tiling_pixels is not None and width * height > options.vae_tiling_pixels
+    unet_tile = None
+    if options.unet_tiling_threshold is not None and max(width, height) > options.unet_tiling_threshold:
+        unet_tile = options.unet_tile_size
+
+    # UNetはCFGで2倍のバッチになる。領域に分けたときは1領域分
+    unet_w, unet_h = (min(width, unet_tile), min(height, unet_tile)) if unet_tile else (width, height)
+    tokens = (unet_w // LATENT_FACTOR) * (unet_h // LATENT_FACTOR)
+    unet_bytes = 2 * batch_size * tokens * UNET_ELEMENTS_PER_TOKEN * element
+    # VAEは同時にデコードする枚数と、1度にデコードする領域の大きさで決まる
+    vae_pixels = min(width, VAE_TILE_SIZE) * min(height, VAE_TILE_SIZE) if vae_tiling else width * height
+    vae_bytes = (1 if vae_slicing else batch_size) * vae_pixels * VAE_ELEMENTS_PER_PIXEL * element
+    # デコードした画像（float32）と潜在表現はバッチ全体を保持する
+    output_bytes = batch_size * width * height * 3 * 4
+    peak = estimate_model_bytes(options.cpu_dtype) + RUNTIME_BYTES + max(unet_bytes, vae_bytes) + output_bytes
+    return MemoryPlan(width, height, batch_size, vae_slicing, vae_tiling, unet_tile, peak)
+
+
+def fit_to_budget(model_info: ModelInfo, width: int, height: int, budget_bytes: int, step: int = 64) -> tuple[int, int] | None:
+    """
+    縦横比を保ったまま、見積もりが budget_bytes に収まる最大の生成サイズを求める
+    :param step: 生成サイズの刻み（縦横ともこの倍数にする）
+    :return: (幅, 高さ)。最小の step x step でも収まらなければNone
+    """
+    scale = 1.0
+    while True:
+        w = max(step, int(width * scale) // step * step)
+        h = max(step, int(height * scale) // step * step)
+        if plan_memory(model_info, w, h).peak_bytes <= budget_bytes:
+            return w, h
+        if w == step and h == step:
+            return None
+        scale *= 0.9
+
+
+def max_batch_size(model_info: ModelInfo, width: int, height: int, budget_bytes: int, limit: int) -> int:
+    """
+    見積もりが budget_bytes に収まるバッチの最大枚数（1枚でも収まらない場合も1）
+    """
+    size = 1
+    while size < limit and plan_memory(model_info, width, height, size + 1).peak_bytes <= budget_bytes:
+        size += 1
+    return size
@@ -0,0 +1,150 @@
+"""
+モデルの定義。
+MCPサーバーやジョブ管理はこのモジュールだけを参照し、torch/diffusersはワーカープロセスでのみ読み込む。
+"""
+import math
+from dataclasses import dataclass, field
+from typing import Literal
+
+# SD1.5向けのLCM-LoRA（speed="turbo"で付ける）
+MODEL_ID_LCM = "latent-consistency/lcm-lora-sdv1-5"
+
+# 生成サイズはこの倍数にする（VAEの1/8とUNetの3回のダウンサンプルで割り切れるサイズ）
+GENERATION_SIZE_MULTIPLE = 64
+
+# ピクセルアート化の前に潜在表現を画像にする方法。
+# "full": 生成サイズのままVAEでデコードする / "reduced": 潜在表現を出力の min_block 倍のサイズまで縮めてからVAEでデコードする /
+# "latent": VAEでデコードせず、潜在表現を線形にRGBへ写す（SD1.5系の4chの潜在表現のみ。他はfullになる）
+PixelDecode = Literal["full", "reduced", "latent"]
+
+default_negave_prompt: str = "low quality, worst quality, normal quality, jpeg artifacts, ugly, duplicate, morbid, mutilated, extra fingers, fewer digits, cropped, worst quality, low quality, normal quality, error, missing fingers, extra digit, fewer digits, bad anatomy, bad hands, text, error, missing fingers, extra digit and fewer digits"
+
+@dataclass
+class PerformanceOptions:
+    """
+    パイプラインのロード時に適用する速度向上の設定
+    """
+    # CPUで使うtorchのdtype名。float16はCPUでは遅いか未対応なので、ModelInfo.dtypeの代わりにこちらを使う。
+    # "bfloat16"はCPUが対応していなければfloat32になる
+    cpu_dtype: str = "float32"
+    # UNetとVAEの重みをchannels_lastのメモリ配置にする（CPUの畳み込みが速くなることが多い）
+    channels_last: bool = True
+    # アテンションを分割して計算する（"auto", "max" またはスライスサイズ。Noneなら分割しない）。メモリは減るが遅くなることがある
+    attention_slicing: str | int | None = None
+    # UNetをtorch.compileする。コンパイルしたパイプラインはパイプラインキャッシュに残り、ジョブをまたいで使う
+    compile_unet: bool = False
+    # torch.compileのmode（Noneなら既定）
+    compile_mode: str | None = None
+    # バッチが2枚以上のとき、VAEで1枚ずつデコードする（VAEのメモリがバッチの枚数倍にならない）
+    vae_slicing: bool = True
+    # 生成サイズの画素数がこれを超えるとVAEをタイルに分けてデコードする（Noneならタイルに分けない）
+    vae_tiling_pixels: int | None = 640 * 640
+    # 生成サイズの辺がこれを超えると、UNetを重なりのある unet_tile_size の領域に分けてデノイズする（Noneなら分けない）。
+    # 領域ごとのノイズ予測を重なりで平均するので、メモリは領域の大きさで決まるが、計算量は重なりの分だけ増える
+    unet_tiling_threshold: int | None = 1024
+    unet_tile_size: int = 512
+    unet_tile_overlap: int = 128
+
+
+@dataclass
+class PixelArtResolution:
+    """
+    ピクセルアート化するときの生成サイズの決め方（以前の常に512x512で生成する動作は min_size=512）
+    """
+    # モデルの学習時の解像度。生成サイズの上限
+    native_size: int = 512
+    # 構図が崩れない最小の生成サイズ
+    min_size: int = 256
+    # 出力の1ピクセルあたり最低何画素（1辺）を生成するか
+    min_block: int = 4
+    decode: PixelDecode = "full"
+
+    def generation_size(self, pixel_art_size: int) -> int:
+        """
+        ピクセルアートのサイズに対する生成サイズ（正方形の1辺）。
+        min_size と出力の min_block 倍以上で、GENERATION_SIZE_MULTIPLE と出力サイズの両方で割り切れる最小のサイズ（native_sizeが上限）
+        """
+        step = math.lcm(GENERATION_SIZE_MULTIPLE, pixel_art_size)
+        size = -(-max(self.min_size, pixel_art_size * self.min_block) // step) * step
+        return min(size, max(self.native_size, pixel_art_size))
+
+
+@dataclass
+class ModelInfo:
+    name: str
+    description: str
+    hf_model_id: str
+    hf_lora_id: str|None = None
+    # 常にLCM-LoRA（lcm_lora_id、未指定ならMODEL_ID_LCM）を付けてLCMスケジューラーで生成する
+    use_lcm:bool = False
+    # speed="turbo"で付けるLCM-LoRA（Noneならturboに対応しない）
+    lcm_lora_id: str|None = None
+    # パイプラインが自身の設定（ステップ数・ガイダンス）で生成し、speedの指定を使わない（LatentConsistencyModelPipelineのモデル）
+    fixed_sampling: bool = False
+    # torchのdtype名（"float32", "float16" 等）
+    dtype: str = "float32"
+    use_safetensors: bool = True
+    num_inference_steps: int = 40
+    # samplers.SAMPLERSのキー（"DDIM", "DPM++", "Euler-a", "LCM"。Noneならモデルの既定）
+    sampler: str|None = None
+    guidance_scale:float|None = None
+    prompt_prefix: str = ""
+    prompt_suffix: str = ""
+    negave_prompt: str = ""
+    performance: PerformanceOptions = field(default_factory=PerformanceOptions)
+    pixel_art: PixelArtResolution = field(default_factory=PixelArtResolution)
+
+MODEL_IDS: dict[str, ModelInfo] = {
+    "s1": ModelInfo(
+        name="SD‑1.5 Base",
+        description="汎用 Stable Diffusion v1.5",
+        hf_model_id="runwayml/stable-diffusion-v1-5",
+        lcm_lora_id=MODEL_ID_LCM,
+        prompt_prefix="",
+        negave_prompt = default_negave_prompt,
+    ),
+    "s2": ModelInfo(
+        name="LCM_Dreamshaper_v7",
+        description="LCM_Dreamshaper_v7",
+        hf_model_id="SimianLuo/LCM_Dreamshaper_v7",
+        fixed_sampling=True,
+        dtype="float16",
+        num_inference_steps=6,
+        prompt_prefix="",
+        negave_prompt = default_negave_prompt,
+    ),
+    "p1": ModelInfo(
+        name="All-In-One Pixel Model",
+        description="for pixel art",
+        hf_model_id="PublicPrompts/All-In-One-Pixel-Model",
+        use_safetensors=False,
+        lcm_lora_id=MODEL_ID_LCM,
+        sampler="DDIM",
+        guidance_scale=10.0,
+        prompt_suffix=",full body game asset, in pixelsprite style",
+    ),
+    "par": ModelInfo(
+        name="PixelArt.Redmond (SD1.5 LoRA)",
+        description="SD1.5 向けドット絵キャラ特化LoRA",
+        hf_model_id="runwayml/stable-diffusion-v1-5",
+        hf_lora_id="artificialguybr/pixelartredmond-1-5v-pixel-art-loras-for-sd-1-5",
+        # use_lcm=True,
+        lcm_lora_id=MODEL_ID_LCM,
+        prompt_suffix=", pixel art, PixArFK,",
+    ),
+}
+"""
+# https://huggingface.co/artificialguybr/pixelartredmond-1-5v-pixel-art-loras-for-sd-1-5
+"""
+
+
+def resolve_model_key(model_id_key: str | None, pixel_art_mode: int | None = None) -> str:
+    """
+    未指定・未知のモデルキーを既定のモデルキーに解決する
+    :param model_id_key: MODEL_IDSのキー
+    :param pixel_art_mode: ピクセルアート化サイズ（指定時はピクセルアート向けの既定モデル）
+    :return: MODEL_IDSに存在するキー
+    """
+    if model_id_key in MODEL_IDS:
+        return model_id_key  # type: ignore[return-value]
+    return "p1" if pixel_art_mode is not None else "s2"
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Any, Callable
+import gc
+
+import logging
+logger = logging.getLogger(__name__)
+
+PipelineKey = tuple[str, str, str]
+
+
+def estimate_pipeline_bytes(pipe: Any) -> int:
+    """
+    パイプラインが保持するパラメータ・バッファのおおよそのバイト数を返す
+    :param pipe: DiffusionPipeline等（componentsを持つオブジェクト）
+    :return: バイト数（推定できない場合は0）
+    """
+    components = getattr(pipe, "components", None)
+    if not isinstance(components, dict):
+        return 0
+    total = 0
+    for module in components.values():
+        for attr in ("parameters", "buffers"):
+            tensors = getattr(module, attr, None)
+            if not callable(tensors):
+                continue
+            try:
+                for t in tensors():
+                    total += t.numel() * t.element_size()
+            except Exception:
+                continue
+    return total
+
+
+class PipelineCache:
+    """
+    ワーカープロセス内でロード済みのパイプラインを保持するLRUキャッシュ。
+    キーは (モデルキー, dtype, device)。エントリ数とメモリ予算の両方で上限を設け、
+    超過したものは最後に使われた時刻が古い順に破棄する。
+    """
+
+    def __init__(self, max_entries: int = 2, max_bytes: int | None = None) -> None:
+        """
+        :param max_entries: 保持するパイプラインの最大数（1以上）
+        :param max_bytes: 保持するパイプラインの合計バイト数の上限（Noneなら無制限）
+        """
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[PipelineKey, tuple[Any, int]] = OrderedDict()
+        self._total_bytes = 0
+        # 一度ロードしたパイプラインのバイト数（破棄した後に再びロードするときの見積もり）
+        self._loaded_bytes: dict[PipelineKey, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model_id_key: str, dtype: Any, device: Any) -> PipelineKey:
+        """
+        キャッシュキーを作成する
+        :param model_id_key: MODEL_IDSのキー
+        :param dtype: torch.dtype
+        :param device: torch.device
+        """
+        return (model_id_key, str(dtype), str(device))
+
+    def __contains__(self, key: PipelineKey) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def keys(self) -> list[PipelineKey]:
+        """古い順のキー一覧"""
+        return list(self._entries.keys())
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def get(self, key: PipelineKey) -> Any | None:
+        """
+        キャッシュからパイプラインを取得する。見つかればLRU順を更新する
+        :return: パイプライン（無ければNone）
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: PipelineKey, pipe: Any, nbytes: int | None = None) -> None:
+        """
+        パイプラインをキャッシュに登録し、上限を超えた分を破棄する
+        :param nbytes: パイプラインのバイト数（Noneなら推定する）
+        """
+        if nbytes is None:
+            nbytes = estimate_pipeline_bytes(pipe)
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._total_bytes -= old[1]
+        self._entries[key] = (pipe, nbytes)
+        self._total_bytes += nbytes
+        self._loaded_bytes[key] = nbytes
+        self._evict()
+
+    def get_or_load(self, key: PipelineKey, loader: Callable[[], Any], nbytes_hint: int | None = None) -> Any:
+        """
+        キャッシュにあればそれを返し、無ければloaderでロードして登録する。
+        ロード中は既存のパイプラインと新しいパイプラインを同時に保持するので、ロードする前に上限に収まるまで破棄する
+        :param loader: パイプラインをロードする関数
+        :param nbytes_hint: ロードするパイプラインのバイト数の見積もり（以前にロードしたことがあれば、そのときの値を使う）
+        """
+        pipe = self.get(key)
+        if pipe is None:
+            self._make_room(self._loaded_bytes.get(key, nbytes_hint or 0))
+            pipe = loader()
+            # 見積もりが外れた場合に備えて、登録後にも上限を確かめる
+            self.put(key, pipe)
+        return pipe
+
+    def _make_room(self, nbytes: int) -> None:
+        """
+        nbytesのパイプラインを新しく登録しても上限に収まるよう、古い順に破棄する
+        """
+        evicted = False
+        while self._entries and (
+            len(self._entries) >= self.max_entries
+            or (self.max_bytes is not None and self._total_bytes + nbytes > self.max_bytes)
+        ):
+            key, (_, size) = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            evicted = True
+            logger.info(f"ロード前にパイプラインをキャッシュから破棄: {key}")
+        if evicted:
+            gc.collect()
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._total_bytes = 0
+        gc.collect()
+
+    def stats(self) -> dict[str, int]:
+        """ヒット・ミス・破棄の各カウンタと現在の保持状況を返す"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+        }
+
+    def _evict(self) -> None:
+        # 直近に登録したエントリは使用中なので必ず残す
+        evicted = False
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes is not None and self._total_bytes > self.max_bytes)
+        ):
+            key, (_, nbytes) = self._entries.popitem(last=False)
+            self._total_bytes -= nbytes
+            self.evictions += 1
+            evicted = True
+            logger.info(f"パイプラインをキャッシュから破棄: {key}")
+        if evicted:
+            gc.collect()
+
+
+class EmbeddingCache:
+    """
+    テキストエンコーダの出力（prompt_embeds）を保持するLRUキャッシュ。
+    キーは (パイプラインキャッシュのキー..., 最終的なプロンプト文字列)。
+    """
+
+    def __init__(self, max_entries: int = 256) -> None:
+        """
+        :param max_entries: 保持する埋め込みの最大数
+        """
+        self.max_entries = max(1, int(max_entries))
+        self._entries: OrderedDict[tuple[str, ...], Any] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key: tuple[str, ...]) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: tuple[str, ...]) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: tuple[str, ...], embeds: Any) -> None:
+        self._entries[key] = embeds
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_encode(self, key: tuple[str, ...], encoder: Callable[[], Any]) -> Any:
+        """
+        キャッシュにあればそれを返し、無ければencoderで計算して登録する
+        """
+        embeds = self.get(key)
+        if embeds is None:
+            embeds = encoder()
+            self.put(key, embeds)
+        return embeds
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict[str, float]:
+        """ヒット率と各カウンタを返す"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "hit_rate": self.hits / total if total else 0.0,
+        }
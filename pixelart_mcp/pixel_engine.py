@@ -0,0 +1,269 @@
+"""
+NumPyによるピクセルアート後処理エンジン。
+(N, H, W, 3) のuint8配列をバッチのまま処理し、ピクセル単位のPythonループは使わない。
+
+処理の流れ:
+  1. パレット作成（画像ごとのk-means、サンプリングした画素で計算）
+  2. 縮小（block: ブロック平均 / majority: ブロック内で最も多いパレット色）
+  3. 任意でオーダードディザ（4x4 Bayer）
+  4. 任意で孤立ピクセルの除去（輪郭のノイズ掃除）
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Literal
+
+import numpy as np
+from PIL import Image
+
+# 4x4 Bayer行列（0..1に正規化）
+_BAYER4 = (np.array([
+    [0, 8, 2, 10],
+    [12, 4, 14, 6],
+    [3, 11, 1, 9],
+    [15, 7, 13, 5],
+], dtype=np.float32) + 0.5) / 16.0
+
+# 最近傍パレット計算で一度に確保する距離行列の要素数の上限
+_DISTANCE_BUDGET = 1 << 24
+
+
+@dataclass
+class PixelArtOptions:
+    """
+    ピクセルアート化の設定
+    """
+    # block: ブロック平均 / majority: ブロック内の多数決
+    mode: Literal["block", "majority"] = "majority"
+    # パレットの色数（Noneなら減色しない。majorityでは必須のため既定値32を使う）
+    colors: int | None = 32
+    # オーダードディザを行うか
+    dither: bool = False
+    # ディザの強さ（0..255の色空間での振れ幅）
+    dither_strength: float = 32.0
+    # 上下左右を同じ色に囲まれた孤立ピクセルを除去するか
+    outline_cleanup: bool = True
+    # k-meansの反復回数
+    kmeans_iters: int = 8
+    # k-meansに使う1枚あたりのサンプル画素数
+    sample_pixels: int = 4096
+    # サンプリングの乱数シード
+    seed: int = 0
+
+
+def _as_size(size: int | tuple[int, int]) -> tuple[int, int]:
+    """(width, height) にそろえる"""
+    if isinstance(size, int):
+        return size, size
+    return int(size[0]), int(size[1])
+
+
+def block_edges(length: int, blocks: int) -> np.ndarray:
+    """
+    長さlengthをblocks個のブロックに分ける境界（各ブロックの開始位置）を返す。割り切れない場合は均等に近く分ける
+    """
+    if blocks > length:
+        raise ValueError(f"縮小後のサイズ({blocks})が元のサイズ({length})より大きいです。")
+    return np.floor(np.arange(blocks) * (length / blocks)).astype(np.intp)
+
+
+def _block_ids(length: int, blocks: int) -> np.ndarray:
+    """各画素が属するブロック番号"""
+    return np.searchsorted(block_edges(length, blocks), np.arange(length), side="right") - 1
+
+
+def downsample_mean(images: np.ndarray, size: int | tuple[int, int]) -> np.ndarray:
+    """
+    ブロック平均で縮小する
+    :param images: (N, H, W, C) 配列
+    :param size: 縮小後のサイズ (width, height) または正方形の一辺
+    :return: (N, h, w, C) float32配列
+    """
+    w, h = _as_size(size)
+    n, height, width, _ = images.shape
+    edges_h = block_edges(height, h)
+    edges_w = block_edges(width, w)
+    sums = np.add.reduceat(np.add.reduceat(images.astype(np.float32), edges_h, axis=1), edges_w, axis=2)
+    counts_h = np.diff(np.append(edges_h, height)).astype(np.float32)
+    counts_w = np.diff(np.append(edges_w, width)).astype(np.float32)
+    return sums / (counts_h[:, None] * counts_w[None, :])[None, :, :, None]
+
+
+def nearest_palette_index(pixels: np.ndarray, palettes: np.ndarray) -> np.ndarray:
+    """
+    各画素に最も近いパレット色の番号を返す
+    :param pixels: (N, P, 3) 配列
+    :param palettes: (N, K, 3) 配列
+    :return: (N, P) int配列
+    """
+    n, p, _ = pixels.shape
+    k = palettes.shape[1]
+    palettes = palettes.astype(np.float32)
+    palette_norm = np.einsum("nkc,nkc->nk", palettes, palettes)
+    result = np.empty((n, p), dtype=np.intp)
+    chunk = max(1, _DISTANCE_BUDGET // max(1, n * k))
+    for start in range(0, p, chunk):
+        part = pixels[:, start:start + chunk].astype(np.float32)
+        # ||x||^2 は比較に影響しないので省略する
+        dist = palette_norm[:, None, :] - 2.0 * np.einsum("npc,nkc->npk", part, palettes)
+        result[:, start:start + chunk] = np.argmin(dist, axis=2)
+    return result
+
+
+def _lut_palette_index(pixels: np.ndarray, palettes: np.ndarray) -> np.ndarray:
+    """
+    画素を各チャネル5bitに量子化し、32768色のルックアップテーブル経由で最近傍パレット番号を求める。
+    画素数がルックアップテーブルより多い場合、直接計算するより速い
+    :param pixels: (N, P, 3) 配列（0..255）
+    :param palettes: (N, K, 3) 配列
+    :return: (N, P) int配列
+    """
+    n = pixels.shape[0]
+    q = (np.clip(pixels, 0, 255).astype(np.uint8) >> 3).astype(np.intp)
+    codes = (q[..., 0] << 10) | (q[..., 1] << 5) | q[..., 2]
+    grid = np.arange(32 * 32 * 32)
+    lut_rgb = np.stack([(grid >> 10) & 31, (grid >> 5) & 31, grid & 31], axis=-1).astype(np.float32) * 8 + 4
+    lut = nearest_palette_index(np.broadcast_to(lut_rgb, (n, *lut_rgb.shape)), palettes)
+    return np.take_along_axis(lut, codes, axis=1)
+
+
+def kmeans_palette(images: np.ndarray, colors: int, iters: int = 8, sample_pixels: int = 4096, seed: int = 0) -> np.ndarray:
+    """
+    画像ごとにk-meansでパレットを作る（バッチ全体を一度に計算する）
+    :param images: (N, H, W, 3) 配列
+    :param colors: パレットの色数
+    :return: (N, colors, 3) float32配列
+    """
+    n, height, width, c = images.shape
+    flat = images.reshape(n, height * width, c).astype(np.float32)
+    rng = np.random.default_rng(seed)
+    samples_count = min(sample_pixels, height * width)
+    picks = rng.integers(0, height * width, size=(n, samples_count))
+    samples = np.take_along_axis(flat, picks[:, :, None], axis=1)
+
+    # 初期値: 輝度順に並べたサンプルから等間隔に選ぶ
+    luminance = samples @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    order = np.argsort(luminance, axis=1)
+    init = order[:, np.linspace(0, samples_count - 1, colors).astype(np.intp)]
+    centers = np.take_along_axis(samples, init[:, :, None], axis=1)
+
+    offsets = (np.arange(n) * colors)[:, None]
+    for _ in range(iters):
+        labels = nearest_palette_index(samples, centers)
+        flat_labels = (labels + offsets).ravel()
+        counts = np.bincount(flat_labels, minlength=n * colors).reshape(n, colors)
+        sums = np.stack([
+            np.bincount(flat_labels, weights=samples[:, :, ch].ravel(), minlength=n * colors).reshape(n, colors)
+            for ch in range(c)
+        ], axis=-1)
+        # 空のクラスタは前回の中心を維持する
+        nonempty = counts > 0
+        centers = np.where(nonempty[:, :, None], sums / np.maximum(counts, 1)[:, :, None], centers).astype(np.float32)
+    return centers
+
+
+def _bayer_offsets(h: int, w: int, strength: float) -> np.ndarray:
+    tiled = np.tile(_BAYER4, (h // 4 + 1, w // 4 + 1))[:h, :w]
+    return ((tiled - 0.5) * strength).astype(np.float32)
+
+
+def downsample_majority(images: np.ndarray, size: int | tuple[int, int], palettes: np.ndarray, dither_strength: float = 0.0) -> np.ndarray:
+    """
+    各ブロックで最も多いパレット色を選んで縮小する
+    :param images: (N, H, W, 3) 配列
+    :param palettes: (N, K, 3) 配列
+    :param dither_strength: 0より大きければ、縮小後の画素位置に対応するBayerディザを加えてから色を割り当てる
+    :return: (N, h, w) のパレット番号
+    """
+    w, h = _as_size(size)
+    n, height, width, c = images.shape
+    k = palettes.shape[1]
+    rows = _block_ids(height, h)
+    cols = _block_ids(width, w)
+    pixels = images.astype(np.float32)
+    if dither_strength > 0:
+        offsets = _bayer_offsets(h, w, dither_strength)[rows[:, None], cols[None, :]]
+        pixels = pixels + offsets[None, :, :, None]
+    pixels = pixels.reshape(n, height * width, c)
+    if height * width > 32 * 32 * 32:
+        labels = _lut_palette_index(pixels, palettes)
+    else:
+        labels = nearest_palette_index(pixels, palettes)
+    block = (rows[:, None] * w + cols[None, :]).ravel()
+    flat = ((np.arange(n)[:, None] * (h * w) + block[None, :]) * k + labels).ravel()
+    counts = np.bincount(flat, minlength=n * h * w * k).reshape(n, h, w, k)
+    return np.argmax(counts, axis=-1)
+
+
+def cleanup_isolated(images: np.ndarray) -> np.ndarray:
+    """
+    上下左右の4近傍がすべて同じ色で、自身だけ色が異なるピクセルをその色で置き換える
+    :param images: (N, h, w, C) 配列
+    """
+    padded = np.pad(images, ((0, 0), (1, 1), (1, 1), (0, 0)), mode="edge")
+    up = padded[:, :-2, 1:-1]
+    down = padded[:, 2:, 1:-1]
+    left = padded[:, 1:-1, :-2]
+    right = padded[:, 1:-1, 2:]
+    same = (
+        np.all(up == down, axis=-1)
+        & np.all(up == left, axis=-1)
+        & np.all(up == right, axis=-1)
+        & ~np.all(up == images, axis=-1)
+    )
+    return np.where(same[..., None], up, images)
+
+
+def pixelate_batch(images: np.ndarray, size: int | tuple[int, int], options: PixelArtOptions | None = None) -> np.ndarray:
+    """
+    画像バッチをピクセルアート化する
+    :param images: (N, H, W, 3) または (H, W, 3) のuint8配列
+    :param size: 縮小後のサイズ (width, height) または正方形の一辺
+    :param options: ピクセルアート化の設定
+    :return: (N, h, w, 3) （入力が3次元なら (h, w, 3)）のuint8配列
+    """
+    options = options or PixelArtOptions()
+    single = images.ndim == 3
+    if single:
+        images = images[None]
+    images = images[..., :3]
+    w, h = _as_size(size)
+    colors = options.colors
+    if options.mode == "majority" and colors is None:
+        colors = PixelArtOptions.colors
+    dither_strength = options.dither_strength if options.dither else 0.0
+
+    if colors is None:
+        result = downsample_mean(images, (w, h))
+        if dither_strength > 0:
+            result = result + _bayer_offsets(h, w, dither_strength)[None, :, :, None]
+    else:
+        palettes = kmeans_palette(images, colors, options.kmeans_iters, options.sample_pixels, options.seed)
+        if options.mode == "majority":
+            labels = downsample_majority(images, (w, h), palettes, dither_strength)
+        else:
+            means = downsample_mean(images, (w, h))
+            if dither_strength > 0:
+                means = means + _bayer_offsets(h, w, dither_strength)[None, :, :, None]
+            labels = nearest_palette_index(means.reshape(len(images), h * w, 3), palettes).reshape(len(images), h, w)
+        result = np.take_along_axis(palettes, labels.reshape(len(images), h * w, 1), axis=1).reshape(len(images), h, w, 3)
+
+    result = np.clip(np.rint(result), 0, 255).astype(np.uint8)
+    if options.outline_cleanup:
+        result = cleanup_isolated(result)
+    return result[0] if single else result
+
+
+def pixelate_images(images: list[Image.Image], size: int | tuple[int, int], options: PixelArtOptions | None = None) -> list[Image.Image]:
+    """
+    PIL画像のリストをまとめてピクセルアート化する。サイズの異なる画像は同じサイズごとにまとめて処理する
+    """
+    results: list[Image.Image | None] = [None] * len(images)
+    groups: dict[tuple[int, int], list[int]] = {}
+    for i, image in enumerate(images):
+        groups.setdefault(image.size, []).append(i)
+    for indices in groups.values():
+        batch = np.stack([np.asarray(images[i].convert("RGB")) for i in indices])
+        for i, array in zip(indices, pixelate_batch(batch, size, options)):
+            results[i] = Image.fromarray(array)
+    return [image for image in results if image is not None]
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from typing import Any
+
+import logging
+logger = logging.getLogger(__name__)
+
+# キーの計算方法や後処理を変えたときに古い結果を使わないためのバージョン
+REQUEST_KEY_VERSION = 1
+
+
+def make_request_key(params: dict[str, Any]) -> str:
+    """
+    生成条件（モデル・プロンプト・サイズ・ステップ数・シード・後処理）から内容アドレスのキーを作る
+    :param params: 生成結果を決める条件のdict（JSONにできる値のみ）
+    :return: 16進のSHA-256
+    """
+    raw = json.dumps({"version": REQUEST_KEY_VERSION, **params}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def link_or_copy(src: str, dst: str) -> None:
+    """
+    srcをdstにハードリンクする。ハードリンクできないファイルシステムではコピーする。
+    dstは一時ファイル経由で置き換えるので、途中の状態が見えることはない
+    """
+    tmp = f"{dst}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+class ResultStore:
+    """
+    生成済み画像の内容アドレスストア。{root}/{key[:2]}/{key}.png に保存する。
+    ジョブの出力とはハードリンクで共有し、合計サイズがmax_bytesを超えたら最後に使われた時刻が古い順に破棄する。
+    （ジョブ側のリンクは残るので、破棄してもジョブの画像は消えない）
+    複数プロセスから同時に使えるよう、状態はファイルシステムだけに持つ。
+    """
+
+    def __init__(self, root: str, max_bytes: int = 1 << 30) -> None:
+        """
+        :param root: ストアのディレクトリ
+        :param max_bytes: 保持する画像の合計バイト数の上限（0以下なら保存しない）
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # このプロセスから見た合計バイト数（Noneなら未計算）
+        self._total_bytes: int | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.png")
+
+    def lookup(self, key: str) -> str | None:
+        """
+        キーに対応する画像のパスを返す。見つかれば最終使用時刻を更新する
+        :return: 画像のパス（無ければNone）
+        """
+        if not self.enabled:
+            return None
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def link_to(self, key: str, dst: str) -> bool:
+        """
+        キーに対応する画像をdstにリンクする
+        :return: リンクできたか（キャッシュに無ければFalse）
+        """
+        path = self.lookup(key)
+        if path is None:
+            return False
+        try:
+            link_or_copy(path, dst)
+        except OSError as e:
+            # 他のプロセスが破棄した直後など
+            logger.warning(f"[ResultStore] リンクに失敗しました: {key} {e}")
+            return False
+        return True
+
+    def put(self, key: str, src: str) -> None:
+        """
+        生成した画像をストアに登録し、上限を超えた分を破棄する
+        :param src: 生成した画像のパス
+        """
+        if not self.enabled:
+            return
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        link_or_copy(src, path)
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_total()
+            else:
+                self._total_bytes += os.path.getsize(path)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _entries(self) -> list[tuple[float, int, str]]:
+        """(最終使用時刻, バイト数, パス) のリスト"""
+        entries: list[tuple[float, int, str]] = []
+        if not os.path.isdir(self.root):
+            return entries
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.name.endswith(".png"):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries
+
+    def _scan_total(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self) -> None:
+        # 他のプロセスも登録・破棄しているので、破棄する前に実際の状態を数え直す
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        # 直近に登録したものは残す
+        for _, size, path in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            logger.info(f"[ResultStore] 破棄: {os.path.basename(path)}")
+        self._total_bytes = total
+
+    def stats(self) -> dict[str, int]:
+        """保持している画像の数と合計バイト数"""
+        entries = self._entries()
+        return {"entries": len(entries), "bytes": sum(size for _, size, _ in entries), "max_bytes": self.max_bytes}
@@ -0,0 +1,182 @@
+"""
+ジョブディレクトリの保持期間・容量の管理。
+終了したジョブのディスク使用量は1回だけ測ってジョブインデックスの台帳に記録し、
+ディレクトリ全体を走査せずに、保持ポリシーを超えたジョブを選ぶ。
+ほかにもリンクがあるファイル（結果ストア・再利用したジョブと共有するoutput.png）を持つジョブだけは、
+リンク先が消えると使用量が変わるので、保持ポリシーの適用のたびに測り直す。
+"""
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from pydantic import BaseModel
+
+from .job_index import JobIndex
+from .result_store import ResultStore
+
+import logging
+logger = logging.getLogger(__name__)
+
+# 削除してよいステータス（実行待ち・実行中のジョブは消さない）
+FINISHED_STATUSES: list[str] = ["finished", "failed", "canceled"]
+
+
+@dataclass
+class RetentionPolicy:
+    """
+    ジョブディレクトリの保持ポリシー。どの条件も指定しなければ何も削除しない
+    """
+    # 終了したジョブのディスク使用量の合計の上限（超えたら古いジョブから削除する）
+    max_bytes: int | None = None
+    # 開始からこの日数を過ぎた終了済みのジョブを削除する
+    max_age_days: float | None = None
+    # ステータスごとに新しい方から残す件数（例: {"failed": 100}）
+    keep_per_status: dict[str, int] = field(default_factory=dict)
+    # バックグラウンドで保持ポリシーを適用する間隔（秒）
+    interval: float = 600.0
+    # 1回の適用で削除する最大ジョブ数（残りは次回に回す）
+    batch_size: int = 500
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes is not None or self.max_age_days is not None or bool(self.keep_per_status)
+
+
+class PurgeResult(BaseModel):
+    # 削除した（dry_runなら削除する）ジョブ数
+    deleted_jobs: int
+    # 削除で空いた（dry_runなら空く）バイト数
+    reclaimed_bytes: int
+    dry_run: bool = False
+    job_ids: list[str] = []
+
+
+class StorageStats(BaseModel):
+    # インデックスに登録されているジョブ数
+    jobs: int
+    # ディスク使用量を記録した終了済みのジョブ数とその合計バイト数
+    measured_jobs: int
+    total_bytes: int
+    # 起動してから削除したジョブ数と空いたバイト数
+    deleted_jobs: int = 0
+    reclaimed_bytes: int = 0
+    # 最後に保持ポリシーを適用した時刻
+    last_gc_time: str | None = None
+
+
+def measure_dir(path: str, stored: tuple[int, int] | None = None) -> int:
+    """
+    ディレクトリ以下（サブディレクトリを含む。バリエーションのジョブは frames/ を持つ）のファイルの合計バイト数
+    :param stored: 結果ストアが持っている画像の (st_dev, st_ino)。これはresult_cache_bytesの上限で管理されるので数えない
+    """
+    return _measure(path, stored)[0]
+
+
+def _measure(path: str, stored: tuple[int, int] | None) -> tuple[int, bool]:
+    """
+    :return: (合計バイト数, ほかにもリンクがあるファイルを持つか)。
+        結果ストア以外とも共有しているファイル（再利用したジョブどうし）は、共有しているジョブの合計が実際の使用量になるようリンク数で割って数える
+    """
+    total = 0
+    shared = False
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    if stat.st_nlink <= 1:
+                        total += stat.st_size
+                        continue
+                    shared = True
+                    if (stat.st_dev, stat.st_ino) != stored:
+                        total += stat.st_size // stat.st_nlink
+                elif entry.is_dir(follow_symlinks=False):
+                    size, sub_shared = _measure(entry.path, stored)
+                    total += size
+                    shared = shared or sub_shared
+    except FileNotFoundError:
+        pass
+    return total, shared
+
+
+def _stored_inode(index: JobIndex, job_id: str, results: ResultStore | None) -> tuple[int, int] | None:
+    """
+    ジョブの生成結果を結果ストアが持っていれば、その (st_dev, st_ino)
+    """
+    data = index.get_json(job_id)
+    request_key = json.loads(data).get("request_key") if data else None
+    if results is None or not request_key:
+        return None
+    try:
+        stat = os.stat(results.path_for(request_key))
+    except OSError:
+        return None
+    return stat.st_dev, stat.st_ino
+
+
+def _record_sizes(index: JobIndex, jobs_dir: str, job_ids: list[str], results: ResultStore | None) -> None:
+    sizes: dict[str, int] = {}
+    shared: set[str] = set()
+    for job_id in job_ids:
+        sizes[job_id], is_shared = _measure(os.path.join(jobs_dir, job_id), _stored_inode(index, job_id, results))
+        if is_shared:
+            shared.add(job_id)
+    index.set_sizes(sizes, shared)
+
+
+def measure_unmeasured(index: JobIndex, jobs_dir: str, limit: int = 500, results: ResultStore | None = None) -> int:
+    """
+    終了したジョブのうち、まだ台帳に無いもののディスク使用量を測って記録する
+    :param results: 結果ストア（持っている画像はジョブの使用量に数えない）
+    :return: 記録したジョブ数
+    """
+    job_ids = index.unmeasured(FINISHED_STATUSES, limit)
+    if job_ids:
+        _record_sizes(index, jobs_dir, job_ids, results)
+    return len(job_ids)
+
+
+def remeasure_shared(index: JobIndex, jobs_dir: str, limit: int = 500, results: ResultStore | None = None) -> int:
+    """
+    ほかにもリンクがあるファイルを持つジョブを測り直す。結果ストアが画像を破棄したり、
+    共有していたジョブが削除されたりすると、そのジョブだけが持つ分が増える
+    :return: 測り直したジョブ数
+    """
+    count = 0
+    after = ""
+    while job_ids := index.shared_sized(after, limit):
+        _record_sizes(index, jobs_dir, job_ids, results)
+        count += len(job_ids)
+        after = job_ids[-1]
+    return count
+
+
+def select_expired(index: JobIndex, policy: RetentionPolicy, now: datetime | None = None) -> dict[str, int]:
+    """
+    保持ポリシーを超えた終了済みのジョブを選ぶ。年齢・ステータスごとの件数・合計容量の順に適用する
+    :return: job_id -> 記録済みのディスク使用量（最大batch_size件）
+    """
+    limit = policy.batch_size
+    victims: dict[str, int] = {}
+    if policy.max_age_days is not None:
+        now = now or datetime.now().astimezone()
+        before = (now - timedelta(days=policy.max_age_days)).isoformat()
+        victims.update(index.oldest(FINISHED_STATUSES, before=before, limit=limit))
+    for status, keep in policy.keep_per_status.items():
+        if status not in FINISHED_STATUSES or len(victims) >= limit:
+            continue
+        victims.update(index.beyond_newest(status, max(0, keep), limit=limit))
+    if policy.max_bytes is not None:
+        _, total = index.size_totals()
+        excess = total - policy.max_bytes - sum(victims.values())
+        if excess > 0:
+            for job_id, size in index.oldest(FINISHED_STATUSES, limit=limit + len(victims)):
+                if excess <= 0:
+                    break
+                if job_id not in victims:
+                    victims[job_id] = size
+                    excess -= size
+    return dict(list(victims.items())[:limit])
@@ -0,0 +1,77 @@
+"""
+サンプラー（diffusersのスケジューラー）の登録簿と、速度の段階（speed）ごとの生成条件。
+MCPサーバーやジョブ管理からも使うので、torch/diffusersは読み込まない。スケジューラーの実体はimage_generatorで作る。
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Literal
+
+from .models import ModelInfo
+
+# 速度の段階。quality: モデルの既定のサンプラーとステップ数 / fast: DPM-Solver++で少ないステップ数 /
+# turbo: LCM-LoRAを付けてLCMスケジューラーで4〜8ステップ（LCM-LoRAの無いモデルはfastと同じ）
+SpeedTier = Literal["quality", "fast", "turbo"]
+
+
+@dataclass(frozen=True)
+class SamplerPreset:
+    # diffusersのスケジューラーのクラス名
+    scheduler: str
+    # from_configに渡す追加の設定
+    config: dict[str, Any] = field(default_factory=dict)
+    # このサンプラーを使うときの既定のステップ数
+    steps: int = 20
+
+
+SAMPLERS: dict[str, SamplerPreset] = {
+    "DDIM": SamplerPreset("DDIMScheduler", steps=40),
+    "DPM++": SamplerPreset("DPMSolverMultistepScheduler", {"algorithm_type": "dpmsolver++", "solver_order": 2, "use_karras_sigmas": True}, steps=20),
+    "Euler-a": SamplerPreset("EulerAncestralDiscreteScheduler", steps=25),
+    "LCM": SamplerPreset("LCMScheduler", steps=6),
+}
+
+# fastで使うサンプラー
+FAST_SAMPLER = "DPM++"
+# LCM-LoRAを付けたときのガイダンススケール（LCMは1〜2程度でないと破綻する）
+LCM_GUIDANCE_SCALE = 1.5
+
+
+@dataclass(frozen=True)
+class SamplingPlan:
+    """
+    1回の生成に使うサンプラー・ステップ数・ガイダンススケール
+    """
+    # SAMPLERSのキー（Noneならロード時のスケジューラーのまま）
+    sampler: str | None
+    steps: int
+    # Noneならパイプラインの既定
+    guidance_scale: float | None
+    # LCM-LoRAを付けたパイプラインを使うか
+    lcm_lora: bool = False
+
+
+def pipeline_model_key(model_id_key: str, plan: SamplingPlan) -> str:
+    """
+    パイプラインキャッシュで使うモデルのキー。LCM-LoRAを付けたパイプラインは付けていないものと別に扱う
+    """
+    return model_id_key + "+lcm" if plan.lcm_lora else model_id_key
+
+
+def effective_speed(model_info: ModelInfo, speed: SpeedTier) -> SpeedTier:
+    """
+    生成結果に効く速度の段階。speedを使わないモデル（ModelInfo.fixed_sampling）はどの段階もqualityと同じ
+    """
+    return "quality" if model_info.fixed_sampling else speed
+
+
+def plan_sampling(model_info: ModelInfo, speed: SpeedTier = "quality") -> SamplingPlan:
+    """
+    モデルと速度の段階から、生成に使うサンプラー・ステップ数を決める
+    """
+    speed = effective_speed(model_info, speed)
+    if model_info.use_lcm or (speed == "turbo" and model_info.lcm_lora_id):
+        return SamplingPlan("LCM", SAMPLERS["LCM"].steps, LCM_GUIDANCE_SCALE, lcm_lora=True)
+    if speed in ("fast", "turbo"):
+        return SamplingPlan(FAST_SAMPLER, min(model_info.num_inference_steps, SAMPLERS[FAST_SAMPLER].steps), model_info.guidance_scale)
+    return SamplingPlan(model_info.sampler, model_info.num_inference_steps, model_info.guidance_scale)
@@ -0,0 +1,135 @@
+"""
+同じプロンプトをシードを変えて生成したフレーム（バリエーション）を、1枚のスプライトシートとJSONのアトラスにまとめる。
+アトラスはTexturePackerのJSON (Array) 形式（frames[].filename/frame と meta.image/size）に、フレームごとのseedを加えたもの。
+ジョブディレクトリには output.png（スプライトシート）・atlas.json・frames/frame_000.png... を置く。
+MCPサーバーやジョブ管理からも使うので、torch/diffusersは読み込まない。
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import shutil
+from typing import Any
+
+from PIL import Image
+
+from .image_output import save_image
+
+# 1回の要求で生成できるバリエーションの最大数（1回のパイプライン呼び出しにまとめる）
+MAX_VARIANTS = 16
+FRAMES_DIR = "frames"
+ATLAS_FILE = "atlas.json"
+SHEET_FILE = "output.png"
+
+
+def frame_name(index: int) -> str:
+    return f"frame_{index:03d}.png"
+
+
+def frame_files(job_dir: str, count: int) -> list[str]:
+    """
+    ジョブディレクトリ内のフレームのパス（ディレクトリは作る）
+    """
+    os.makedirs(os.path.join(job_dir, FRAMES_DIR), exist_ok=True)
+    return [os.path.join(job_dir, FRAMES_DIR, frame_name(i)) for i in range(count)]
+
+
+def sheet_columns(count: int) -> int:
+    """
+    スプライトシートの列数（なるべく正方形に近づける）
+    """
+    return max(1, math.ceil(math.sqrt(count)))
+
+
+def make_atlas(seeds: list[int], frame_width: int, frame_height: int, image: str = SHEET_FILE) -> dict[str, Any]:
+    """
+    フレームを左上から行優先で並べたときのアトラス
+    :param seeds: フレームごとのシード（並べる順）
+    :param image: スプライトシートのファイル名
+    """
+    columns = sheet_columns(len(seeds))
+    rows = math.ceil(len(seeds) / columns)
+    return {
+        "frames": [
+            {
+                "filename": frame_name(i),
+                "frame": {"x": (i % columns) * frame_width, "y": (i // columns) * frame_height, "w": frame_width, "h": frame_height},
+                "seed": seed,
+            }
+            for i, seed in enumerate(seeds)
+        ],
+        "meta": {
+            "image": image,
+            "size": {"w": columns * frame_width, "h": rows * frame_height},
+            "columns": columns,
+            "rows": rows,
+        },
+    }
+
+
+def _write_atlas(atlas: dict[str, Any], atlas_path: str) -> None:
+    with open(atlas_path, "w", encoding="utf-8") as f:
+        json.dump(atlas, f, indent=2)
+
+
+def assemble_sprite_sheet(job_dir: str, seeds: list[int]) -> tuple[dict[str, Any], bytes]:
+    """
+    ジョブディレクトリのフレームを並べてスプライトシートとアトラスを書き出す。
+    フレームの大きさは最初のフレームにそろえる（ピクセルアートはすべて同じ大きさ）
+    :return: (アトラス, 書き出したスプライトシートのPNG)
+    """
+    frames = [Image.open(path) for path in frame_files(job_dir, len(seeds))]
+    try:
+        width, height = frames[0].size
+        atlas = make_atlas(seeds, width, height)
+        sheet = Image.new("RGBA", (atlas["meta"]["size"]["w"], atlas["meta"]["size"]["h"]), (0, 0, 0, 0))
+        for frame, entry in zip(frames, atlas["frames"]):
+            if frame.size != (width, height):
+                frame = frame.resize((width, height), resample=Image.NEAREST)  # type: ignore[attr-defined]
+            sheet.paste(frame.convert("RGBA"), (entry["frame"]["x"], entry["frame"]["y"]))
+    finally:
+        for frame in frames:
+            frame.close()
+    data = save_image(sheet, os.path.join(job_dir, SHEET_FILE))
+    _write_atlas(atlas, os.path.join(job_dir, ATLAS_FILE))
+    return atlas, data
+
+
+def split_sprite_sheet(job_dir: str, seeds: list[int]) -> dict[str, Any]:
+    """
+    ジョブディレクトリのスプライトシートからフレームとアトラスを書き出す（生成済みのスプライトシートを再利用したとき）
+    :return: アトラス
+    """
+    with Image.open(os.path.join(job_dir, SHEET_FILE)) as sheet:
+        columns = sheet_columns(len(seeds))
+        rows = math.ceil(len(seeds) / columns)
+        atlas = make_atlas(seeds, sheet.width // columns, sheet.height // rows)
+        for path, entry in zip(frame_files(job_dir, len(seeds)), atlas["frames"]):
+            box = entry["frame"]
+            sheet.crop((box["x"], box["y"], box["x"] + box["w"], box["y"] + box["h"])).save(path)
+    _write_atlas(atlas, os.path.join(job_dir, ATLAS_FILE))
+    return atlas
+
+
+def export_sprite_sheet(job_dir: str, output_path: str) -> list[str]:
+    """
+    スプライトシートを output_path にコピーし、アトラスを同じ名前の .json に、フレームを <名前>_frames/ に書き出す。
+    アトラスの meta.image はコピー先のファイル名にする
+    :return: 書き出したファイルのパス
+    """
+    with open(os.path.join(job_dir, ATLAS_FILE), "r", encoding="utf-8") as f:
+        atlas = json.load(f)
+    stem = os.path.splitext(output_path)[0]
+    frames_dir = stem + "_frames"
+    os.makedirs(frames_dir, exist_ok=True)
+    shutil.copy(os.path.join(job_dir, SHEET_FILE), output_path)
+    written = [output_path]
+    for entry in atlas["frames"]:
+        path = os.path.join(frames_dir, entry["filename"])
+        shutil.copy(os.path.join(job_dir, FRAMES_DIR, entry["filename"]), path)
+        written.append(path)
+    atlas["meta"]["image"] = os.path.basename(output_path)
+    _write_atlas(atlas, stem + ".json")
+    written.append(stem + ".json")
+    return written
@@ -0,0 +1,31 @@
+import os
+
+from pixelart_mcp.models import MODEL_IDS
+
+
+def test_generate_image_reports_stage_timings(tmp_path):
+    from benchmarks.tiny_pipeline import register_tiny_model
+    from pixelart_mcp.image_generator import generate_image
+
+    register_tiny_model("test-timings", str(tmp_path / "model"), num_inference_steps=3, width=8)
+    try:
+        timings: dict = {}
+        output_file = str(tmp_path / "out.png")
+        generate_image("a knight", output_file, model_id_key="test-timings", size=(32, 32), resize_to=(16, 16), seed=0, timings=timings)
+        assert os.path.isfile(output_file)
+        assert set(timings) == {"load", "encode", "denoise", "step_seconds", "decode", "resize", "save"}
+        assert len(timings["step_seconds"]) == 3
+        assert abs(sum(timings["step_seconds"]) - timings["denoise"]) < 1e-6
+        assert all(timings[stage] >= 0 for stage in ("load", "encode", "decode", "resize", "save"))
+    finally:
+        MODEL_IDS.pop("test-timings", None)
+
+
+def test_compare_reports_only_regressions():
+    from benchmarks.bench_suite import compare, summarize
+
+    baseline = [summarize("generate", "tiny-sd", "step", [0.010]), summarize("generate", "tiny-sd", "decode", [0.010])]
+    results = [summarize("generate", "tiny-sd", "step", [0.020]), summarize("generate", "tiny-sd", "decode", [0.011]),
+               summarize("generate", "tiny-sd", "save", [1.0])]
+    regressions = compare(results, baseline, tolerance=0.25)
+    assert [(r["metric"], round(r["ratio"], 2)) for r in regressions] == [("step", 2.0)]
@@ -0,0 +1,84 @@
+import os
+import shutil
+import time
+
+import pytest
+
+from pixelart_mcp.image_jobs import ImageJobManager, JobStatus, WorkerConfig
+
+TEST_IMAGE_DIR = "./tmp/CancelDir"
+
+
+@pytest.fixture
+def clean_test_dir():
+    if os.path.isdir(TEST_IMAGE_DIR):
+        shutil.rmtree(TEST_IMAGE_DIR)
+    yield
+    if os.path.isdir(TEST_IMAGE_DIR):
+        shutil.rmtree(TEST_IMAGE_DIR)
+
+
+def _wait_until(predicate, timeout: float, interval: float = 0.02) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(interval)
+    return False
+
+
+def test_cancel_running_job_frees_worker_within_a_step(clean_test_dir):
+    mgr = ImageJobManager(image_dir=TEST_IMAGE_DIR, worker_config=WorkerConfig(batch_window=0.0))
+    try:
+        job = mgr.submit_image_job("debug", 64, 64)
+        # 初回のジョブはワーカーでのtorchの読み込みを含む
+        assert _wait_until(lambda: (mgr.get_job(job.job_id).current_step or 0) >= 1, timeout=30)
+
+        t0 = time.monotonic()
+        mgr.cancel_job(job.job_id)
+        assert _wait_until(lambda: not mgr.get_pool_status().workers[0].busy, timeout=5)
+        cancel_to_idle = time.monotonic() - t0
+        # デバッグ用の模擬推論は1ステップ0.3秒。残りの数ステップを走り切らずに止まる
+        assert cancel_to_idle < 1.0, cancel_to_idle
+
+        assert mgr.get_job(job.job_id).status == JobStatus.canceled
+        # 中断したワーカーがjob.jsonを作り直さない
+        assert not os.path.isfile(mgr._get_json_path(job.job_id))
+    finally:
+        mgr.shutdown()
+
+
+def test_cancelled_queued_job_is_never_started(clean_test_dir):
+    mgr = ImageJobManager(image_dir=TEST_IMAGE_DIR, worker_config=WorkerConfig(batch_window=0.0))
+    try:
+        running = mgr.submit_image_job("debug", 64, 64)
+        # 1つ目がワーカーで始まるまでは、割り当て済みのジョブも待ちに数える
+        assert _wait_until(lambda: mgr.get_pool_status().queue_depth == 0, timeout=5)
+        # サイズが異なるのでバッチにまとまらず、1つ目の完了を待つ
+        queued = mgr.submit_image_job("debug", 128, 128)
+        mgr.cancel_job(queued.job_id)
+        assert mgr.get_pool_status().queue_depth == 0
+
+        assert _wait_until(lambda: mgr.get_job(running.job_id).status == JobStatus.finished, timeout=30, interval=0.25)
+        assert _wait_until(lambda: not mgr.get_pool_status().workers[0].busy, timeout=5)
+        info = mgr.get_job(queued.job_id)
+        assert info.status == JobStatus.canceled
+        assert not os.path.isfile(mgr._get_image_path(queued.job_id))
+    finally:
+        mgr.shutdown()
+
+
+def test_should_cancel_aborts_denoising(tmp_path, monkeypatch):
+    from benchmarks.tiny_pipeline import build_tiny_pipeline
+    from pixelart_mcp import image_generator
+
+    tiny = build_tiny_pipeline("sd")
+    monkeypatch.setattr(image_generator, "load_pipeline", lambda model_info, device: tiny)
+    steps: list[int] = []
+    errors = image_generator.generate_images(
+        ["a cat"], [str(tmp_path / "out.png")], model_id_key="s1", size=(64, 64), steps=8,
+        progress=lambda step, total: steps.append(step),
+        should_cancel=lambda: len(steps) >= 2,
+    )
+    assert errors == [image_generator.CANCELLED_MESSAGE]
+    assert steps == [1, 2]
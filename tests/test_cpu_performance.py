@@ -0,0 +1,35 @@
+import dataclasses
+import os
+
+import torch
+
+from pixelart_mcp.image_generator import dtype_name, generate_images
+from pixelart_mcp.models import MODEL_IDS, PerformanceOptions
+
+
+def test_float16_model_uses_cpu_dtype_on_cpu():
+    s2 = MODEL_IDS["s2"]
+    assert s2.dtype == "float16"
+    assert dtype_name(s2, torch.device("cpu")) == "float32"
+    assert dtype_name(s2, torch.device("cuda")) == "float16"
+    bf16 = dataclasses.replace(s2, performance=PerformanceOptions(cpu_dtype="bfloat16"))
+    expected = "bfloat16" if torch.ops.mkldnn._is_mkldnn_bf16_supported() else "float32"
+    assert dtype_name(bf16, torch.device("cpu")) == expected
+
+
+def test_performance_options_are_applied_on_load(tmp_path):
+    from benchmarks.tiny_pipeline import register_tiny_model
+    from pixelart_mcp.pipeline_cache import PipelineCache
+
+    info = register_tiny_model("test-perf", str(tmp_path / "model"), num_inference_steps=2, width=8)
+    MODEL_IDS["test-perf"] = dataclasses.replace(info, dtype="float16", performance=PerformanceOptions(channels_last=True, attention_slicing=1))
+    try:
+        cache = PipelineCache()
+        output_file = str(tmp_path / "out.png")
+        errors = generate_images(["a knight"], [output_file], model_id_key="test-perf", size=(32, 32), pipeline_cache=cache, seeds=[0])
+        assert errors == [None] and os.path.isfile(output_file)
+        (pipe,) = [cache.get(key) for key in cache.keys()]
+        assert pipe.unet.dtype == torch.float32
+        assert pipe.unet.conv_in.weight.is_contiguous(memory_format=torch.channels_last)
+    finally:
+        MODEL_IDS.pop("test-perf", None)
@@ -0,0 +1,147 @@
+import asyncio
+import base64
+import io
+import os
+import queue
+import shutil
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from pixelart_mcp import image_jobs
+from pixelart_mcp.image_jobs import ImageJobInfo, ImageJobManager, JobStatus, WorkerConfig, _discard_outputs, _worker_main
+from pixelart_mcp.image_output import ImageBytesCache, convert_image, discard_shared_bytes, save_image, share_bytes, take_shared_bytes
+
+TEST_IMAGE_DIR = "./tmp/ImageOutputDir"
+
+
+@pytest.fixture
+def clean_test_dir():
+    if os.path.isdir(TEST_IMAGE_DIR):
+        shutil.rmtree(TEST_IMAGE_DIR)
+    yield
+    if os.path.isdir(TEST_IMAGE_DIR):
+        shutil.rmtree(TEST_IMAGE_DIR)
+
+
+def _png(size=(8, 4)) -> bytes:
+    image = Image.new("RGB", size, (0, 0, 0))
+    image.putpixel((0, 0), (255, 0, 0))
+    out = io.BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue()
+
+
+def test_shared_bytes_round_trip():
+    data = _png()
+    name, size = share_bytes(data)
+    assert take_shared_bytes(name, size) == data
+    # 受け取らなかった共有メモリは解放でき、受け取り済みなら何もしない
+    discard_shared_bytes(name)
+    name, size = share_bytes(data)
+    _discard_outputs({"event": "done", "outputs": {"job": (name, size)}})
+    with pytest.raises(FileNotFoundError):
+        take_shared_bytes(name, size)
+
+
+class DoneFailsQueue(list):
+    def put(self, event):
+        if event["event"] == "done":
+            raise BrokenPipeError("manager is gone")
+        self.append(event)
+
+
+def test_worker_shares_saved_bytes_and_releases_them_when_done_fails(tmp_path, monkeypatch):
+    jobs_dir = str(tmp_path)
+    saved: dict[str, bytes] = {}
+    shared: list[tuple[str, int]] = []
+
+    def fake_generate_images(prompts, output_files, **kwargs):
+        for i, path in enumerate(output_files):
+            kwargs["encoded"][i] = saved[path] = save_image(Image.new("RGB", (8, 8)), path)
+        return [None] * len(prompts)
+
+    def record_share(data):
+        shared.append(share_bytes(data))
+        # 共有するのは生成時に保存したバイト列そのもの
+        assert data in saved.values()
+        return shared[-1]
+
+    monkeypatch.setattr(image_jobs, "generate_images", fake_generate_images)
+    monkeypatch.setattr(image_jobs, "share_bytes", record_share)
+    job = ImageJobInfo.new_image("a knight", 8, 8)
+    os.makedirs(os.path.join(jobs_dir, job.job_id))
+    job.save(os.path.join(jobs_dir, job.job_id, "job.json"))
+    q: queue.Queue[str | None] = queue.Queue()
+    q.put(job.job_id)
+    q.put(None)
+
+    _worker_main(q, jobs_dir, threading.Event(), WorkerConfig(batch_window=0.0), event_queue=DoneFailsQueue())
+
+    assert len(shared) == 1
+    with pytest.raises(FileNotFoundError):
+        take_shared_bytes(*shared[0])
+
+
+def test_convert_image_thumbnail_and_format():
+    data = _png((64, 32))
+    out = Image.open(io.BytesIO(convert_image(data, "webp", max_size=16, pixel_art=True)))
+    assert out.format == "WEBP" and out.size == (16, 8)
+    jpeg = Image.open(io.BytesIO(convert_image(data, "jpeg")))
+    assert jpeg.format == "JPEG" and jpeg.size == (64, 32)
+
+
+def test_image_bytes_cache_is_bounded():
+    cache = ImageBytesCache(max_bytes=10)
+    cache.put(("a", "png", None), b"12345")
+    cache.put(("b", "png", None), b"12345")
+    cache.get(("a", "png", None))
+    cache.put(("c", "png", None), b"12345")
+    assert ("b", "png", None) not in cache
+    assert cache.stats()["bytes"] == 10
+    cache.discard("a")
+    assert ("a", "png", None) not in cache
+
+
+def test_finished_output_is_served_from_memory(clean_test_dir):
+    mgr = ImageJobManager(image_dir=TEST_IMAGE_DIR, worker_config=WorkerConfig(batch_window=0.0))
+    try:
+        job = mgr.submit_image_job("debug", 64, 32)
+        for _ in range(120):
+            if mgr.get_job(job.job_id).status == JobStatus.finished and not mgr.get_pool_status().workers[0].busy:
+                break
+            time.sleep(0.25)
+        # ワーカーから受け取った画像はファイルを読まずに返せる
+        os.remove(mgr._get_image_path(job.job_id))
+        image = Image.open(io.BytesIO(mgr.get_image_bytes(job.job_id)))
+        assert image.size == (64, 32)
+        thumb = Image.open(io.BytesIO(mgr.get_image_bytes(job.job_id, "webp", max_size=16)))
+        assert thumb.size == (16, 8)
+        mgr.get_image_bytes(job.job_id, "webp", max_size=16)
+        assert mgr.get_output_cache_stats()["hits"] >= 2
+        with pytest.raises(KeyError):
+            mgr.get_image_bytes("no-such-job")
+    finally:
+        mgr.shutdown()
+
+
+def test_get_image_tool_returns_inline_image(clean_test_dir):
+    from mcp.shared.memory import create_connected_server_and_client_session
+
+    from pixelart_mcp.image_mcp import create_mcp
+
+    mcp = create_mcp(WorkerConfig(batch_window=0.0), image_dir=TEST_IMAGE_DIR)
+
+    async def run():
+        async with create_connected_server_and_client_session(mcp) as client:
+            submitted = await client.call_tool("generate_pixelart_tool", {"prompt": "debug", "pixel_art_mode": 32})
+            job_id = submitted.structuredContent["job_id"]["job_id"]
+            await client.call_tool("get_job_tool", {"job_id": job_id, "wait": True, "timeout": 30})
+            return await client.call_tool("get_image_tool", {"job_id": job_id, "format": "webp"})
+
+    result = asyncio.run(run())
+    content = result.content[0]
+    assert content.type == "image" and content.mimeType == "image/webp"
+    assert Image.open(io.BytesIO(base64.b64decode(content.data))).format == "WEBP"
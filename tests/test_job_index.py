@@ -0,0 +1,78 @@
+import os
+
+from pixelart_mcp.image_jobs import ImageJobInfo, JobStatus
+from pixelart_mcp.job_index import JobIndex
+
+
+def test_upsert_get_and_list_order(tmp_path):
+    index = JobIndex(os.path.join(tmp_path, JobIndex.FILE_NAME))
+    older = ImageJobInfo.new_image("older", 64, 64)
+    older.start_time = "2025-01-01T00:00:00+09:00"
+    newer = ImageJobInfo.new_pixelart("newer", 32)
+    newer.start_time = "2025-01-02T00:00:00+09:00"
+    index.upsert(older)
+    index.upsert(newer)
+
+    newer.set_finished()
+    index.upsert(newer)
+
+    assert index.count() == 2
+    got = ImageJobInfo.model_validate_json(index.get_json(newer.job_id))
+    assert got.status == JobStatus.finished
+    assert index.get_json("missing") is None
+    listed = [ImageJobInfo.model_validate_json(d).job_id for d in index.list_json()]
+    assert listed == [newer.job_id, older.job_id]
+    index.close()
+
+
+def test_rebuild_from_disk_skips_broken_files(tmp_path):
+    jobs_dir = os.path.join(tmp_path, "jobs")
+    ok = ImageJobInfo.new_image("ok", 64, 64)
+    canceled = ImageJobInfo.new_image("canceled", 64, 64)
+    canceled.set_cancel()
+    for job, name in ((ok, "job.json"), (canceled, "cancel.json")):
+        os.makedirs(os.path.join(jobs_dir, job.job_id))
+        job.save(os.path.join(jobs_dir, job.job_id, name))
+    os.makedirs(os.path.join(jobs_dir, "broken"))
+    with open(os.path.join(jobs_dir, "broken", "job.json"), "w") as f:
+        f.write("{not json")
+
+    index = JobIndex(os.path.join(tmp_path, JobIndex.FILE_NAME))
+    assert index.created
+    assert index.rebuild(jobs_dir) == 2
+    got = ImageJobInfo.model_validate_json(index.get_json(canceled.job_id))
+    assert got.status == JobStatus.canceled
+    index.close()
+
+    # 2回目以降は既存のインデックスを開く
+    assert not JobIndex(os.path.join(tmp_path, JobIndex.FILE_NAME)).created
+
+
+def test_query_pagination_and_filters(tmp_path):
+    index = JobIndex(os.path.join(tmp_path, JobIndex.FILE_NAME))
+    items = []
+    for i in range(25):
+        job = ImageJobInfo.new_image(f"cat {i}" if i % 2 else f"dog 100%_{i}", 64, 64)
+        job.start_time = f"2025-01-01T00:00:{i:02d}+09:00"
+        if i % 5 == 0:
+            job.set_finished()
+        items.append(job.model_dump(mode="json"))
+    index.upsert_many(items)
+
+    seen = []
+    cursor = None
+    while True:
+        rows, cursor = index.query(cursor=cursor, limit=10)
+        seen.extend(row["job_id"] for row in rows)
+        if cursor is None:
+            break
+    assert seen == [item["job_id"] for item in reversed(items)]
+
+    rows, cursor = index.query(statuses=["finished"])
+    assert len(rows) == 5 and cursor is None
+    rows, _ = index.query(prompt_contains="100%_", limit=100)
+    assert len(rows) == 13
+    rows, _ = index.query(since="2025-01-01T00:00:10+09:00", until="2025-01-01T00:00:20+09:00", limit=100)
+    assert [row["prompt"] for row in rows][0] == "cat 19"
+    assert len(rows) == 10
+    index.close()
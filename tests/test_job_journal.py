@@ -0,0 +1,124 @@
+import json
+import os
+import time
+
+from pixelart_mcp.image_jobs import ImageJobInfo, ImageJobManager, JobStatus
+from pixelart_mcp.job_journal import JobJournal
+
+
+def _record(job_id: str, status: str) -> dict:
+    return {"job_id": job_id, "status": status}
+
+
+def test_replay_keeps_latest_state_and_skips_torn_tail(tmp_path):
+    path = str(tmp_path / JobJournal.FILE_NAME)
+    journal = JobJournal(path, sync_interval=0)
+    journal.append_many([_record("a", "not_start"), _record("b", "not_start"), _record("a", "finished")])
+    journal.close(clean=True)
+    journal = JobJournal(path)
+    journal.append(_record("b", "running"))
+    journal.append({"job_id": "c", "deleted": True})
+    journal.close()
+    # 書き込み途中で止まった行
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"job_id": "b", "sta')
+
+    states, unclean = JobJournal(path).replay()
+    assert list(states) == ["a", "b"]
+    assert states["a"]["status"] == "finished" and states["b"]["status"] == "running"
+    # 正常終了より後に更新されたジョブだけを確認すればよい
+    assert unclean == {"b"}
+
+
+def test_compact_does_not_lose_appends_from_other_writers(tmp_path):
+    path = str(tmp_path / JobJournal.FILE_NAME)
+    manager, worker = JobJournal(path, sync_interval=0), JobJournal(path, sync_interval=0)
+    for status in ("not_start", "running", "finished"):
+        manager.append(_record("a", status))
+    worker.append({"job_id": "a", "deleted": True})
+    worker.append(_record("b", "running"))
+    assert manager.compact() == 1
+    # 置き換わる前のファイルを開いていた側の追記も残る
+    worker.append(_record("b", "finished"))
+    states, _ = manager.replay()
+    assert manager.records_read == 2
+    assert states == {"b": _record("b", "finished")}
+    manager.close()
+    worker.close()
+
+
+def test_manager_recovers_state_from_journal_after_crash(tmp_path):
+    image_dir = str(tmp_path)
+    jobs_dir = os.path.join(image_dir, "jobs")
+    finished = ImageJobInfo.new_image("a knight", 64, 64)
+    canceled = ImageJobInfo.new_image("a dragon", 64, 64)
+    journal = JobJournal(os.path.join(image_dir, JobJournal.FILE_NAME), sync_interval=0)
+    for job_info in (finished, canceled):
+        os.makedirs(os.path.join(jobs_dir, job_info.job_id))
+        journal.append(job_info.model_dump(mode="json"))
+        job_info.save(os.path.join(jobs_dir, job_info.job_id, "job.json"))
+    finished.set_start()
+    finished.set_finished()
+    journal.append(finished.model_dump(mode="json"))
+    journal.close()
+    # job.jsonの書き直しの途中で止まり、キャンセルはcancel.jsonへの置き換えの直後に止まった
+    with open(os.path.join(jobs_dir, finished.job_id, "job.json"), "w", encoding="utf-8") as f:
+        f.write('{"job_id": "')
+    os.rename(os.path.join(jobs_dir, canceled.job_id, "job.json"), os.path.join(jobs_dir, canceled.job_id, "cancel.json"))
+
+    mgr = ImageJobManager(image_dir=image_dir)
+    try:
+        assert mgr.get_job(finished.job_id).status == JobStatus.finished
+        assert ImageJobInfo.load(os.path.join(jobs_dir, finished.job_id, "job.json")).status == JobStatus.finished
+        assert mgr.get_job(canceled.job_id).status == JobStatus.canceled
+        assert ImageJobInfo.load(os.path.join(jobs_dir, canceled.job_id, "cancel.json")).status == JobStatus.canceled
+        assert {item.job_id for item in mgr.query_jobs().jobs} == {finished.job_id, canceled.job_id}
+    finally:
+        mgr.shutdown()
+    # 正常終了したので、次の起動では確認するジョブが無い
+    assert JobJournal(os.path.join(image_dir, JobJournal.FILE_NAME)).replay()[1] == set()
+
+
+def test_manager_builds_journal_for_existing_jobs(tmp_path):
+    image_dir = str(tmp_path)
+    job_info = ImageJobInfo.new_pixelart("a slime", 32)
+    os.makedirs(os.path.join(image_dir, "jobs", job_info.job_id))
+    job_info.save(os.path.join(image_dir, "jobs", job_info.job_id, "job.json"))
+
+    mgr = ImageJobManager(image_dir=image_dir)
+    mgr.shutdown()
+    with open(os.path.join(image_dir, JobJournal.FILE_NAME), encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert records[0]["job_id"] == job_info.job_id
+    assert records[-1] == JobJournal.CLEAN_SHUTDOWN
+
+
+def test_manager_fails_running_and_requeues_waiting_jobs_after_crash(tmp_path):
+    image_dir = str(tmp_path)
+    jobs_dir = os.path.join(image_dir, "jobs")
+    running = ImageJobInfo.new_pixelart("debug knight", 32)
+    waiting = ImageJobInfo.new_pixelart("debug slime", 32)
+    journal = JobJournal(os.path.join(image_dir, JobJournal.FILE_NAME), sync_interval=0)
+    for job_info in (running, waiting):
+        os.makedirs(os.path.join(jobs_dir, job_info.job_id))
+        journal.append(job_info.model_dump(mode="json"))
+        job_info.save(os.path.join(jobs_dir, job_info.job_id, "job.json"))
+    running.set_start()
+    journal.append(running.model_dump(mode="json"))
+    # 正常終了の記録が無いまま止まった
+    journal.close()
+
+    mgr = ImageJobManager(image_dir=image_dir)
+    try:
+        interrupted = mgr.get_job(running.job_id)
+        assert interrupted.status == JobStatus.failed and interrupted.error
+        assert ImageJobInfo.load(os.path.join(jobs_dir, running.job_id, "job.json")).status == JobStatus.failed
+        deadline = time.monotonic() + 30
+        while mgr.get_job(waiting.job_id).status in (JobStatus.not_start, JobStatus.running) and time.monotonic() < deadline:
+            time.sleep(0.2)
+        assert mgr.get_job(waiting.job_id).status == JobStatus.finished
+    finally:
+        mgr.shutdown()
+    states, _ = JobJournal(os.path.join(image_dir, JobJournal.FILE_NAME)).replay()
+    assert states[running.job_id]["status"] == JobStatus.failed.value
+    assert states[waiting.job_id]["status"] == JobStatus.finished.value
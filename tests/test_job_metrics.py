@@ -0,0 +1,75 @@
+import os
+import shutil
+import time
+
+import pytest
+
+from pixelart_mcp.image_jobs import ImageJobManager, JobStatus
+from pixelart_mcp.job_metrics import JobMetrics, stage_timings
+from pixelart_mcp.models import MODEL_IDS
+
+TEST_IMAGE_DIR = "./tmp/JobMetricsDir"
+
+
+@pytest.fixture
+def clean_test_dir():
+    if os.path.isdir(TEST_IMAGE_DIR):
+        shutil.rmtree(TEST_IMAGE_DIR)
+    yield
+    if os.path.isdir(TEST_IMAGE_DIR):
+        shutil.rmtree(TEST_IMAGE_DIR)
+
+
+def test_histograms_are_cumulative_and_render_as_prometheus():
+    metrics = JobMetrics(buckets=(0.1, 1.0))
+    metrics.observe("finished", {"load": 0.05, "denoise": 0.5}, worker_id=0, peak_rss_bytes=100)
+    metrics.observe("finished", {"load": 2.0}, worker_id=0, peak_rss_bytes=300)
+    metrics.observe("finished", cached=True)
+
+    snapshot = metrics.snapshot()
+    assert snapshot.jobs == {"finished": 3, "cached": 1}
+    assert snapshot.stages["load"].buckets == {"0.1": 1, "1.0": 1, "+Inf": 2}
+    assert snapshot.stages["load"].count == 2 and snapshot.stages["load"].sum == pytest.approx(2.05)
+    assert snapshot.worker_peak_rss_bytes == {0: 300}
+
+    text = metrics.to_prometheus()
+    assert 'pixelart_jobs_total{status="finished"} 3' in text
+    assert 'pixelart_job_stage_seconds_bucket{stage="denoise",le="1.0"} 1' in text
+    assert 'pixelart_job_stage_seconds_count{stage="load"} 2' in text
+    assert 'pixelart_worker_peak_rss_bytes{worker="0"} 300' in text
+
+
+def test_stage_timings_averages_steps():
+    timings = stage_timings({"load": 1.0, "denoise": 0.6, "step_seconds": [0.1, 0.2, 0.3], "unknown": 5.0})
+    assert timings == {"load": 1.0, "denoise": 0.6, "step": pytest.approx(0.2)}
+
+
+def test_finished_job_records_stage_timings(clean_test_dir):
+    from benchmarks.tiny_pipeline import register_tiny_model
+
+    register_tiny_model("test-metrics", os.path.join(TEST_IMAGE_DIR, "model"), num_inference_steps=2, width=8)
+    try:
+        # ワーカーはマネージャーの起動時にforkされ、登録したモデルを引き継ぐ
+        mgr = ImageJobManager(image_dir=TEST_IMAGE_DIR)
+        try:
+            job = mgr.submit_image_job("a knight", 32, 32, model="test-metrics")
+            job = mgr.wait_for_job(job.job_id, timeout=120)
+            assert job.status == JobStatus.finished
+            assert job.timings is not None
+            assert {"queue_wait", "load", "encode", "denoise", "step", "decode", "resize", "save", "run"} <= set(job.timings)
+            assert job.peak_rss_bytes and job.peak_rss_bytes > 0
+            # ジョブの詳細を読み直しても残っている
+            assert mgr.get_job(job.job_id).timings == job.timings
+
+            # 完了通知の処理より先にjob.jsonが完了になることがある
+            deadline = time.monotonic() + 10
+            while not mgr.get_metrics().jobs and time.monotonic() < deadline:
+                time.sleep(0.05)
+            snapshot = mgr.get_metrics()
+            assert snapshot.jobs == {"finished": 1}
+            assert snapshot.stages["denoise"].count == 1
+            assert 'pixelart_job_stage_seconds_count{stage="run"} 1' in mgr.get_metrics_text()
+        finally:
+            mgr.shutdown()
+    finally:
+        MODEL_IDS.pop("test-metrics", None)
@@ -0,0 +1,79 @@
+import threading
+from dataclasses import dataclass
+
+from pixelart_mcp.image_jobs import ImageJobManager, WorkerConfig, _QueuedJob, _WorkerHandle
+from pixelart_mcp.job_scheduler import JobScheduler, SchedulingPolicy, job_cost
+
+
+@dataclass
+class Job:
+    job_id: str
+    cost: float
+    priority: int = 0
+    enqueued_at: float = 0.0
+
+
+class AliveProcess:
+    pid = None
+
+    def is_alive(self):
+        return True
+
+
+class ListQueue(list):
+    def put(self, item):
+        self.append(item)
+
+
+def test_sjf_orders_by_cost_and_aging_lets_large_jobs_through():
+    scheduler = JobScheduler(SchedulingPolicy(aging_rate=1.0))
+    large = Job("large", job_cost(40, 1024, 1024), enqueued_at=0.0)
+    small = Job("small", job_cost(20, 256, 256), enqueued_at=1.0)
+    assert [job.job_id for job in scheduler.order([large, small], now=2.0)] == ["small", "large"]
+    # 大きいジョブが見積もりの差（約160秒）より長く待った後に来た小さいジョブは、大きいジョブを追い越さない
+    late = Job("late", small.cost, enqueued_at=190.0)
+    assert [job.job_id for job in scheduler.order([large, late], now=200.0)] == ["large", "late"]
+    assert [job.job_id for job in JobScheduler(SchedulingPolicy(order="fifo")).order([small, large], now=2.0)] == ["large", "small"]
+
+
+def test_priority_moves_job_ahead():
+    scheduler = JobScheduler(SchedulingPolicy(priority_seconds=60.0))
+    urgent = Job("urgent", 50.0, priority=1, enqueued_at=1.0)
+    normal = Job("normal", 20.0, enqueued_at=0.0)
+    assert [job.job_id for job in scheduler.order([normal, urgent], now=1.0)] == ["urgent", "normal"]
+
+
+def test_observe_and_estimate_starts():
+    scheduler = JobScheduler()
+    scheduler.observe(10.0, 20.0)
+    assert 1.0 < scheduler.seconds_per_unit < 2.0
+    scheduler.seconds_per_unit = 2.0
+    starts = scheduler.estimate_starts([5.0, 0.0], [("a", 1.0), ("b", 1.0), ("c", 1.0)])
+    # a は空いているワーカー2で0秒後、b はその後（2秒後）、c もワーカー2で4秒後
+    assert starts == {"a": 0.0, "b": 2.0, "c": 4.0}
+    assert scheduler.estimate_starts([], [("a", 1.0)]) == {}
+
+
+def test_dispatch_respects_per_client_quota_and_estimates_queue():
+    mgr = ImageJobManager.__new__(ImageJobManager)
+    mgr.worker_config = WorkerConfig(num_workers=2, scheduling=SchedulingPolicy(max_jobs_per_client=1))
+    mgr._pending = []
+    mgr._scheduler = JobScheduler(mgr.worker_config.scheduling)
+    mgr._dispatched = {}
+    mgr._lock = threading.Lock()
+    mgr._workers = [_WorkerHandle(i, AliveProcess(), ListQueue(), None) for i in range(2)]  # type: ignore[arg-type]
+    mgr._pending = [
+        _QueuedJob("a1", "s1", ("s1", 1), cost=1.0, client_id="a", enqueued_at=0.0),
+        _QueuedJob("a2", "s1", ("s1", 2), cost=1.0, client_id="a", enqueued_at=1.0),
+        _QueuedJob("b1", "s1", ("s1", 3), cost=5.0, client_id="b", enqueued_at=2.0),
+    ]
+    mgr._dispatch()
+    # クライアントaの2件目は、1件目が終わるまでワーカーが空いていても待つ
+    assert sorted(mgr._dispatched) == ["a1", "b1"]
+    assert [job.job_id for job in mgr._pending] == ["a2"]
+
+    mgr._progress = {}
+    estimates = mgr._queue_estimates()
+    # 割り当て済みの2件が先、待っているa2は早く空くワーカー（a1の見積もり1秒）の後
+    assert estimates["a2"] == (3, 1.0)
+    assert {estimates["a1"][0], estimates["b1"][0]} == {1, 2}
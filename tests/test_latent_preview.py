@@ -0,0 +1,68 @@
+import os
+import shutil
+import time
+
+import pytest
+
+from pixelart_mcp.image_jobs import ImageJobManager, JobStatus, WorkerConfig
+
+TEST_IMAGE_DIR = "./tmp/LatentPreviewDir"
+
+
+@pytest.fixture
+def clean_test_dir():
+    if os.path.isdir(TEST_IMAGE_DIR):
+        shutil.rmtree(TEST_IMAGE_DIR)
+    yield
+    if os.path.isdir(TEST_IMAGE_DIR):
+        shutil.rmtree(TEST_IMAGE_DIR)
+
+
+def test_latents_to_images_projects_to_rgb():
+    import torch
+
+    from pixelart_mcp.latent_preview import latents_to_images
+
+    images = latents_to_images(torch.zeros(2, 4, 8, 16))
+    assert [image.size for image in images] == [(16, 8), (16, 8)]
+    assert images[0].mode == "RGB" and images[0].getpixel((0, 0)) == (127, 127, 127)
+    with pytest.raises(ValueError):
+        latents_to_images(torch.zeros(1, 16, 8, 8))
+
+
+def test_generate_images_calls_preview_every_interval(tmp_path, monkeypatch):
+    from benchmarks.tiny_pipeline import build_tiny_pipeline
+    from pixelart_mcp import image_generator
+
+    tiny = build_tiny_pipeline("sd")
+    monkeypatch.setattr(image_generator, "load_pipeline", lambda model_info, device: tiny)
+    previews: list[tuple[int, int, tuple[int, int]]] = []
+    errors = image_generator.generate_images(
+        ["a cat", "a dog"], [str(tmp_path / "a.png"), str(tmp_path / "b.png")], model_id_key="s1", size=(64, 64), steps=8,
+        preview=lambda i, step, image: previews.append((i, step, image.size)), preview_interval=3,
+    )
+    assert errors == [None, None]
+    # 潜在表現の解像度のまま。最後のステップは完成画像があるので作らない
+    side = 64 // tiny.vae_scale_factor
+    assert previews == [(0, 3, (side, side)), (1, 3, (side, side)), (0, 6, (side, side)), (1, 6, (side, side))]
+
+
+def test_running_job_exposes_preview(clean_test_dir):
+    mgr = ImageJobManager(image_dir=TEST_IMAGE_DIR, worker_config=WorkerConfig(batch_window=0.0, preview_interval=3))
+    try:
+        job = mgr.submit_image_job("debug", 64, 64)
+        seen: list[int] = []
+        # 初回のジョブはワーカーでのtorchの読み込みを含む
+        for _ in range(240):
+            info = mgr.get_job(job.job_id)
+            if info.status == JobStatus.finished:
+                break
+            if info.preview_step is not None:
+                seen.append(info.preview_step)
+                assert info.preview_path is not None and os.path.isfile(info.preview_path)
+                assert mgr.get_preview_bytes(job.job_id).startswith(b"\x89PNG")
+            time.sleep(0.1)
+        assert info.status == JobStatus.finished and info.preview_step is None
+        assert seen and set(seen) <= {3, 6, 9}
+    finally:
+        mgr.shutdown()
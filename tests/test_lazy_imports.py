@@ -0,0 +1,28 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _loaded_ml_modules(code: str) -> list[str]:
+    code += "\nimport json, sys\nprint(json.dumps([m for m in ('torch', 'diffusers', 'transformers') if m in sys.modules]))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=dict(os.environ, PYTHONPATH=ROOT),
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def test_mcp_server_import_does_not_load_ml_stack():
+    assert _loaded_ml_modules("import pixelart_mcp.image_mcp") == []
+
+
+def test_job_manager_bookkeeping_does_not_load_ml_stack(tmp_path):
+    code = (
+        "from pixelart_mcp.image_jobs import ImageJobManager\n"
+        f"mgr = ImageJobManager(image_dir={str(tmp_path)!r})\n"
+        "job = mgr.submit_pixelart_job('debug', 32)\n"
+        "mgr.get_job(job.job_id); mgr.query_jobs(); mgr.get_pool_status()\n"
+        "mgr.shutdown()"
+    )
+    assert _loaded_ml_modules(code) == []
@@ -0,0 +1,93 @@
+import dataclasses
+import tempfile
+
+import pytest
+import torch
+
+from pixelart_mcp.image_jobs import ImageJobInfo, ImageJobManager, JobStatus, WorkerConfig, _batch_limit
+from pixelart_mcp.memory_budget import fit_to_budget, max_batch_size, plan_memory
+from pixelart_mcp.models import MODEL_IDS, PerformanceOptions
+
+
+def test_plan_memory_switches_tiling_by_size():
+    s1 = MODEL_IDS["s1"]
+    small = plan_memory(s1, 512, 512)
+    assert not small.vae_tiling and small.unet_tile is None and not small.vae_slicing
+    large = plan_memory(s1, 1536, 1536)
+    assert large.vae_tiling and large.unet_tile == s1.performance.unet_tile_size
+    assert plan_memory(s1, 512, 512, batch_size=4).vae_slicing
+    # タイルに分けない場合より見積もりが小さい
+    untiled = plan_memory(dataclasses.replace(s1, performance=PerformanceOptions(vae_tiling_pixels=None, unet_tiling_threshold=None)), 1536, 1536)
+    assert large.peak_bytes < untiled.peak_bytes
+
+    # タイルに分けると、大きな画像でもタイルに分けない中くらいの画像より少ないメモリで済む
+    assert large.peak_bytes < plan_memory(s1, 768, 512).peak_bytes
+    budget = plan_memory(s1, 384, 256).peak_bytes
+    w, h = fit_to_budget(s1, 1536, 1024, budget)  # type: ignore[misc]
+    assert w % 64 == 0 and h % 64 == 0 and w <= 384 and w > h and plan_memory(s1, w, h).peak_bytes <= budget
+    assert fit_to_budget(s1, 1024, 1024, 1 << 20) is None
+    assert max_batch_size(s1, 512, 512, small.peak_bytes, 4) == 1
+    assert max_batch_size(s1, 512, 512, 1 << 40, 4) == 4
+
+
+def test_batch_limit_applies_budget_to_pixel_art():
+    job = ImageJobInfo.new_pixelart("a slime", 128, model="s1")
+    size = MODEL_IDS["s1"].pixel_art.generation_size(128)
+    assert size == 512
+    config = WorkerConfig(max_batch_size=4, memory_budget_bytes=plan_memory(MODEL_IDS["s1"], size, size, 2).peak_bytes)
+    assert _batch_limit(job, config) == 2
+    assert _batch_limit(job, WorkerConfig(max_batch_size=4)) == 4
+
+
+class _Pipe:
+    vae_scale_factor = 8
+
+    def __init__(self) -> None:
+        self.calls: list[tuple[int, ...]] = []
+
+        pipe = self
+
+        class Unet(torch.nn.Module):
+            def forward(self, sample, timestep, encoder_hidden_states=None, return_dict=True):
+                pipe.calls.append(tuple(sample.shape))
+                return (sample * 2 + timestep,)
+
+        self.unet = Unet()
+
+
+def test_tiled_unet_averages_overlapping_regions():
+    from pixelart_mcp.image_generator import tiled_unet
+
+    pipe = _Pipe()
+    sample = torch.randn(2, 4, 40, 24)
+    with tiled_unet(pipe, tile=128, overlap=32):  # type: ignore[arg-type]
+        out = pipe.unet(sample, 1, encoder_hidden_states=None, return_dict=False)[0]
+    # 要素ごとの計算なので、領域に分けても分けない場合と同じ結果になる
+    assert torch.allclose(out, sample * 2 + 1)
+    assert pipe.calls and all(shape[-2:] == (16, 16) for shape in pipe.calls)
+    # 縦40は 0, 12, 24 から、横24は 0, 8 から始まる16x16の領域
+    assert len(pipe.calls) == 3 * 2
+    assert "forward" not in pipe.unet.__dict__
+
+
+def test_admission_rejects_or_downgrades_large_requests():
+    s1 = MODEL_IDS["s1"]
+    budget = plan_memory(s1, 512, 512).peak_bytes
+    with tempfile.TemporaryDirectory() as image_dir:
+        mgr = ImageJobManager(image_dir=image_dir, worker_config=WorkerConfig(batch_window=0.0, memory_budget_bytes=budget, memory_policy="reject"))
+        try:
+            with pytest.raises(ValueError):
+                mgr.submit_image_job("debug", 2048, 2048, model="s1")
+            job = mgr.submit_image_job("debug", 512, 512, model="s1")
+            assert job.generation_width is None and job.memory_estimate_bytes == budget
+        finally:
+            mgr.shutdown()
+        mgr = ImageJobManager(image_dir=image_dir, worker_config=WorkerConfig(batch_window=0.0, memory_budget_bytes=budget))
+        try:
+            job = mgr.submit_image_job("debug", 2048, 1024, model="s1")
+            assert job.generation_width is not None and job.generation_height is not None
+            assert job.generation_width < 2048 and job.generation_width > job.generation_height
+            assert job.memory_estimate_bytes is not None and job.memory_estimate_bytes <= budget
+            assert mgr.wait_for_job(job.job_id, timeout=120).status == JobStatus.finished
+        finally:
+            mgr.shutdown()
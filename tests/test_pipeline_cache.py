@@ -0,0 +1,133 @@
+import os
+import weakref
+
+from PIL import Image
+
+from pixelart_mcp import image_generator
+from pixelart_mcp.pipeline_cache import PipelineCache
+
+
+class FakePipeline:
+    def __init__(self):
+        self.calls = 0
+
+    def set_progress_bar_config(self, **kwargs):
+        pass
+
+    def __call__(self, prompt, height, width, **kwargs):
+        self.calls += 1
+        return [Image.new("RGB", (width, height), (255, 0, 0))]
+
+
+def test_lru_eviction_by_entries():
+    cache = PipelineCache(max_entries=2)
+    cache.put(("a", "f32", "cpu"), "A", nbytes=1)
+    cache.put(("b", "f32", "cpu"), "B", nbytes=1)
+    assert cache.get(("a", "f32", "cpu")) == "A"
+    cache.put(("c", "f32", "cpu"), "C", nbytes=1)
+    # bが最も古いので破棄される
+    assert ("b", "f32", "cpu") not in cache
+    assert cache.keys() == [("a", "f32", "cpu"), ("c", "f32", "cpu")]
+    assert cache.stats() == {"hits": 1, "misses": 0, "evictions": 1, "entries": 2, "bytes": 2}
+
+
+def test_eviction_by_memory_budget_keeps_newest():
+    cache = PipelineCache(max_entries=10, max_bytes=100)
+    cache.put(("a", "f32", "cpu"), "A", nbytes=60)
+    cache.put(("b", "f32", "cpu"), "B", nbytes=60)
+    assert cache.keys() == [("b", "f32", "cpu")]
+    # 単独で予算を超えても直近のエントリは残す
+    cache.put(("c", "f32", "cpu"), "C", nbytes=500)
+    assert cache.keys() == [("c", "f32", "cpu")]
+    assert cache.evictions == 2
+    assert cache.total_bytes == 500
+
+
+def test_get_or_load_loads_once():
+    cache = PipelineCache()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return object()
+
+    key = PipelineCache.make_key("s2", "torch.float16", "cpu")
+    first = cache.get_or_load(key, loader)
+    second = cache.get_or_load(key, loader)
+    assert first is second
+    assert len(loads) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+class Weights:
+    pass
+
+
+def test_get_or_load_releases_old_entry_before_loading():
+    # 1つ分の予算では、新しいパイプラインをロードする前に古いものを手放す
+    cache = PipelineCache(max_entries=10, max_bytes=100)
+    old = Weights()
+    released = weakref.ref(old)
+    cache.put(("a", "f32", "cpu"), old, nbytes=60)
+    del old
+    seen_during_load = []
+
+    def loader():
+        seen_during_load.append((cache.keys(), released() is None))
+        return Weights()
+
+    cache.get_or_load(("b", "f32", "cpu"), loader, nbytes_hint=60)
+    assert seen_during_load == [([], True)]
+    assert cache.keys() == [("b", "f32", "cpu")]
+
+    # 見積もりが無くても、以前にロードしたときの大きさで空ける。予算に収まる分は残す
+    cache = PipelineCache(max_entries=10, max_bytes=100)
+    cache.put(("a", "f32", "cpu"), Weights(), nbytes=30)
+    cache.put(("b", "f32", "cpu"), Weights(), nbytes=60)
+    cache.put(("c", "f32", "cpu"), Weights(), nbytes=20)
+    assert cache.keys() == [("b", "f32", "cpu"), ("c", "f32", "cpu")]
+    cache.get_or_load(("a", "f32", "cpu"), lambda: seen_during_load.append(cache.keys()) or Weights())
+    assert seen_during_load[-1] == [("c", "f32", "cpu")]
+
+
+def test_generate_image_reuses_cached_pipeline(tmp_path, monkeypatch):
+    loads = []
+    pipe = FakePipeline()
+
+    def fake_load_pipeline(model_info, device):
+        loads.append(model_info.name)
+        return pipe
+
+    monkeypatch.setattr(image_generator, "load_pipeline", fake_load_pipeline)
+    cache = PipelineCache()
+    for i in range(2):
+        output = os.path.join(tmp_path, f"out{i}.png")
+        image_generator.generate_image("a cat", output, model_id_key="s1", size=(64, 64), pipeline_cache=cache)
+        assert os.path.isfile(output)
+    assert len(loads) == 1
+    assert pipe.calls == 2
+    assert cache.stats()["hits"] == 1
+
+
+def test_prompt_embeddings_are_cached_per_model(tmp_path, monkeypatch):
+    from benchmarks.tiny_pipeline import build_tiny_pipeline
+    from pixelart_mcp.pipeline_cache import EmbeddingCache
+
+    tiny = build_tiny_pipeline("sd")
+    monkeypatch.setattr(image_generator, "load_pipeline", lambda model_info, device: tiny)
+    cache = PipelineCache()
+    embeddings = EmbeddingCache()
+    outputs = [os.path.join(tmp_path, f"out{i}.png") for i in range(2)]
+
+    errors = image_generator.generate_images(["a cat", "a dog"], outputs, model_id_key="s1", size=(64, 64), steps=2,
+                                             pipeline_cache=cache, embedding_cache=embeddings)
+    assert errors == [None, None]
+    # ロード時にネガティブプロンプトを計算済みなので、初回呼び出しでもネガティブはヒットする
+    negative_key = (*PipelineCache.make_key("s1", image_generator.MODEL_IDS["s1"].dtype, "cpu"), image_generator.default_negave_prompt)
+    assert negative_key in embeddings
+    assert embeddings.stats()["hits"] == 1
+
+    image_generator.generate_images(["a cat"], outputs[:1], model_id_key="s1", size=(64, 64), steps=2,
+                                    pipeline_cache=cache, embedding_cache=embeddings)
+    stats = embeddings.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (3, 3, 3)
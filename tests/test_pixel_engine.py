@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from pixelart_mcp.pixel_engine import (
+    PixelArtOptions,
+    cleanup_isolated,
+    downsample_mean,
+    pixelate_batch,
+    pixelate_images,
+)
+
+
+def _two_tone(n: int = 2, size: int = 64) -> np.ndarray:
+    images = np.zeros((n, size, size, 3), dtype=np.uint8)
+    images[:, :, size // 2:] = (250, 20, 20)
+    return images
+
+
+def test_downsample_mean_uneven_blocks():
+    images = np.arange(2 * 10 * 10 * 3, dtype=np.float32).reshape(2, 10, 10, 3)
+    out = downsample_mean(images, 3)
+    assert out.shape == (2, 3, 3, 3)
+    assert np.allclose(out[0, 0, 0], images[0, :3, :3].mean(axis=(0, 1)))
+    assert np.allclose(out[1, 2, 2], images[1, 6:, 6:].mean(axis=(0, 1)))
+
+
+@pytest.mark.parametrize("mode", ["block", "majority"])
+@pytest.mark.parametrize("size", [32, 48])
+def test_pixelate_batch_shape_and_palette(mode, size):
+    rng = np.random.default_rng(0)
+    images = rng.integers(0, 256, size=(3, 96, 96, 3), dtype=np.uint8)
+    out = pixelate_batch(images, size, PixelArtOptions(mode=mode, colors=8, outline_cleanup=False))
+    assert out.shape == (3, size, size, 3)
+    assert out.dtype == np.uint8
+    for image in out:
+        assert len(np.unique(image.reshape(-1, 3), axis=0)) <= 8
+
+
+def test_majority_picks_dominant_color():
+    images = np.zeros((1, 8, 8, 3), dtype=np.uint8)
+    images[0, :4, :4] = (255, 255, 255)
+    # 左上ブロックの少数派の画素（平均なら灰色になる）
+    images[0, 0, 0] = (0, 0, 255)
+    out = pixelate_batch(images, 2, PixelArtOptions(mode="majority", colors=3, outline_cleanup=False))
+    assert tuple(out[0, 0, 0]) == (255, 255, 255)
+    assert tuple(out[0, 1, 1]) == (0, 0, 0)
+
+
+def test_cleanup_isolated_pixel():
+    images = np.zeros((1, 5, 5, 3), dtype=np.uint8)
+    images[0, 2, 2] = (255, 0, 0)
+    images[0, 0, 4] = (0, 255, 0)
+    out = cleanup_isolated(images)
+    assert not out[0, 2, 2].any()
+    # 角の画素は4近傍がそろわないので残す
+    assert tuple(out[0, 0, 4]) == (0, 255, 0)
+
+
+def test_dither_and_pil_helper():
+    images = [Image.fromarray(image) for image in _two_tone()]
+    out = pixelate_images(images, 16, PixelArtOptions(mode="block", colors=4, dither=True))
+    assert [image.size for image in out] == [(16, 16), (16, 16)]
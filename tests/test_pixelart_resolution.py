@@ -0,0 +1,51 @@
+import dataclasses
+
+from PIL import Image
+
+from pixelart_mcp.image_jobs import ImageJobInfo, _request_key
+from pixelart_mcp.models import MODEL_IDS, PixelArtResolution
+
+
+def test_generation_size_policy():
+    policy = PixelArtResolution()
+    assert [policy.generation_size(s) for s in (32, 48, 64, 128)] == [256, 384, 256, 512]
+    # 生成サイズは64と出力サイズの両方で割り切れ、native_sizeを超えない
+    for s in (32, 48, 64, 128, 256, 512):
+        size = policy.generation_size(s)
+        assert size % 64 == 0 and size % s == 0 and size <= 512
+    # min_size=512 は以前の常に512x512で生成する動作
+    assert {PixelArtResolution(min_size=512).generation_size(s) for s in (32, 48, 64, 128)} == {512}
+
+
+def test_request_key_follows_resolution_policy():
+    job = ImageJobInfo.new_pixelart("a knight", 32, model="p1")
+    before = _request_key(job)
+    p1 = MODEL_IDS["p1"]
+    try:
+        MODEL_IDS["p1"] = dataclasses.replace(p1, pixel_art=PixelArtResolution(decode="reduced"))
+        assert _request_key(job) != before
+    finally:
+        MODEL_IDS["p1"] = p1
+    assert _request_key(job) == before
+
+
+def test_generate_pixel_art_per_decode_mode(tmp_path):
+    from benchmarks.tiny_pipeline import register_tiny_model
+    from pixelart_mcp.image_generator import generate_images
+    from pixelart_mcp.pipeline_cache import PipelineCache
+
+    info = register_tiny_model("test-pixel", str(tmp_path / "model"), num_inference_steps=2, width=8)
+    try:
+        cache = PipelineCache()
+        for decode in ("full", "reduced", "latent"):
+            MODEL_IDS["test-pixel"] = dataclasses.replace(info, pixel_art=PixelArtResolution(min_size=64, decode=decode))
+            output_file = str(tmp_path / f"{decode}.png")
+            timings: dict = {}
+            errors = generate_images(["a knight"], [output_file], model_id_key="test-pixel", pixel_art_mode=32,
+                                     pipeline_cache=cache, seeds=[0], timings=timings)
+            assert errors == [None]
+            with Image.open(output_file) as image:
+                assert image.size == (32, 32)
+            assert timings["decode"] >= 0
+    finally:
+        MODEL_IDS.pop("test-pixel", None)
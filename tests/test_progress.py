@@ -0,0 +1,82 @@
+import asyncio
+import os
+import shutil
+import time
+
+import pytest
+
+from pixelart_mcp.image_jobs import ImageJobManager, JobStatus, WorkerConfig, _JobProgress
+
+TEST_IMAGE_DIR = "./tmp/ProgressDir"
+DEBUG_STEPS = 10
+
+
+@pytest.fixture
+def clean_test_dir():
+    if os.path.isdir(TEST_IMAGE_DIR):
+        shutil.rmtree(TEST_IMAGE_DIR)
+    yield
+    if os.path.isdir(TEST_IMAGE_DIR):
+        shutil.rmtree(TEST_IMAGE_DIR)
+
+
+def test_eta_ignores_time_before_first_step(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    progress = _JobProgress()
+    progress.update(1, 10)
+    assert progress.eta() is None
+    now[0] += 2.0
+    progress.update(5, 10)
+    # 4ステップに2秒 -> 残り5ステップで2.5秒
+    assert progress.eta() == pytest.approx(2.5)
+    # 1件ずつの再実行でステップ数が戻ったら測り直す
+    progress.update(1, 10)
+    assert progress.eta() is None
+
+
+def test_get_job_reports_live_progress(clean_test_dir):
+    mgr = ImageJobManager(image_dir=TEST_IMAGE_DIR, worker_config=WorkerConfig(batch_window=0.0))
+    try:
+        job = mgr.submit_image_job("debug", 64, 64)
+        seen: list[tuple[int | None, int | None, float | None]] = []
+        # 初回のジョブはワーカーでのtorchの読み込みを含む
+        for _ in range(120):
+            info = mgr.get_job(job.job_id)
+            if info.status == JobStatus.finished:
+                break
+            if info.current_step is not None:
+                seen.append((info.current_step, info.total_steps, info.eta_seconds))
+            time.sleep(0.25)
+        assert info.status == JobStatus.finished
+        assert info.current_step is None
+        assert seen and all(total == DEBUG_STEPS for _, total, _ in seen)
+        assert [step for step, _, _ in seen] == sorted(step for step, _, _ in seen)
+        assert any(eta is not None for _, _, eta in seen)
+    finally:
+        mgr.shutdown()
+
+
+def test_get_job_tool_streams_progress_notifications(clean_test_dir):
+    from mcp.shared.memory import create_connected_server_and_client_session
+
+    from pixelart_mcp.image_mcp import create_mcp
+
+    mcp = create_mcp(WorkerConfig(batch_window=0.0), image_dir=TEST_IMAGE_DIR)
+
+    async def run() -> tuple[list[tuple[float, float | None]], dict]:
+        notifications: list[tuple[float, float | None]] = []
+
+        async def on_progress(progress: float, total: float | None, message: str | None) -> None:
+            notifications.append((progress, total))
+
+        async with create_connected_server_and_client_session(mcp) as client:
+            submitted = await client.call_tool("generate_image_tool", {"prompt": "debug", "width": 64, "height": 64})
+            job_id = submitted.structuredContent["job_id"]["job_id"]
+            result = await client.call_tool("get_job_tool", {"job_id": job_id, "wait": True, "timeout": 30}, progress_callback=on_progress)
+        return notifications, result.structuredContent
+
+    notifications, job = asyncio.run(run())
+    assert job["status"] == JobStatus.finished.value
+    assert notifications and all(total == DEBUG_STEPS for _, total in notifications)
+    assert [p for p, _ in notifications] == sorted(p for p, _ in notifications)
@@ -0,0 +1,119 @@
+import os
+import shutil
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from pixelart_mcp import image_generator
+from pixelart_mcp.image_jobs import ImageJobManager, JobStatus, WorkerConfig
+from pixelart_mcp.pipeline_cache import PipelineCache
+from pixelart_mcp.result_store import ResultStore, make_request_key
+
+TEST_IMAGE_DIR = "./tmp/ResultStoreDir"
+
+
+@pytest.fixture
+def clean_test_dir():
+    if os.path.isdir(TEST_IMAGE_DIR):
+        shutil.rmtree(TEST_IMAGE_DIR)
+    yield
+    if os.path.isdir(TEST_IMAGE_DIR):
+        shutil.rmtree(TEST_IMAGE_DIR)
+
+
+def _write_png(path, size=16, color=(255, 0, 0)):
+    Image.new("RGB", (size, size), color).save(path)
+
+
+def test_request_key_depends_on_every_parameter():
+    base = {"model": "p1", "prompt": "a cat", "size": [512, 512], "steps": 40, "seed": 0, "post": None}
+    assert make_request_key(base) == make_request_key(dict(reversed(list(base.items()))))
+    for name, value in [("prompt", "a dog"), ("seed", 1), ("steps", 20), ("size", [256, 256])]:
+        assert make_request_key({**base, name: value}) != make_request_key(base)
+
+
+def test_link_to_shares_the_stored_file(tmp_path):
+    store = ResultStore(str(tmp_path / "results"))
+    src = str(tmp_path / "output.png")
+    _write_png(src)
+    assert store.link_to("ab" * 32, str(tmp_path / "missing.png")) is False
+    store.put("ab" * 32, src)
+    dst = str(tmp_path / "copy.png")
+    assert store.link_to("ab" * 32, dst) is True
+    assert os.path.samefile(dst, store.path_for("ab" * 32))
+
+
+def test_eviction_keeps_store_under_budget(tmp_path):
+    src = str(tmp_path / "output.png")
+    _write_png(src, size=64, color=(10, 20, 30))
+    nbytes = os.path.getsize(src)
+    store = ResultStore(str(tmp_path / "results"), max_bytes=nbytes * 2)
+    keys = [f"{i:02d}" * 32 for i in range(3)]
+    for i, key in enumerate(keys):
+        path = str(tmp_path / f"out{i}.png")
+        shutil.copyfile(src, path)
+        os.utime(path, (1000 + i, 1000 + i))
+        store.put(key, path)
+        if i == 1:
+            # 先に登録したものを使うと、後から登録したものより長く残る
+            store.lookup(keys[0])
+    assert store.lookup(keys[1]) is None
+    assert store.lookup(keys[0]) is not None and store.lookup(keys[2]) is not None
+    assert store.stats()["bytes"] <= nbytes * 2
+
+
+def test_seeded_batch_matches_single_generation(tmp_path, monkeypatch):
+    from benchmarks.tiny_pipeline import build_tiny_pipeline
+
+    tiny = build_tiny_pipeline("sd")
+    monkeypatch.setattr(image_generator, "load_pipeline", lambda model_info, device: tiny)
+    cache = PipelineCache()
+    batch = [str(tmp_path / f"batch{i}.png") for i in range(2)]
+    single = str(tmp_path / "single.png")
+    assert image_generator.generate_images(["a cat", "a dog"], batch, model_id_key="s1", size=(64, 64), steps=2,
+                                           pipeline_cache=cache, seeds=[7, 8]) == [None, None]
+    image_generator.generate_image("a dog", single, model_id_key="s1", size=(64, 64), steps=2, pipeline_cache=cache, seed=8)
+    # バッチ化による演算順の違いで丸めが1ずれることはある
+    diff = np.abs(np.asarray(Image.open(batch[1]), dtype=np.int16) - np.asarray(Image.open(single), dtype=np.int16))
+    assert diff.max() <= 1
+
+
+def test_identical_requests_are_coalesced_and_reused(clean_test_dir):
+    mgr = ImageJobManager(image_dir=TEST_IMAGE_DIR, worker_config=WorkerConfig(batch_window=0.0))
+    try:
+        first = mgr.submit_pixelart_job("debug", 32)
+        # 実行中の同じ要求は新しいジョブを作らない
+        assert mgr.submit_pixelart_job("debug", 32).job_id == first.job_id
+        other_seed = mgr.submit_pixelart_job("debug", 32, seed=1)
+        assert other_seed.job_id != first.job_id
+        for _ in range(60):
+            if mgr.get_job(first.job_id).status == JobStatus.finished and mgr.get_job(other_seed.job_id).status == JobStatus.finished:
+                break
+            time.sleep(0.25)
+        assert mgr.get_job(first.job_id).status == JobStatus.finished
+
+        # 完了済みの要求はすぐに完了し、画像は同じファイルを共有する
+        t0 = time.monotonic()
+        again = mgr.submit_pixelart_job("debug", 32)
+        assert time.monotonic() - t0 < 1.0
+        assert again.job_id != first.job_id
+        assert again.status == JobStatus.finished and again.cached
+        assert os.path.samefile(mgr._get_image_path(again.job_id), mgr._get_image_path(first.job_id))
+    finally:
+        mgr.shutdown()
+
+
+def test_shared_job_is_canceled_only_after_every_request_cancels(clean_test_dir):
+    mgr = ImageJobManager(image_dir=TEST_IMAGE_DIR, worker_config=WorkerConfig(batch_window=0.0))
+    try:
+        first = mgr.submit_pixelart_job("debug", 32, seed=7)
+        assert mgr.submit_pixelart_job("debug", 32, seed=7).job_id == first.job_id
+        # 相乗りしている要求が残っている間はキャンセルしない
+        assert "キャンセルせず" in mgr.cancel_job(first.job_id)
+        assert mgr.get_job(first.job_id).status in (JobStatus.not_start, JobStatus.running)
+        assert "キャンセルしました" in mgr.cancel_job(first.job_id)
+        assert mgr.get_job(first.job_id).status == JobStatus.canceled
+    finally:
+        mgr.shutdown()
@@ -0,0 +1,151 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+from pixelart_mcp.image_jobs import ImageJobInfo, ImageJobManager, JobStatus, WorkerConfig
+from pixelart_mcp.job_index import JobIndex
+from pixelart_mcp.job_journal import JobJournal
+from pixelart_mcp.retention import RetentionPolicy, measure_dir, select_expired
+
+NOW = datetime(2025, 6, 1, 12, 0, 0).astimezone()
+
+
+def _job(index: int, status: JobStatus, days_ago: float) -> ImageJobInfo:
+    job_info = ImageJobInfo.new_image(f"job {index}", 64, 64)
+    job_info.job_id = f"{index:04d}_{job_info.job_id}"
+    job_info.status = status
+    job_info.start_time = (NOW - timedelta(days=days_ago)).isoformat()
+    return job_info
+
+
+def test_select_expired_applies_age_count_and_size_limits(tmp_path):
+    index = JobIndex(str(tmp_path / JobIndex.FILE_NAME))
+    jobs = [
+        _job(0, JobStatus.finished, 30),
+        _job(1, JobStatus.failed, 20),
+        _job(2, JobStatus.failed, 10),
+        _job(3, JobStatus.finished, 5),
+        _job(4, JobStatus.finished, 1),
+        _job(5, JobStatus.running, 40),
+    ]
+    index.upsert_many([job.model_dump(mode="json") for job in jobs])
+    index.set_sizes({job.job_id: 100 for job in jobs})
+    ids = [job.job_id for job in jobs]
+
+    assert list(select_expired(index, RetentionPolicy(max_age_days=15), now=NOW)) == ids[:2]
+    assert list(select_expired(index, RetentionPolicy(keep_per_status={"failed": 1}), now=NOW)) == [ids[1]]
+    # 実行中のジョブは容量に数えても削除しない
+    assert list(select_expired(index, RetentionPolicy(max_bytes=350), now=NOW)) == ids[:3]
+    assert select_expired(index, RetentionPolicy(), now=NOW) == {}
+    index.close()
+
+
+def test_measure_dir_includes_subdirectories(tmp_path):
+    job_dir = tmp_path / "job"
+    os.makedirs(job_dir / "frames")
+    (job_dir / "output.png").write_bytes(b"\0" * 1000)
+    for i in range(3):
+        (job_dir / "frames" / f"frame_{i:03d}.png").write_bytes(b"\0" * 100)
+    assert measure_dir(str(job_dir)) == 1300
+    assert measure_dir(str(tmp_path / "missing")) == 0
+    # 結果ストアにハードリンクしたファイルは、ジョブを削除しても空かないので数えない
+    os.link(job_dir / "output.png", tmp_path / "stored.png")
+    stat = os.stat(tmp_path / "stored.png")
+    assert measure_dir(str(job_dir), stored=(stat.st_dev, stat.st_ino)) == 300
+    # 結果ストア以外（再利用したジョブ）と共有しているファイルはリンク数で割って数える
+    assert measure_dir(str(job_dir)) == 800
+
+
+def _make_finished_jobs(image_dir: str, statuses: list[JobStatus], size: int = 1000) -> list[ImageJobInfo]:
+    jobs = []
+    for i, status in enumerate(statuses):
+        job_info = _job(i, status, len(statuses) - i)
+        job_dir = os.path.join(image_dir, "jobs", job_info.job_id)
+        os.makedirs(job_dir)
+        job_info.save(os.path.join(job_dir, "job.json"))
+        with open(os.path.join(job_dir, "output.png"), "wb") as f:
+            f.write(b"\0" * size)
+        jobs.append(job_info)
+    return jobs
+
+
+def test_purge_jobs_deletes_and_reports_reclaimed_space(tmp_path):
+    image_dir = str(tmp_path)
+    jobs = _make_finished_jobs(image_dir, [JobStatus.finished, JobStatus.failed, JobStatus.failed, JobStatus.not_start])
+    mgr = ImageJobManager(image_dir=image_dir)
+    try:
+        mgr.run_retention()
+        stats = mgr.get_storage_stats()
+        assert stats.jobs == 4 and stats.measured_jobs == 3 and stats.total_bytes > 3000
+
+        dry = mgr.purge_jobs(status=[JobStatus.failed, JobStatus.not_start], dry_run=True)
+        assert dry.deleted_jobs == 2 and os.path.isdir(os.path.join(image_dir, "jobs", jobs[1].job_id))
+
+        result = mgr.purge_jobs(status=[JobStatus.failed, JobStatus.not_start])
+        assert sorted(result.job_ids) == sorted([jobs[1].job_id, jobs[2].job_id])
+        assert result.reclaimed_bytes > 2000
+        assert not os.path.exists(os.path.join(image_dir, "jobs", jobs[1].job_id))
+        assert {job.job_id for job in mgr.query_jobs().jobs} == {jobs[0].job_id, jobs[3].job_id}
+        stats = mgr.get_storage_stats()
+        assert stats.deleted_jobs == 2 and stats.reclaimed_bytes == result.reclaimed_bytes
+        # 台帳からも削除したジョブが外れる
+        assert stats.measured_jobs == 1 and 1000 < stats.total_bytes < 2000
+    finally:
+        mgr.shutdown()
+    # 削除はジャーナルに記録されるので、再起動しても戻らない
+    states, _ = JobJournal(os.path.join(image_dir, JobJournal.FILE_NAME)).replay()
+    assert set(states) == {jobs[0].job_id, jobs[3].job_id}
+
+
+def test_background_retention_enforces_max_bytes(tmp_path):
+    image_dir = str(tmp_path)
+    jobs = _make_finished_jobs(image_dir, [JobStatus.finished] * 4, size=10_000)
+    config = WorkerConfig(retention=RetentionPolicy(max_bytes=25_000, interval=0.1))
+    mgr = ImageJobManager(image_dir=image_dir, worker_config=config)
+    try:
+        deadline = time.monotonic() + 10
+        while mgr.get_storage_stats().deleted_jobs < 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        stats = mgr.get_storage_stats()
+        assert stats.deleted_jobs == 2 and stats.total_bytes <= 25_000
+        # 古いジョブから削除する
+        assert {job.job_id for job in mgr.query_jobs().jobs} == {jobs[2].job_id, jobs[3].job_id}
+    finally:
+        mgr.shutdown()
+
+
+def _disk_bytes(jobs_dir: str, results_dir: str) -> int:
+    """ジョブディレクトリのファイルのうち、結果ストアと共有していないものの実際の合計バイト数"""
+    stored = {(st.st_dev, st.st_ino) for root, _, files in os.walk(results_dir) for st in (os.stat(os.path.join(root, f)) for f in files)}
+    seen: dict[tuple[int, int], int] = {}
+    for root, _, files in os.walk(jobs_dir):
+        for name in files:
+            st = os.stat(os.path.join(root, name))
+            if (st.st_dev, st.st_ino) not in stored:
+                seen[(st.st_dev, st.st_ino)] = st.st_size
+    return sum(seen.values())
+
+
+def test_ledger_follows_result_store_eviction(tmp_path):
+    image_dir = str(tmp_path)
+    # 結果ストアには最後に登録した画像だけが残る
+    mgr = ImageJobManager(image_dir=image_dir, worker_config=WorkerConfig(batch_window=0.0, result_cache_bytes=1))
+    try:
+        first = mgr.submit_image_job("debug", 64, 64, seed=1)
+        assert mgr.wait_for_job(first.job_id, timeout=60).status == JobStatus.finished
+        mgr.run_retention()
+        assert mgr.get_storage_stats().total_bytes == _disk_bytes(mgr.jobs_dir, mgr.results_dir)
+        first_output = os.path.join(mgr.jobs_dir, first.job_id, "output.png")
+        assert os.stat(first_output).st_nlink == 2
+
+        second = mgr.submit_image_job("debug", 64, 64, seed=2)
+        assert mgr.wait_for_job(second.job_id, timeout=60).status == JobStatus.finished
+        # 最初の画像は結果ストアから破棄され、ジョブのoutput.pngだけが残る
+        assert os.stat(first_output).st_nlink == 1
+        mgr.run_retention()
+        stats = mgr.get_storage_stats()
+        assert stats.measured_jobs == 2
+        assert stats.total_bytes == _disk_bytes(mgr.jobs_dir, mgr.results_dir)
+        assert stats.total_bytes > os.path.getsize(first_output)
+    finally:
+        mgr.shutdown()
@@ -0,0 +1,61 @@
+import dataclasses
+import os
+
+from pixelart_mcp.image_jobs import ImageJobInfo, _batch_key, _request_key
+from pixelart_mcp.models import MODEL_ID_LCM, MODEL_IDS
+from pixelart_mcp.samplers import plan_sampling
+
+
+def test_plan_sampling_per_speed_tier():
+    s1 = MODEL_IDS["s1"]
+    assert plan_sampling(s1).steps == s1.num_inference_steps and not plan_sampling(s1).lcm_lora
+    fast = plan_sampling(s1, "fast")
+    assert fast.sampler == "DPM++" and fast.steps == 20
+    turbo = plan_sampling(s1, "turbo")
+    assert turbo.sampler == "LCM" and turbo.lcm_lora and 4 <= turbo.steps <= 8
+    # LCM-LoRAの無いモデルのturboはfastと同じ
+    assert plan_sampling(MODEL_IDS["s2"], "turbo") == plan_sampling(MODEL_IDS["s2"], "fast")
+    assert plan_sampling(dataclasses.replace(s1, use_lcm=True)).lcm_lora
+    assert MODEL_IDS["par"].lcm_lora_id == MODEL_ID_LCM
+
+
+def test_speed_tier_changes_batch_and_request_keys():
+    quality = ImageJobInfo.new_image("a knight", 64, 64, model="s1")
+    turbo = ImageJobInfo.new_image("a knight", 64, 64, model="s1", speed="turbo")
+    assert _batch_key(quality)[0] == "s1" and _batch_key(turbo)[0] == "s1+lcm"
+    assert _request_key(quality) != _request_key(turbo)
+    assert _request_key(ImageJobInfo.new_image("a knight", 64, 64, model="s1", speed="fast")) != _request_key(quality)
+
+
+def test_speed_tier_is_ignored_for_fixed_sampling_models():
+    # s2（LatentConsistencyModelPipeline）はspeedによらず同じ画像になるので、まとめ方も生成結果のキーも変えない
+    for make in (lambda speed: ImageJobInfo.new_image("a knight", 64, 64, model="s2", speed=speed),
+                 lambda speed: ImageJobInfo.new_pixelart("a knight", 32, model="s2", speed=speed)):
+        jobs = [make(speed) for speed in ("quality", "fast", "turbo")]
+        assert len({_batch_key(job) for job in jobs}) == 1
+        assert len({_request_key(job) for job in jobs}) == 1
+
+
+def test_generate_images_switches_schedulers_per_tier(tmp_path):
+    from benchmarks.tiny_pipeline import register_tiny_model
+    from pixelart_mcp.image_generator import generate_images
+    from pixelart_mcp.pipeline_cache import PipelineCache
+
+    register_tiny_model("test-tiers", str(tmp_path / "model"), num_inference_steps=10, width=8, lcm_lora=True)
+    try:
+        cache = PipelineCache()
+        output_file = str(tmp_path / "out.png")
+        steps: dict[str, int] = {}
+        schedulers: dict[str, str] = {}
+        for speed in ("fast", "turbo", "quality"):
+            timings: dict = {}
+            errors = generate_images(["a knight"], [output_file], model_id_key="test-tiers", size=(32, 32),
+                                     pipeline_cache=cache, seeds=[0], timings=timings, speed=speed)
+            assert errors == [None] and os.path.isfile(output_file)
+            steps[speed] = len(timings["step_seconds"])
+            pipes = {key[0]: cache.get(key) for key in cache.keys()}
+            schedulers[speed] = type(pipes["test-tiers+lcm" if speed == "turbo" else "test-tiers"].scheduler).__name__
+        assert steps == {"fast": 10, "turbo": 6, "quality": 10}
+        assert schedulers == {"fast": "DPMSolverMultistepScheduler", "turbo": "LCMScheduler", "quality": "DDIMScheduler"}
+    finally:
+        MODEL_IDS.pop("test-tiers", None)
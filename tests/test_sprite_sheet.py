@@ -0,0 +1,103 @@
+import json
+import os
+import queue
+import shutil
+import threading
+
+import pytest
+from PIL import Image
+
+from pixelart_mcp import image_jobs
+from pixelart_mcp.image_jobs import ImageJobInfo, ImageJobManager, JobStatus, WorkerConfig, _batch_key, _request_key, _run_variants, _worker_main
+from pixelart_mcp.memory_budget import plan_memory
+from pixelart_mcp.models import MODEL_IDS
+from pixelart_mcp.sprite_sheet import ATLAS_FILE, SHEET_FILE, export_sprite_sheet, make_atlas, split_sprite_sheet
+
+
+def test_make_atlas_lays_out_frames_row_major():
+    atlas = make_atlas([7, 8, 9, 10, 11], 32, 32)
+    assert atlas["meta"]["size"] == {"w": 96, "h": 64}
+    assert [entry["frame"]["x"] for entry in atlas["frames"]] == [0, 32, 64, 0, 32]
+    assert [entry["frame"]["y"] for entry in atlas["frames"]] == [0, 0, 0, 32, 32]
+    assert [entry["seed"] for entry in atlas["frames"]] == [7, 8, 9, 10, 11]
+
+
+def test_variants_job_generates_frames_in_one_call_and_builds_sheet(tmp_path, monkeypatch):
+    jobs_dir = str(tmp_path / "jobs")
+    calls: list[dict] = []
+
+    def fake_generate_images(prompts, output_files, **kwargs):
+        calls.append({"prompts": list(prompts), "seeds": kwargs["seeds"]})
+        for i, path in enumerate(output_files):
+            Image.new("RGB", (32, 32), (i * 60, 0, 0)).save(path)
+        return [None] * len(prompts)
+
+    monkeypatch.setattr(image_jobs, "generate_images", fake_generate_images)
+    job = ImageJobInfo.new_variants("knight", 32, [3, 4, 5])
+    other = ImageJobInfo.new_variants("knight", 32, [3, 4, 6])
+    assert _batch_key(job) != _batch_key(other)
+    assert _request_key(job) != _request_key(other)
+    os.makedirs(os.path.join(jobs_dir, job.job_id))
+    job.save(os.path.join(jobs_dir, job.job_id, "job.json"))
+    q: queue.Queue[str | None] = queue.Queue()
+    q.put(job.job_id)
+    q.put(None)
+
+    _worker_main(q, jobs_dir, threading.Event(), WorkerConfig(batch_window=0.1))
+
+    assert calls == [{"prompts": ["knight"] * 3, "seeds": [3, 4, 5]}]
+    finished = ImageJobInfo.load(os.path.join(jobs_dir, job.job_id, "job.json"))
+    assert finished.status == JobStatus.finished
+    assert finished.atlas is not None and finished.atlas["meta"]["size"] == {"w": 64, "h": 64}
+    job_dir = os.path.join(jobs_dir, job.job_id)
+    with Image.open(os.path.join(job_dir, SHEET_FILE)) as sheet:
+        assert sheet.size == (64, 64)
+        assert sheet.getpixel((32, 0))[:3] == (60, 0, 0)
+        assert sheet.getpixel((32, 32))[3] == 0
+
+    # 生成済みのスプライトシートだけからフレームとアトラスを作り直せる
+    reused_dir = str(tmp_path / "reused")
+    os.makedirs(reused_dir)
+    shutil.copy(os.path.join(job_dir, SHEET_FILE), os.path.join(reused_dir, SHEET_FILE))
+    assert split_sprite_sheet(reused_dir, [3, 4, 5]) == finished.atlas
+    with Image.open(os.path.join(reused_dir, "frames", "frame_002.png")) as frame:
+        assert frame.getpixel((0, 0))[:3] == (120, 0, 0)
+
+    written = export_sprite_sheet(job_dir, str(tmp_path / "out" / "knight.png"))
+    assert len(written) == 5
+    with open(tmp_path / "out" / "knight.json", encoding="utf-8") as f:
+        exported = json.load(f)
+    assert exported["meta"]["image"] == "knight.png"
+    assert os.path.isfile(tmp_path / "out" / "knight_frames" / "frame_000.png")
+    assert os.path.isfile(os.path.join(job_dir, ATLAS_FILE))
+
+
+def test_variants_are_split_to_fit_memory_budget(tmp_path, monkeypatch):
+    calls: list[list[int]] = []
+    progress: list[tuple[int, int]] = []
+
+    def fake_generate_images(prompts, output_files, **kwargs):
+        calls.append(kwargs["seeds"])
+        for step in (1, 2):
+            kwargs["progress"](step, 2)
+        for path in output_files:
+            Image.new("RGB", (32, 32)).save(path)
+        return [None] * len(prompts)
+
+    monkeypatch.setattr(image_jobs, "generate_images", fake_generate_images)
+    mgr = ImageJobManager.__new__(ImageJobManager)
+    size = MODEL_IDS["s1"].pixel_art.generation_size(128)
+    mgr.worker_config = WorkerConfig(memory_budget_bytes=plan_memory(MODEL_IDS["s1"], size, size, 2).peak_bytes)
+    job = ImageJobInfo.new_variants("knight", 128, [1, 2, 3, 4, 5], model="s1")
+    mgr._admit_variants(job)
+    assert job.frames_per_call == 2
+    mgr.worker_config = WorkerConfig(memory_budget_bytes=1 << 20)
+    with pytest.raises(ValueError):
+        mgr._admit_variants(ImageJobInfo.new_variants("knight", 128, [1, 2], model="s1"))
+
+    os.makedirs(tmp_path / job.job_id)
+    assert _run_variants(str(tmp_path), job.job_id, job, None, None, lambda step, total: progress.append((step, total)), None, None, 0, {}) == [None]  # type: ignore[arg-type]
+    # 2枚ずつ3回に分けても、プロンプトは同じで進捗は全体で1つになる
+    assert calls == [[1, 2], [3, 4], [5]]
+    assert progress == [(1, 6), (2, 6), (3, 6), (4, 6), (5, 6), (6, 6)]
+    assert job.atlas is not None and len(job.atlas["frames"]) == 5
@@ -0,0 +1,65 @@
+import asyncio
+import os
+import shutil
+import time
+
+import pytest
+
+from pixelart_mcp.image_jobs import ImageJobManager, JobStatus, WorkerConfig
+
+TEST_IMAGE_DIR = "./tmp/WaitForJobDir"
+
+
+@pytest.fixture
+def clean_test_dir():
+    if os.path.isdir(TEST_IMAGE_DIR):
+        shutil.rmtree(TEST_IMAGE_DIR)
+    yield
+    if os.path.isdir(TEST_IMAGE_DIR):
+        shutil.rmtree(TEST_IMAGE_DIR)
+
+
+def test_wait_for_job_wakes_on_done_and_cancel(clean_test_dir):
+    mgr = ImageJobManager(image_dir=TEST_IMAGE_DIR, worker_config=WorkerConfig(batch_window=0.0))
+    try:
+        running = mgr.submit_image_job("debug", 64, 64)
+        queued = mgr.submit_image_job("debug", 128, 128)
+        # 時間切れなら待ち始めた時の状態のまま返す
+        assert mgr.wait_for_job(running.job_id, timeout=0.1).status in (JobStatus.not_start, JobStatus.running)
+
+        t0 = time.monotonic()
+        mgr.cancel_job(queued.job_id)
+        assert mgr.wait_for_job(queued.job_id, timeout=5).status == JobStatus.canceled
+        assert time.monotonic() - t0 < 1.0
+
+        # 初回のジョブはワーカーでのtorchの読み込みを含む
+        assert mgr.wait_for_job(running.job_id, timeout=60).status == JobStatus.finished
+        assert not mgr._watchers
+    finally:
+        mgr.shutdown()
+
+
+def test_wait_for_job_tool_does_not_block_other_tools(clean_test_dir):
+    from mcp.shared.memory import create_connected_server_and_client_session
+
+    from pixelart_mcp.image_mcp import create_mcp
+
+    mcp = create_mcp(WorkerConfig(batch_window=0.0), image_dir=TEST_IMAGE_DIR)
+
+    async def run() -> tuple[dict, list[float]]:
+        async with create_connected_server_and_client_session(mcp) as client:
+            submitted = await client.call_tool("generate_image_tool", {"prompt": "debug", "width": 64, "height": 64})
+            job_id = submitted.structuredContent["job_id"]["job_id"]
+            waiter = asyncio.create_task(client.call_tool("wait_for_job_tool", {"job_id": job_id, "timeout": 60}))
+            latencies: list[float] = []
+            while not waiter.done():
+                t0 = time.monotonic()
+                await client.call_tool("list_jobs_tool", {})
+                latencies.append(time.monotonic() - t0)
+                await asyncio.sleep(0.1)
+            return (await waiter).structuredContent, latencies
+
+    job, latencies = asyncio.run(run())
+    assert job["status"] == JobStatus.finished.value
+    # 待っている間も他のツールはすぐに応答する
+    assert latencies and max(latencies) < 1.0
@@ -0,0 +1,57 @@
+import os
+import queue
+import threading
+from collections import deque
+
+from pixelart_mcp import image_jobs
+from pixelart_mcp.image_jobs import ImageJobInfo, JobStatus, WorkerConfig, _collect_batch, _worker_main
+
+
+def _make_job(jobs_dir, job_info: ImageJobInfo) -> str:
+    job_dir = os.path.join(jobs_dir, job_info.job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    job_info.save(os.path.join(job_dir, "job.json"))
+    return job_info.job_id
+
+
+def test_collect_batch_groups_compatible_jobs(tmp_path):
+    jobs_dir = str(tmp_path)
+    first = ImageJobInfo.new_image("a", 64, 64)
+    same = ImageJobInfo.new_image("b", 64, 64)
+    other_size = ImageJobInfo.new_image("c", 128, 64)
+    pixel = ImageJobInfo.new_pixelart("d", 32)
+    q: queue.Queue[str | None] = queue.Queue()
+    for job in (same, other_size, pixel):
+        q.put(_make_job(jobs_dir, job))
+    pending: deque = deque()
+
+    batch, stop = _collect_batch(q, jobs_dir, (first.job_id, first), pending, WorkerConfig(max_batch_size=4, batch_window=0.2))
+
+    assert not stop
+    assert [job_id for job_id, _ in batch] == [first.job_id, same.job_id]
+    assert [job_id for job_id, _ in pending] == [other_size.job_id, pixel.job_id]
+
+
+def test_worker_isolates_failed_job_in_batch(tmp_path, monkeypatch):
+    jobs_dir = str(tmp_path)
+    calls: list[list[str]] = []
+
+    def fake_generate_images(prompts, output_files, **kwargs):
+        calls.append(list(prompts))
+        if "bad" in prompts:
+            return ["boom"] * len(prompts)
+        return [None] * len(prompts)
+
+    monkeypatch.setattr(image_jobs, "generate_images", fake_generate_images)
+    jobs = [ImageJobInfo.new_image(p, 64, 64) for p in ("good1", "bad", "good2")]
+    q: queue.Queue[str | None] = queue.Queue()
+    for job in jobs:
+        q.put(_make_job(jobs_dir, job))
+    q.put(None)
+
+    _worker_main(q, jobs_dir, threading.Event(), WorkerConfig(max_batch_size=4, batch_window=0.1))
+
+    assert calls[0] == ["good1", "bad", "good2"]
+    assert calls[1:] == [["good1"], ["bad"], ["good2"]]
+    statuses = [ImageJobInfo.load(os.path.join(jobs_dir, job.job_id, "job.json")).status for job in jobs]
+    assert statuses == [JobStatus.finished, JobStatus.failed, JobStatus.finished]
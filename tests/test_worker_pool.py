@@ -0,0 +1,161 @@
+import os
+import shutil
+import threading
+import time
+
+import pytest
+
+from pixelart_mcp.image_jobs import ImageJobManager, JobStatus, WorkerConfig, _QueuedJob, _WorkerHandle
+from pixelart_mcp.job_scheduler import JobScheduler
+from pixelart_mcp.retention import RetentionPolicy
+
+TEST_IMAGE_DIR = "./tmp/WorkerPoolDir"
+
+
+class AliveProcess:
+    pid = None
+
+    def is_alive(self):
+        return True
+
+
+class ListQueue(list):
+    def put(self, item):
+        self.append(item)
+
+
+def _manager_with_workers(*loaded_models: list[str]) -> ImageJobManager:
+    mgr = ImageJobManager.__new__(ImageJobManager)
+    mgr.worker_config = WorkerConfig(num_workers=len(loaded_models))
+    mgr._pending = []
+    mgr._scheduler = JobScheduler(mgr.worker_config.scheduling)
+    mgr._dispatched = {}
+    mgr._lock = threading.Lock()
+    mgr._workers = [
+        _WorkerHandle(i, AliveProcess(), ListQueue(), None, loaded_models=list(models))  # type: ignore[arg-type]
+        for i, models in enumerate(loaded_models)
+    ]
+    return mgr
+
+
+@pytest.fixture
+def clean_test_dir():
+    if os.path.isdir(TEST_IMAGE_DIR):
+        shutil.rmtree(TEST_IMAGE_DIR)
+    yield
+    if os.path.isdir(TEST_IMAGE_DIR):
+        shutil.rmtree(TEST_IMAGE_DIR)
+
+
+def test_dispatch_prefers_worker_with_model_loaded():
+    mgr = _manager_with_workers([], ["p1"], ["s2"])
+    mgr._pending = [
+        _QueuedJob("job-s2", "s2", ("s2", 64, 64)),
+        _QueuedJob("job-p1", "p1", ("p1", "pixel", 32)),
+        _QueuedJob("job-s1", "s1", ("s1", 64, 64)),
+    ]
+    mgr._dispatch()
+    assert mgr._workers[2].job_queue == ["job-s2"]
+    assert mgr._workers[1].job_queue == ["job-p1"]
+    assert mgr._workers[0].job_queue == ["job-s1"]
+    assert mgr._pending == []
+
+
+def test_dispatch_joins_batch_not_yet_started():
+    mgr = _manager_with_workers(["s2"], [])
+    mgr._pending = [_QueuedJob(f"job{i}", "s2", ("s2", 64, 64)) for i in range(3)]
+    mgr._dispatch()
+    # 開始前のバッチに同条件のジョブが相乗りする
+    assert mgr._workers[0].job_queue == ["job0", "job1", "job2"]
+    assert mgr._workers[1].job_queue == []
+
+
+def test_pool_runs_jobs_in_parallel(clean_test_dir):
+    mgr = ImageJobManager(image_dir=TEST_IMAGE_DIR, worker_config=WorkerConfig(num_workers=2, batch_window=0.0))
+    try:
+        status = mgr.get_pool_status()
+        assert [w.busy for w in status.workers] == [False, False]
+        t0 = time.monotonic()
+        # サイズが異なるのでバッチにはまとまらず、別々のワーカーで並列に実行される
+        jobs = [mgr.submit_image_job("debug", 64, 64), mgr.submit_image_job("debug", 128, 128)]
+        status = mgr.get_pool_status()
+        assert all(w.busy for w in status.workers)
+        assert all(w.torch_threads for w in status.workers)
+        for _ in range(40):
+            infos = [mgr.get_job(job.job_id) for job in jobs]
+            if all(info.status == JobStatus.finished for info in infos):
+                break
+            time.sleep(0.25)
+        assert [info.status for info in infos] == [JobStatus.finished, JobStatus.finished]
+        assert time.monotonic() - t0 < 5.5
+    finally:
+        mgr.shutdown()
+
+
+def test_dead_worker_fails_running_job_and_is_restarted(clean_test_dir):
+    mgr = ImageJobManager(image_dir=TEST_IMAGE_DIR, worker_config=WorkerConfig(num_workers=1, batch_window=0.0))
+    try:
+        job = mgr.submit_image_job("debug", 64, 64)
+        deadline = time.monotonic() + 30
+        while mgr.get_job(job.job_id).status != JobStatus.running and time.monotonic() < deadline:
+            time.sleep(0.05)
+        old_pid = mgr._workers[0].process.pid
+        mgr._workers[0].process.kill()
+        failed = mgr.wait_for_job(job.job_id, timeout=30)
+        assert failed.status == JobStatus.failed and failed.error
+        assert mgr._dispatched == {}
+        # 起動し直したワーカーで次のジョブが動く
+        retry = mgr.submit_image_job("debug", 64, 64, seed=1)
+        assert mgr.wait_for_job(retry.job_id, timeout=30).status == JobStatus.finished
+        assert mgr._workers[0].process.pid != old_pid
+    finally:
+        mgr.shutdown()
+
+
+def test_worker_restarted_while_manager_threads_run_completes_job(clean_test_dir):
+    # 保持ポリシーのスレッドを絶えず動かし、ジャーナルのfsyncスレッドも動いている間にワーカーを起動し直す
+    config = WorkerConfig(num_workers=1, batch_window=0.0, retention=RetentionPolicy(max_age_days=365, interval=0.01))
+    mgr = ImageJobManager(image_dir=TEST_IMAGE_DIR, worker_config=config)
+    try:
+        assert mgr._gc_thread.is_alive() and mgr._journal._sync_thread is not None and mgr._journal._sync_thread.is_alive()
+        old = mgr._workers[0].process
+        old.kill()
+        deadline = time.monotonic() + 30
+        while mgr._workers[0].process is old and time.monotonic() < deadline:
+            time.sleep(0.05)
+        # forkでは他のスレッドが持つロックやSQLiteの接続を引き継ぐので、spawnで起動する
+        assert mgr._workers[0].process is not old and type(mgr._workers[0].process).__name__ == "SpawnProcess"
+        job = mgr.submit_image_job("debug", 64, 64, seed=2)
+        assert mgr.wait_for_job(job.job_id, timeout=60).status == JobStatus.finished
+    finally:
+        mgr.shutdown()
+
+
+def test_dispatch_skips_warming_worker():
+    mgr = _manager_with_workers(["s2"], [])
+    mgr._workers[0].warming = True
+    mgr._pending = [_QueuedJob("job-s2", "s2", ("s2", 64, 64))]
+    mgr._dispatch()
+    assert mgr._workers[0].job_queue == []
+    assert mgr._workers[1].job_queue == ["job-s2"]
+
+
+def test_preload_warms_models_before_ready(clean_test_dir, tmp_path):
+    from benchmarks.tiny_pipeline import register_tiny_model
+
+    register_tiny_model("tiny-warm", str(tmp_path / "model"))
+    config = WorkerConfig(preload_models=["tiny-warm", "no-such-model"])
+    mgr = ImageJobManager(image_dir=TEST_IMAGE_DIR, worker_config=config)
+    try:
+        for _ in range(120):
+            health = mgr.get_health()
+            if health.ready:
+                break
+            time.sleep(0.25)
+        assert health.ready
+        warm = {w.model: w for w in health.workers[0].warm_models}
+        assert warm["tiny-warm"].error is None and warm["tiny-warm"].seconds > 0
+        assert warm["no-such-model"].error is not None
+        assert mgr.get_pool_status().workers[0].loaded_models == ["tiny-warm"]
+    finally:
+        mgr.shutdown()